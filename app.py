@@ -7,6 +7,7 @@ from flask import (
 # ===== Extensões Flask =====
 from flask_migrate import Migrate
 from flask_wtf import CSRFProtect, FlaskForm
+from flask_wtf.csrf import generate_csrf
 from flask import send_file, render_template_string
 from flask import send_file, abort
 
@@ -26,9 +27,11 @@ from werkzeug.utils import secure_filename
 from sqlalchemy import text
 from pathlib import Path
 from functools import wraps
+import multiprocessing
 import os
 import unicodedata
 import shutil
+from itertools import chain
 import traceback
 from pathlib import Path
 from pdf2image import convert_from_path
@@ -53,6 +56,7 @@ import tempfile
 import subprocess
 import fitz
 import json
+import re
 from werkzeug.security import generate_password_hash # Certifique-se de importar isso no topo do seu arquivo
 from flask import current_app
 from sqlalchemy import func
@@ -78,6 +82,43 @@ from artistas_base_utils import atualizar_base_artistas
 # ===== utils =====
 from utils import buscar_nome_artista, atualizar_historico_pagamentos
 
+# ===== services =====
+from services.correspondencia_service import somar_lucro_por_artista, obter_indice_aliases, CasadorTitulos
+from services.tarefas_service import deve_enfileirar, enfileirar_requisicao, informar_progresso, pode_acessar_tarefa
+from services.retroativos_service import normalizar_chave
+from services.painel_service import buscar_calculos_recentes, buscar_top_artistas, contar_calculos
+from services.pagamentos_service import (
+    ITENS_POR_PAGINA,
+    condicoes_historico,
+    consultar_historico,
+    iniciar_varredura_periodica,
+    sincronizar_nomes_pagamentos,
+    varrer_pagamentos,
+)
+from services.calculos_service import (
+    titulo_corresponde,
+    nome_corresponde,
+    converter_lucro,
+    calcular_valores_assisao,
+    preparar_extrato_especial,
+    calcular_especial_artista,
+    calcular_fechamento,
+    salvar_fechamento,
+    serializar_fechamento,
+)
+from services.planilhas_service import (
+    ler_planilha,
+    obter_extrato,
+    iterar_extrato,
+    limpar_cache_extratos,
+    agendar_snapshot,
+    receber_upload,
+    nome_para_upload,
+    publicar_upload,
+    caminho_do_arquivo,
+    remover_snapshot,
+)
+
 # ===== Helpers =====
 from helpers import (
     construir_calculos_disponiveis,
@@ -107,9 +148,10 @@ from models import (
     Usuario,
     Transacao,
     ArtistaInfo,
+    Tarefa,
 )
 
-from retroativos_models import RetroativoCalculado, RetroativoArquivo, RetroativoTitulo, TituloPeriodoValor
+from retroativos_models import RetroativoCalculado, RetroativoArquivo, RetroativoMensal, RetroativoTitulo, TituloPeriodoValor
 
 # ===== forms =====
 from forms import UsuarioForm
@@ -131,6 +173,10 @@ app.config['SECRET_KEY'] = 'supersecretkey'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + str(Path(__file__).parent / 'instance' / 'polymusic.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = os.path.join(os.path.dirname(__file__), 'uploads')
+app.config['CACHE_EXTRATOS_MB'] = 512  # orçamento de memória do cache de planilhas já lidas
+app.config['STREAMING_EXTRATO_MB'] = 50  # acima disso a planilha é agregada em lotes
+app.config['WORKERS_CALCULO'] = min(2, os.cpu_count() or 1)  # processos do pool do fechamento em lote (1 desliga)
+app.config['INTERVALO_VARREDURA_PAGAMENTOS'] = 300  # segundos entre varreduras de status (0 desliga)
 
 # Caminho absoluto para garantir que funcione independente do diretório atual
 # DB de retroativos via bind
@@ -144,23 +190,46 @@ db.init_app(app)
 migrate = Migrate(app, db)
 csrf = CSRFProtect(app)
 
+# Processos filhos (pool do fechamento em lote) reimportam o script principal no Windows e
+# não devem repetir a inicialização dos bancos
+PROCESSO_PRINCIPAL = multiprocessing.parent_process() is None
+
 # ===== Inicialização do banco de retroativos =====
-with app.app_context():
+if PROCESSO_PRINCIPAL:
+    with app.app_context():
+
+        from retroativos_models import RetroativoCalculado, RetroativoArquivo, atualizar_esquema_retroativos
+        from services.retroativos_service import (
+            garantir_resumo_mensal,
+            normalizar_retroativos_existentes,
+            precisa_normalizar,
+        )
 
-    from retroativos_models import RetroativoCalculado, RetroativoArquivo
+        os.makedirs(app.instance_path, exist_ok=True)
 
-    os.makedirs(app.instance_path, exist_ok=True)
+        if not retroativos_db_path.exists():
+            print("Criando banco de dados de retroativos…")
+        else:
+            print(" Banco de retroativos já existe, garantindo tabelas…")
 
-    if not retroativos_db_path.exists():
-        print("Criando banco de dados de retroativos…")
-    else:
-        print(" Banco de retroativos já existe, garantindo tabelas…")
+        # Criação das tabelas apenas do bind 'retroativos'
+        engine = db.get_engine(app, bind='retroativos')
+        db.Model.metadata.create_all(bind=engine)
+        adicionadas = atualizar_esquema_retroativos(engine)
+        # A normalização varre a tabela: só bancos que acabaram de ganhar artista_norm/titulo_norm
+        ajustadas = normalizar_retroativos_existentes(engine) if precisa_normalizar(adicionadas) else 0
+        if ajustadas:
+            print(f" Retroativos: {ajustadas} valores normalizados (mês numérico, artista_norm/titulo_norm).")
+        if garantir_resumo_mensal(engine):
+            print(" Resumo mensal de retroativos reconstruído a partir das linhas importadas.")
+
+        print(" Tabelas de retroativos criadas/garantidas com sucesso!")
 
-    # Criação das tabelas apenas do bind 'retroativos'
-    engine = db.get_engine(app, bind='retroativos')
-    db.Model.metadata.create_all(bind=engine)
 
-    print(" Tabelas de retroativos criadas/garantidas com sucesso!")
+@app.before_request
+def garantir_varredura_pagamentos():
+    # A thread sobe na primeira requisição, não no import (scripts também importam o app)
+    iniciar_varredura_periodica(app)
 
 # 4. Formulário de Login
 class LoginForm(FlaskForm):
@@ -184,52 +253,53 @@ def login():
 
 
 # 4. Criação e verificação
-with app.app_context():
-    db_path = Path(app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', ''))
-
-    if not db_path.exists():
-        print("Criando banco de dados...")
-        os.makedirs(db_path.parent, exist_ok=True)
-        db.create_all()
-        print(" Banco de dados criado com sucesso!")
-    else:
-        print(" Banco de dados já existe")
-        # db.create_all() # Removido: db.create_all() dentro do else pode causar problemas com migrações
-                          # Ele tenta criar tabelas que já existem. Use Alembic para atualizações.
-
-    #  IMPORTANTE: A verificação/criação manual da tabela 'usuario' não é recomendada
-    # quando se usa Flask-Migrate. O Flask-Migrate (Alembic) gerencia a criação
-    # e atualização de tabelas. Se você excluiu o DB e vai usar 'flask db upgrade',
-    # a tabela será criada pela migração. Se você *não* vai usar migrações, então db.create_all()
-    # logo acima é o suficiente para criar todas as tabelas.
-    # Vou comentar esta seção para priorizar o fluxo do Alembic.
-    # if 'usuario' not in db.inspect(db.engine).get_table_names():
-    #     print(" Tabela 'usuario' não existe, criando manualmente...")
-    #     Usuario.__table__.create(db.engine)
+if PROCESSO_PRINCIPAL:
+    with app.app_context():
+        db_path = Path(app.config['SQLALCHEMY_DATABASE_URI'].replace('sqlite:///', ''))
+
+        if not db_path.exists():
+            print("Criando banco de dados...")
+            os.makedirs(db_path.parent, exist_ok=True)
+            db.create_all()
+            print(" Banco de dados criado com sucesso!")
+        else:
+            print(" Banco de dados já existe")
+            # db.create_all() # Removido: db.create_all() dentro do else pode causar problemas com migrações
+                              # Ele tenta criar tabelas que já existem. Use Alembic para atualizações.
+
+        #  IMPORTANTE: A verificação/criação manual da tabela 'usuario' não é recomendada
+        # quando se usa Flask-Migrate. O Flask-Migrate (Alembic) gerencia a criação
+        # e atualização de tabelas. Se você excluiu o DB e vai usar 'flask db upgrade',
+        # a tabela será criada pela migração. Se você *não* vai usar migrações, então db.create_all()
+        # logo acima é o suficiente para criar todas as tabelas.
+        # Vou comentar esta seção para priorizar o fluxo do Alembic.
+        # if 'usuario' not in db.inspect(db.engine).get_table_names():
+        #     print(" Tabela 'usuario' não existe, criando manualmente...")
+        #     Usuario.__table__.create(db.engine)
 
-    try:
-        db.session.execute(text("SELECT 1"))
-        print(" Conexão testada com sucesso")
-    except Exception as e:
-        print(f" Falha na conexão: {e}")
+        try:
+            db.session.execute(text("SELECT 1"))
+            print(" Conexão testada com sucesso")
+        except Exception as e:
+            print(f" Falha na conexão: {e}")
 
-    try:
-        # Certifique-se de que generate_password_hash está importado (ex: from werkzeug.security import generate_password_hash)
-        if not Usuario.query.filter_by(username='admin').first():
-            admin = Usuario(
-                username='admin',
-                senha=generate_password_hash('1234'), # CORRIGIDO: usa 'senha'
-                funcao='admin',                     # CORRIGIDO: usa 'funcao'
-                nome='Administrador',               # ADICIONADO: campo NOT NULL
-                email='admin@seusite.com'           # ADICIONADO: campo NOT NULL e UNIQUE
-            )
-            db.session.add(admin)
-            db.session.commit()
-            print(" Usuário admin criado com sucesso!")
-        else:
-            print(" Usuário admin já existe.")
-    except Exception as e:
-        print(" Erro ao verificar/criar admin:", e)
+        try:
+            # Certifique-se de que generate_password_hash está importado (ex: from werkzeug.security import generate_password_hash)
+            if not Usuario.query.filter_by(username='admin').first():
+                admin = Usuario(
+                    username='admin',
+                    senha=generate_password_hash('1234'), # CORRIGIDO: usa 'senha'
+                    funcao='admin',                     # CORRIGIDO: usa 'funcao'
+                    nome='Administrador',               # ADICIONADO: campo NOT NULL
+                    email='admin@seusite.com'           # ADICIONADO: campo NOT NULL e UNIQUE
+                )
+                db.session.add(admin)
+                db.session.commit()
+                print(" Usuário admin criado com sucesso!")
+            else:
+                print(" Usuário admin já existe.")
+        except Exception as e:
+            print(" Erro ao verificar/criar admin:", e)
 
 
 ALLOWED_EXTENSIONS = {'.xlsx', '.xls', '.csv'}
@@ -257,19 +327,7 @@ def fuzzy_match(a, b):
     return token_sort_ratio(normalizar_string(a), normalizar_string(b))
 
 def carregar_planilha(caminho):
-    import pandas as pd
-    ext = os.path.splitext(caminho)[1].lower()
-
-    if ext == '.csv':
-        try:
-            return pd.read_csv(caminho, sep=None, engine='python', encoding='utf-8', on_bad_lines='skip')
-        except Exception:
-            # tenta com outro encoding
-            return pd.read_csv(caminho, sep=None, engine='python', encoding='latin1', on_bad_lines='skip')
-    elif ext in ['.xls', '.xlsx']:
-        return pd.read_excel(caminho)
-    else:
-        raise Exception("Formato de arquivo não suportado. Use XLSX, XLS ou CSV.")
+    return ler_planilha(caminho)
 
 def normalizar_texto(texto):
     if not isinstance(texto, str):
@@ -294,35 +352,6 @@ def remover_acentos(texto):
         if not unicodedata.combining(c)
     )
 
-def titulo_corresponde(titulo_planilha, titulo_cadastrado):
-    titulo1 = normalizar_texto(titulo_planilha)
-    titulo2 = normalizar_texto(titulo_cadastrado)
-    return fuzz.token_sort_ratio(titulo1, titulo2) >= 90
-
-def nome_corresponde(nome_planilha, artista_obj):
-    nome_planilha = normalizar_texto(nome_planilha)
-    nomes_validos = [normalizar_texto(artista_obj.nome)] + artista_obj.obter_variacoes()
-
-    for nome_valid in nomes_validos:
-        nome_cad = normalizar_texto(nome_valid)
-        if nome_planilha == nome_cad:
-            return True
-        if nome_cad in nome_planilha or nome_planilha in nome_cad:
-            return True
-        partes_plan = nome_planilha.split()
-        partes_cad = nome_cad.split()
-        if all(any(fuzz.ratio(p_cad, p_plan) >= 85 for p_plan in partes_plan) for p_cad in partes_cad):
-            return True
-        if fuzz.token_sort_ratio(nome_planilha, nome_cad) >= 90:
-            return True
-    return False
-
-def converter_lucro(valor):
-    try:
-        return Decimal(str(valor).replace(",", ".")).quantize(Decimal("0.00000000000001"))
-    except:
-        return Decimal("0.00000000000000")
-
 def calcular_valores_especiais(df, titulos_dict, cotacao_valor, limiar_fuzzy=90):
     """
     Calcula os valores com fuzzy matching nos títulos (≥ 90% de similaridade).
@@ -354,7 +383,10 @@ def calcular_valores_especiais(df, titulos_dict, cotacao_valor, limiar_fuzzy=90)
 
     print("\n COMPARAÇÃO FUZZY ENTRE TÍTULOS CADASTRADOS E PLANILHA:")
 
-    for titulo_original, percentual in titulos_dict.items():
+    casador = CasadorTitulos(df['titulo_normalizado'], df['lucro'])
+    matriz = casador.similaridades([normalizar_texto(titulo) for titulo in titulos_dict], limiar=limiar_fuzzy)
+
+    for notas, (titulo_original, percentual) in zip(matriz, titulos_dict.items()):
         titulo_cad_norm = normalizar_texto(titulo_original)
 
         try:
@@ -366,32 +398,31 @@ def calcular_valores_especiais(df, titulos_dict, cotacao_valor, limiar_fuzzy=90)
             continue
 
         match_encontrado = False
-        for titulo_plan in df['titulo_normalizado'].unique():
-            similaridade = fuzz.token_sort_ratio(titulo_cad_norm, titulo_plan)
-            if similaridade >= limiar_fuzzy:
-                linhas = df[df['titulo_normalizado'] == titulo_plan]
-                # Soma com precisão de 4 casas decimais
-                lucro_total = linhas['lucro'].sum().quantize(Decimal('0.0001'))
-                # Cálculo com arredondamento preciso
-                valor_aplicado = (lucro_total * (percentual_decimal / Decimal('100'))).quantize(Decimal('0.0001'))
-                total_eur += valor_aplicado
-                usados.append(titulo_plan)
-                match_encontrado = True
-                
-                # Registro detalhado para verificação
-                matches.append({
-                    'cadastrado': titulo_original,
-                    'planilha': titulo_plan,
-                    'similaridade': similaridade,
-                    'lucro_total': lucro_total,
-                    'percentual': percentual_decimal,
-                    'valor_aplicado': valor_aplicado
-                })
-                
-                print(f"[MATCH] '{titulo_cad_norm}' ≈ '{titulo_plan}' ({similaridade}%) | " +
-                      f"Lucro: €{lucro_total} | %: {percentual_decimal} | " +
-                      f"Subtotal: €{valor_aplicado}")
-                break
+        for posicao in casador.casados(notas, limiar=limiar_fuzzy)[:1]:
+            titulo_plan = casador.titulos[posicao]
+            similaridade = float(notas[posicao])
+            # Soma com precisão de 4 casas decimais
+            lucro_total = casador.somas[posicao].quantize(Decimal('0.0001'))
+            # Cálculo com arredondamento preciso
+            valor_aplicado = (lucro_total * (percentual_decimal / Decimal('100'))).quantize(Decimal('0.0001'))
+            total_eur += valor_aplicado
+            usados.append(titulo_plan)
+            match_encontrado = True
+            
+            # Registro detalhado para verificação
+            matches.append({
+                'cadastrado': titulo_original,
+                'planilha': titulo_plan,
+                'similaridade': similaridade,
+                'lucro_total': lucro_total,
+                'percentual': percentual_decimal,
+                'valor_aplicado': valor_aplicado
+            })
+            
+            print(f"[MATCH] '{titulo_cad_norm}' ≈ '{titulo_plan}' ({similaridade}%) | " +
+                  f"Lucro: €{lucro_total} | %: {percentual_decimal} | " +
+                  f"Subtotal: €{valor_aplicado}")
+            break
 
         if not match_encontrado:
             print(f"[IGNORADO] '{titulo_cad_norm}' não encontrou match ≥ {limiar_fuzzy}%")
@@ -410,47 +441,6 @@ def calcular_valores_especiais(df, titulos_dict, cotacao_valor, limiar_fuzzy=90)
     
     return total_eur_final, total_brl
 
-def calcular_valores_assisao(df_original, artista_obj, titulos_dict, cotacao_valor):
-    df = df_original.copy()
-    df['nome_artista_normalizado'] = df['nome_artista_normalizado'].astype(str).apply(normalizar_texto)
-    df['titulo_normalizado'] = df['titulo_normalizado'].astype(str).apply(normalizar_texto)
-    df['lucro'] = df['lucro'].apply(converter_lucro)
-
-    # Filtra somente os nomes do artista (com variações)
-    df_filtrado = df[df['nome_artista_normalizado'].apply(lambda nome: nome_corresponde(nome, artista_obj))].copy()
-
-    resultados = []
-
-    for titulo_original, percentual in titulos_dict.items():
-        percentual_str = str(percentual).replace('%', '').replace(',', '.').strip()
-
-        try:
-            percentual_decimal = Decimal(percentual_str)
-        except:
-            continue
-
-        for titulo_plan in df_filtrado['titulo_normalizado'].unique():
-            if titulo_corresponde(titulo_plan, titulo_original):
-                linhas = df_filtrado[df_filtrado['titulo_normalizado'] == titulo_plan]
-                lucro_total = linhas['lucro'].sum().quantize(Decimal('0.00000000000001'))
-                valor_aplicado = (lucro_total * percentual_decimal / Decimal('100')).quantize(Decimal('0.00000000000001'))
-                valor_brl = (valor_aplicado * Decimal(str(cotacao_valor))).quantize(Decimal('0.01'))
-
-                resultados.append({
-                    'titulo': titulo_original,
-                    'valor_eur': valor_aplicado,
-                    'valor_brl': valor_brl,
-                    'lucro_total': lucro_total,
-                    'percentual': percentual_decimal,
-                    'match': titulo_plan
-                })
-                break  # para evitar múltiplas contagens do mesmo título
-
-    total_eur = sum([r['valor_eur'] for r in resultados]).quantize(Decimal('0.0001'))
-    total_brl = (total_eur * Decimal(str(cotacao_valor))).quantize(Decimal('0.01'))
-
-    return total_eur, total_brl, resultados
-
 def normalizar_texto(texto):
     """
     Normaliza texto para comparação fuzzy
@@ -574,26 +564,6 @@ def formatar_data(data_iso):
         return f"{partes[2]}/{partes[1]}/{partes[0]}"
     return data_iso
 
-def atualizar_historico_pagamentos():
-    tz_brasil = pytz.timezone('America/Sao_Paulo')
-    hoje = datetime.now(tz_brasil).date()
-
-    pagamentos = PagamentoRealizado.query.all()
-    atualizados = 0
-
-    for p in pagamentos:
-        # Atualiza nome do artista (opcional)
-        p.artista_nome = buscar_nome_artista(p.artista_id, p.tabela_artista) or "Artista não identificado"
-
-        # Atualiza status se vencimento passou e status ainda não é pago
-        if p.vencimento and p.vencimento <= hoje and p.status.lower() != 'pago':
-            p.status = 'pago'
-            p.data_pagamento = hoje
-            atualizados += 1
-
-    db.session.commit()
-    return atualizados
-
 @app.route('/usuarios')
 def listar_usuarios():
     usuarios = Usuario.query.order_by(Usuario.data_criacao.desc()).all()
@@ -672,49 +642,10 @@ def inicio():
             'assisao': ArtistaEspecial.query.filter_by(tipo='assisao').count()
         }
 
-        # Cálculos unificados
-        todos_calculos_processados = list(construir_calculos_disponiveis())
-
-        # Top 5 artistas por royalties
-        royalties_por_artista = defaultdict(float)
-        for calc in todos_calculos_processados:
-            if isinstance(calc, dict) and calc.get('artista') and calc.get('valor_brl') is not None:
-                try:
-                    royalties_por_artista[calc['artista']] += float(calc['valor_brl'] or 0)
-                except (TypeError, ValueError):
-                    royalties_por_artista[calc['artista']] += 0.0
-
-        top_artistas_royalties = sorted(
-            [{'artista': nome, 'total_brl': valor} for nome, valor in royalties_por_artista.items()],
-            key=lambda x: x['total_brl'],
-            reverse=True
-        )[:5]
-
-        # Cálculos recentes
-        calculos_recentes = []
-        for calc in sorted(
-            [c for c in todos_calculos_processados if isinstance(c, dict) and c.get('data_calculo')],
-            key=lambda x: x['data_calculo'],
-            reverse=True
-        )[:5]:
-            calc_serializado = {}
-            for k, v in calc.items():
-                if v is None:
-                    calc_serializado[k] = None
-                elif isinstance(v, datetime):
-                    calc_serializado[k] = v.strftime('%d/%m/%Y')
-                elif isinstance(v, (int, float)):
-                    calc_serializado[k] = v
-                else:
-                    calc_serializado[k] = str(v)
-            calculos_recentes.append(calc_serializado)
-
-        # Distribuição por tipo
-        distribuicao_calculos = {
-            'normais': sum(1 for c in todos_calculos_processados if c.get('tipo') == 'normal'),
-            'especiais': sum(1 for c in todos_calculos_processados if c.get('tipo') == 'especial'),
-            'assisao': sum(1 for c in todos_calculos_processados if c.get('tipo') == 'assisao')
-        }
+        # Top 5, recentes e contagens agregados no banco (services/painel_service.py)
+        top_artistas_royalties = buscar_top_artistas()
+        calculos_recentes = buscar_calculos_recentes()
+        distribuicao_calculos = contar_calculos()
 
         # Totais financeiros
         def calcular_totais_gerais():
@@ -750,7 +681,7 @@ def inicio():
             'distribuicao_calculos': distribuicao_calculos,
             'valor_total_eur': round(totais_gerais['eur'], 4),
             'valor_total_brl': round(totais_gerais['brl'], 2),
-            'total_calculos': len(todos_calculos_processados),
+            'total_calculos': sum(distribuicao_calculos.values()),
             'data_ultima_atualizacao': datetime.now().strftime('%d/%m/%Y %H:%M')
         })
 
@@ -848,19 +779,55 @@ def upload():
             flash('Formato de arquivo inválido.', 'danger')
             return redirect(request.url)
 
-        if len(file.read()) > 150 * 1024 * 1024:
+        # Grava em blocos contando bytes: nada de carregar o arquivo inteiro para medir
+        try:
+            temporario, _, conteudo_hash = receber_upload(file, app.config['UPLOAD_FOLDER'], 150 * 1024 * 1024)
+        except ValueError:
             flash('Arquivo excede o limite de 150MB.', 'danger')
             return redirect(request.url)
 
-        file.seek(0)  # volta ao início
+        # Mesmo conteúdo já importado (ainda que com outro nome): reaproveita o registro existente
+        existente = ArquivoImportado.query.filter_by(hash_conteudo=conteudo_hash).first()
+        if existente and os.path.exists(caminho_do_arquivo(existente)):
+            os.remove(temporario)
+            flash(f'Este conteúdo já foi importado como "{existente.nome_arquivo}" '
+                  f'em {existente.data_upload.strftime("%d/%m/%Y %H:%M")}. '
+                  'Use esse arquivo nos cálculos.', 'info')
+            return redirect(url_for('upload'))
+
+        # Nome já usado por outro conteúdo: grava com sufixo do hash em vez de sobrescrever
+        filename = nome_para_upload(
+            app.config['UPLOAD_FOLDER'], filename, conteudo_hash,
+            lambda nome: ArquivoImportado.query.filter(
+                ArquivoImportado.nome_arquivo == nome,
+                ArquivoImportado.id != (existente.id if existente else None),
+            ).first() is not None)
         path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(path)
+        publicar_upload(temporario, path, conteudo_hash)
+
+        if existente:
+            # Registro do mesmo conteúdo cujo arquivo sumiu: aponta para o novo em vez de
+            # duplicar o hash (os cálculos que o referenciam continuam valendo)
+            remover_snapshot(caminho_do_arquivo(existente), existente.snapshot_caminho)
+            limpar_cache_extratos(existente.id)
+            registro = existente
+            registro.nome_arquivo = filename
+            registro.caminho = path
+            registro.data_upload = datetime.utcnow()
+            registro.total_linhas = registro.colunas_detectadas = registro.tempo_leitura = None
+        else:
+            registro = ArquivoImportado(
+                nome_arquivo=filename,
+                caminho=path,  #  ESSENCIAL: salva o caminho real do arquivo
+                hash_conteudo=conteudo_hash
+            )
+            db.session.add(registro)
+        db.session.commit()
 
-        registro = ArquivoImportado(
-            nome_arquivo=filename,
-            caminho=path  #  ESSENCIAL: salva o caminho real do arquivo
+        # Conversão para o formato colunar roda em segundo plano; até terminar, lê-se o original
+        registro.snapshot_caminho = agendar_snapshot(
+            path, ao_concluir=lambda metadados, arquivo_id=registro.id: registrar_metadados_arquivo(arquivo_id, metadados)
         )
-        db.session.add(registro)
         db.session.commit()
 
         flash('Arquivo enviado com sucesso.', 'success')
@@ -869,6 +836,17 @@ def upload():
     arquivos = ArquivoImportado.query.order_by(ArquivoImportado.data_upload.desc()).all()
     return render_template('upload.html', arquivos=arquivos)
 
+def registrar_metadados_arquivo(arquivo_id, metadados):
+    """Grava no ArquivoImportado o resultado da leitura feita em segundo plano após o upload."""
+    with app.app_context():
+        arquivo = ArquivoImportado.query.get(arquivo_id)
+        if arquivo is None:
+            return
+        arquivo.total_linhas = metadados['total_linhas']
+        arquivo.colunas_detectadas = json.dumps(metadados['colunas_detectadas'], ensure_ascii=False)
+        arquivo.tempo_leitura = round(metadados['tempo_leitura'], 3)
+        db.session.commit()
+
 @app.route('/upload/excluir/<int:id>')
 def excluir_arquivo(id):
     if 'usuario_id' not in session:
@@ -879,7 +857,9 @@ def excluir_arquivo(id):
 
     if os.path.exists(caminho):
         os.remove(caminho)
+    remover_snapshot(caminho, arquivo.snapshot_caminho)
 
+    limpar_cache_extratos(arquivo.id)
     db.session.delete(arquivo)
     db.session.commit()
     flash('Arquivo excluído com sucesso.', 'success')
@@ -896,6 +876,9 @@ def calcular():
     if 'usuario_id' not in session:
         return redirect(url_for('login'))
 
+    if deve_enfileirar():
+        return enfileirar_requisicao('calcular')
+
     getcontext().prec = 20
     getcontext().rounding = ROUND_HALF_UP
 
@@ -914,43 +897,30 @@ def calcular():
         cotacao = Cotacao.query.get(cotacao_id)
         cotacao_valor = Decimal(str(cotacao.valor))
 
-        planilhas_dataframes = {}
+        informar_progresso(5, "Abrindo planilhas")
+        extratos = []
         for arquivo_id in arquivos_ids:
             arquivo = ArquivoImportado.query.get(arquivo_id)
-            caminho = os.path.join(app.config['UPLOAD_FOLDER'], arquivo.nome_arquivo)
             try:
-                if arquivo.nome_arquivo.endswith(('.xls', '.xlsx')):
-                    df = pd.read_excel(caminho)
-                else:
-                    df = pd.read_csv(caminho, sep=None, engine='python')
-                df.columns = [c.strip() for c in df.columns]
-                planilhas_dataframes[arquivo.nome_arquivo] = df
+                extratos.append(iterar_extrato(arquivo))
             except Exception as e:
                 flash(f"Erro ao abrir a planilha {arquivo.nome_arquivo}: {e}", "danger")
 
-        for artista_id in artistas_ids:
-            artista = Artista.query.get(artista_id)
-            percentual = Decimal(str(artista.percentual).replace(',', '.')) / Decimal("100")
-            total_lucro_eur = Decimal("0.0000")
-
-            nomes_equivalentes = [remover_acentos(n.strip().lower()) for n in artista.nome.split(',') if n.strip()]
-
-            for nome_arquivo, df in planilhas_dataframes.items():
-                for _, row in df.iterrows():
-                    nome_raw = str(row.get("Nome do artista", "")).strip().lower()
-                    nome_artista_planilha = remover_acentos(nome_raw)
+        artistas_selecionados = [Artista.query.get(artista_id) for artista_id in artistas_ids]
 
-                    lucro_raw = str(row.get("Lucro Líquido", "0")).replace(",", ".").replace("€", "").strip()
-                    try:
-                        lucro_liquido = Decimal(lucro_raw).quantize(Decimal('0.00000000000001'))
-                    except (InvalidOperation, ValueError):
-                        continue
+        # Uma única passada por planilha (em lotes nos arquivos grandes): nomes resolvidos
+        # por valor distinto e totais via groupby, acumulados lote a lote
+        informar_progresso(10, "Somando lucros por artista")
+        try:
+            totais_lucro = somar_lucro_por_artista(chain.from_iterable(extratos), artistas_selecionados)
+        except Exception as e:
+            flash(f"Erro ao processar as planilhas: {e}", "danger")
+            artistas_selecionados = []
+        informar_progresso(90, "Montando resultados")
 
-                    for nome_ref in nomes_equivalentes:
-                        score = fuzz.partial_ratio(nome_artista_planilha, nome_ref)
-                        if score >= 88 and nome_ref in nome_artista_planilha:
-                            total_lucro_eur += lucro_liquido
-                            break
+        for artista in artistas_selecionados:
+            percentual = Decimal(str(artista.percentual).replace(',', '.')) / Decimal("100")
+            total_lucro_eur = totais_lucro[artista.id]
 
             valor_eur = (total_lucro_eur * percentual).quantize(Decimal('0.0001'))
             valor_brl = (valor_eur * cotacao_valor).quantize(Decimal('0.01'))
@@ -1108,26 +1078,14 @@ def salvar_calculo():
 
 @app.route('/calculos_especiais', methods=['GET', 'POST'])
 def calculos_especiais():
-    from decimal import Decimal, InvalidOperation, getcontext, ROUND_HALF_UP
-    import pandas as pd
-    from rapidfuzz.fuzz import token_sort_ratio  # substitui fuzzywuzzy
-    import os
+    from decimal import getcontext, ROUND_HALF_UP
+
+    if deve_enfileirar():
+        return enfileirar_requisicao('calculos_especiais')
 
     getcontext().prec = 20
     getcontext().rounding = ROUND_HALF_UP
 
-    def converter_lucro(valor):
-        try:
-            valor_str = str(valor).strip().replace(',', '.').replace('€', '').replace('R$', '').strip()
-            return Decimal(valor_str)
-        except (InvalidOperation, ValueError):
-            return Decimal('0.0000')
-
-    def normalizar_texto(texto):
-        if not isinstance(texto, str):
-            return ""
-        return texto.lower().strip()
-
     artistas = ArtistaEspecial.query.order_by(ArtistaEspecial.nome).all()
     arquivos = ArquivoImportado.query.order_by(ArquivoImportado.data_upload.desc()).all()
     cotacoes = Cotacao.query.order_by(Cotacao.ano.desc(), Cotacao.mes.desc()).all()
@@ -1145,87 +1103,22 @@ def calculos_especiais():
         cotacao = Cotacao.query.get_or_404(cotacao_id)
 
         try:
-            # Usa o UPLOAD_FOLDER e nome_arquivo
-            planilha_path = os.path.join(app.config['UPLOAD_FOLDER'], arquivo.nome_arquivo)
-
-            if not os.path.exists(planilha_path):
-                flash(f"Arquivo {arquivo.nome_arquivo} não encontrado na pasta uploads. Favor importar novamente.", "danger")
-                return redirect(url_for('calculos_especiais'))
-
-            # Tenta ler a planilha com sep padrão, depois tenta com ';' se der erro
+            # Extrato normalizado (cacheado por arquivo/hash)
             try:
-                df = pd.read_csv(planilha_path)
-            except pd.errors.ParserError:
-                df = pd.read_csv(planilha_path, sep=';', engine='python')
-
-            df.columns = [col.strip() for col in df.columns]
-
-            col_titulo = encontrar_coluna(df, "Título do lançamento")
-            col_lucro = encontrar_coluna(df, "Lucro Líquido")
-            col_artista = encontrar_coluna(df, "Nome do artista")
-
-            if not col_titulo or not col_lucro or not col_artista:
+                extrato = obter_extrato(arquivo, exigir_titulo=True)
+            except FileNotFoundError as e:
+                flash(str(e), "danger")
+                return redirect(url_for('calculos_especiais'))
+            except ValueError:
                 flash("A planilha está sem as colunas obrigatórias.", "danger")
                 return redirect(url_for('calculos_especiais'))
 
-            df['titulo_normalizado'] = df[col_titulo].apply(normalizar_texto)
-            df['lucro'] = df[col_lucro].apply(converter_lucro)
-            df['Nome do artista'] = df[col_artista].astype(str)
-
-            nomes_validos = [normalizar_texto(artista.nome)] + [
-                normalizar_texto(v) for v in artista.obter_variacoes()
-            ]
-
-            df = df[df['Nome do artista'].apply(lambda nome: normalizar_texto(nome) in nomes_validos)]
-
-            titulos_dict = {}
-            for t in artista.titulos:
-                try:
-                    percentual_str = str(t.percentual).replace(',', '.').strip()
-                    titulos_dict[t.titulo] = Decimal(percentual_str)
-                except (InvalidOperation, ValueError):
-                    flash(f"Percentual inválido para o título '{t.titulo}': '{t.percentual}'", "warning")
-                    continue
-
-            resultados_detalhados = []
-            total_eur = Decimal('0')
-            total_brl = Decimal('0')
-
-            for titulo, percentual in titulos_dict.items():
-                titulo_norm = normalizar_texto(titulo)
-
-                matches = []
-                for titulo_plan in df['titulo_normalizado'].unique():
-                    similaridade = token_sort_ratio(titulo_norm, titulo_plan)
-                    if similaridade >= 90:
-                        matches.append((titulo_plan, similaridade))
-
-                valor_titulo_eur = Decimal('0')
-                linhas_match = pd.DataFrame()
-
-                for titulo_plan, _ in matches:
-                    linhas = df[df['titulo_normalizado'] == titulo_plan]
-                    linhas_match = pd.concat([linhas_match, linhas])
-
-                if not linhas_match.empty:
-                    lucro_total = linhas_match['lucro'].sum()
-                    valor_titulo_eur = lucro_total * (percentual / Decimal('100'))
-                    total_eur += valor_titulo_eur
-
-                valor_titulo_brl = valor_titulo_eur * Decimal(str(cotacao.valor))
-                total_brl += valor_titulo_brl
-
-                resultados_detalhados.append({
-                    'titulo': titulo,
-                    'titulos_match': [m[0] for m in matches],
-                    'similaridades': [m[1] for m in matches],
-                    'valor_eur': valor_titulo_eur.quantize(Decimal('0.0001')),
-                    'valor_brl': valor_titulo_brl.quantize(Decimal('0.01')),
-                    'percentual': percentual
-                })
-
-            total_eur = total_eur.quantize(Decimal('0.0001'))
-            total_brl = total_brl.quantize(Decimal('0.01'))
+            informar_progresso(30, "Comparando títulos")
+            total_eur, total_brl, resultados_detalhados, avisos = calcular_especial_artista(
+                preparar_extrato_especial(extrato), artista, cotacao.valor
+            )
+            for aviso in avisos:
+                flash(aviso, "warning")
 
             dados_salvar = {
                 'artista': artista.nome,
@@ -1596,16 +1489,14 @@ def calcular_assisao():
             return redirect(url_for('calculo_assisao'))
 
         try:
-            df = carregar_planilha(planilha.caminho)
+            extrato = obter_extrato(planilha, exigir_titulo=True)
+        except ValueError:
+            flash("Planilha está com colunas inválidas. Verifique os cabeçalhos.", "danger")
+            return redirect(url_for('calculo_assisao'))
         except Exception as e:
             flash(f"Erro ao carregar a planilha: {str(e)}", "danger")
             return redirect(url_for('calculo_assisao'))
 
-        # Validação de colunas esperadas
-        if not all(col in df.columns for col in ["Nome do artista", "Título do lançamento", "Lucro Líquido"]):
-            flash("Planilha está com colunas inválidas. Verifique os cabeçalhos.", "danger")
-            return redirect(url_for('calculo_assisao'))
-
         try:
             cotacao_valor = Decimal(cotacao_input)
         except:
@@ -1613,10 +1504,9 @@ def calcular_assisao():
             return redirect(url_for('calculo_assisao'))
 
         # Renomear colunas para padrão interno
-        df = df.rename(columns={
-            'Nome do artista': 'nome_artista_normalizado',
-            'Título do lançamento': 'titulo_normalizado',
-            'Lucro Líquido': 'lucro'
+        df = extrato.rename(columns={
+            'artista': 'nome_artista_normalizado',
+            'titulo': 'titulo_normalizado'
         })
 
         # Obter os títulos e percentuais cadastrados
@@ -1624,12 +1514,12 @@ def calcular_assisao():
         titulos_dict = {t.titulo: t.percentual for t in titulos}
 
         # Chamada correta da função de cálculo com objeto artista
-        from app import calcular_valores_assisao
         total_eur, total_brl, resultados_detalhados = calcular_valores_assisao(
             df_original=df,
             artista_obj=artista,
             titulos_dict=titulos_dict,
-            cotacao_valor=cotacao_valor
+            cotacao_valor=cotacao_valor,
+            indice=obter_indice_aliases()
         )
 
         dados_salvar = {
@@ -1791,6 +1681,49 @@ def salvar_calculo_assisao():
 
     return redirect(url_for('calculo_assisao'))
 
+@app.route('/api/calculos/lote', methods=['POST'])
+@csrf.exempt
+def api_calculos_lote():
+    """
+    Fechamento mensal em lote: todos os artistas (normal, especial e assisão) calculados
+    sobre uma planilha e uma cotação. Com salvar=true os resultados são gravados de uma vez.
+    """
+    if 'usuario_id' not in session:
+        return jsonify({'success': False, 'error': 'Não autenticado'}), 401
+
+    dados = request.get_json(silent=True) or request.form
+    arquivo = ArquivoImportado.query.get(dados.get('arquivo_id'))
+    if not arquivo:
+        return jsonify({'success': False, 'error': 'Planilha não encontrada'}), 404
+
+    try:
+        if dados.get('cotacao_id'):
+            cotacao = Cotacao.query.get(dados.get('cotacao_id'))
+            if not cotacao:
+                raise ValueError
+            cotacao_valor = Decimal(str(cotacao.valor))
+        else:
+            cotacao_valor = Decimal(str(dados.get('cotacao', '')).replace(',', '.').strip())
+        mes = int(dados.get('mes'))
+        ano = int(dados.get('ano'))
+        if not 1 <= mes <= 12:
+            raise ValueError
+    except Exception:
+        return jsonify({'success': False, 'error': 'Cotação, mês ou ano inválidos'}), 400
+
+    salvar = str(dados.get('salvar', '')).lower() in ('1', 'true', 'sim', 'on')
+
+    try:
+        resultado = calcular_fechamento(arquivo, cotacao_valor, mes, ano, workers=app.config['WORKERS_CALCULO'])
+        gravados = salvar_fechamento(resultado, arquivo, cotacao_valor, mes, ano) if salvar else None
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        app.logger.error(f"Erro no cálculo em lote: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({'success': True, 'gravados': gravados, **serializar_fechamento(resultado)})
+
 @app.route('/excluir_calculo_assisao/<int:id>', methods=['POST'])
 def excluir_calculo_assisao(id):
     calculo = CalculoAssisaoSalvo.query.get_or_404(id)
@@ -1823,75 +1756,72 @@ def serializar_calculo(c, tipo):
 # ROTAS PRINCIPAIS
 # ======================
 def padronizar_status_pagamentos():
-    pagamentos = PagamentoRealizado.query.all()
-    atualizados = 0
-    for p in pagamentos:
-        if p.status:
-            status_limpo = p.status.strip().lower()
-        else:
-            status_limpo = 'agendado'
-        
-        if p.status != status_limpo:
-            p.status = status_limpo
-            atualizados += 1
-    if atualizados > 0:
-        db.session.commit()
-    return atualizados
-
-def remover_duplicados(pagamentos):
-    vistos = set()
-    resultado = []
-    for p in pagamentos:
-        chave = (p.artista_nome, p.mes, p.ano, round(p.valor_brl, 2), p.status, p.vencimento)
-        if chave not in vistos:
-            vistos.add(chave)
-            resultado.append(p)
-    return resultado
+    contagens = varrer_pagamentos()
+    return contagens['status_vazios'] + contagens['status_padronizados']
+
+MESES_HISTORICO = ['', 'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+                   'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
+MESES_ABREVIADOS = ['', 'JAN', 'FEV', 'MAR', 'ABR', 'MAI', 'JUN',
+                    'JUL', 'AGO', 'SET', 'OUT', 'NOV', 'DEZ']
+
+
+def _periodo_param(valor):
+    """'MM/AAAA' → (mes, ano); vazio → None. ValueError se mal formado."""
+    if not valor:
+        return None
+    mes, ano = (int(parte) for parte in valor.split('/'))
+    if not 1 <= mes <= 12:
+        raise ValueError(f"Mês inválido: {valor}")
+    return mes, ano
+
+
+def _data_param(valor):
+    """'AAAA-MM-DD' → date; vazio → None."""
+    return datetime.strptime(valor, '%Y-%m-%d').date() if valor else None
+
+
+def filtros_historico(args):
+    """Condições do histórico a partir dos parâmetros da requisição (ValueError se inválidos)."""
+    mes = args.get('mes', '').strip().upper()
+    if mes in MESES_ABREVIADOS[1:]:
+        mes = MESES_ABREVIADOS.index(mes)
+    status = [s.strip().lower() for s in args.get('status', '').split(',') if s.strip()]
+    tabelas = [t.strip() for t in args.get('tabela', '').split(',') if t.strip()]
+    return condicoes_historico(
+        artista=args.get('artista') or None,
+        status=status or None,
+        tabelas=tabelas or None,
+        mes=int(mes) if mes else None,
+        ano=args.get('ano', type=int),
+        periodo_de=_periodo_param(args.get('de')),
+        periodo_ate=_periodo_param(args.get('ate')),
+        vencimento_de=_data_param(args.get('vencimento_de')),
+        vencimento_ate=_data_param(args.get('vencimento_ate')),
+    )
+
+
+def serializar_pagamento_historico(p):
+    mes_valido = p.mes and 1 <= p.mes <= 12
+    return {
+        'id': p.id,
+        'artista_nome': p.artista_nome or "Artista não identificado",
+        'mes': p.mes,
+        'mes_nome': MESES_HISTORICO[p.mes] if mes_valido else '',
+        'mes_abreviado': MESES_ABREVIADOS[p.mes] if mes_valido else '',
+        'ano': p.ano,
+        'status': p.status,
+        'valor_brl': float(p.valor_brl or 0),
+        'vencimento': p.vencimento.isoformat() if p.vencimento else None,
+        'data_vencimento': p.vencimento.strftime('%d/%m/%Y') if p.vencimento else '',
+        'herdeiro': p.herdeiro
+    }
 
 @app.route('/pagamentos')
 def pagamentos():
     try:
-        from datetime import datetime
-        import pytz
         from sqlalchemy import func
-        
-        tz_brasil = pytz.timezone('America/Sao_Paulo')
-        hoje = datetime.now(tz_brasil).date()
-
-        pagamentos = PagamentoRealizado.query.all()
-        atualizados_nome = 0
-        atualizados_status = 0
-
-        print(f"[DEBUG] Total pagamentos para processar: {len(pagamentos)}")
-
-        for p in pagamentos:
-            # Padroniza status (lowercase, trim, vazio vira 'agendado')
-            status_limpo = (p.status or '').strip().lower()
-            if not status_limpo:
-                print(f"[DEBUG] Corrigindo status vazio no pagamento ID {p.id} para 'agendado'")
-                p.status = 'agendado'
-                atualizados_status += 1
-            elif p.status != status_limpo:
-                print(f"[DEBUG] Padronizando status do pagamento ID {p.id}: '{p.status}' → '{status_limpo}'")
-                p.status = status_limpo
-                atualizados_status += 1
-
-            # Atualiza para 'pago' se vencimento for menor ou igual à hoje
-            if p.status == 'agendado' and p.vencimento and p.vencimento <= hoje:
-                print(f"[DEBUG] Atualizando status para PAGO ID {p.id} (vencimento {p.vencimento})")
-                p.status = 'pago'
-                p.data_pagamento = datetime.now(tz_brasil)
-                atualizados_status += 1
-
-            # Atualiza nome do artista
-            nome_correto = buscar_nome_artista(p.artista_id, p.tabela_artista)
-            if nome_correto and p.artista_nome != nome_correto:
-                print(f"[DEBUG] Atualizando nome ID {p.id}: '{p.artista_nome}' → '{nome_correto}'")
-                p.artista_nome = nome_correto
-                atualizados_nome += 1
 
-        db.session.commit()
-        print(f"[DEBUG] Atualizações realizadas: nomes={atualizados_nome}, status={atualizados_status}")
+        # Só leitura: status e nomes são mantidos por varrer_pagamentos (services/pagamentos_service.py)
 
         # Carrega artistas (normais, especiais, assisão)
         artistas_normais = Artista.query.order_by(Artista.nome).all()
@@ -1906,22 +1836,10 @@ def pagamentos():
         # Carrega cálculos disponíveis
         calculos_disponiveis = construir_calculos_disponiveis()
 
-        # Filtra pagamentos para exibição no histórico
-        pagamentos_registrados = PagamentoRealizado.query.filter(
-            PagamentoRealizado.tabela_artista.in_(['normal', 'especial', 'assisao']),
-            func.lower(func.trim(PagamentoRealizado.status)).in_(["pago", "agendado"])
-        ).order_by(PagamentoRealizado.vencimento.desc()).all()
-
-        # Remove duplicados
-        pagamentos_registrados = remover_duplicados(pagamentos_registrados)
-
-        # Calcula total pago em BRL
-        total_pago = sum(p.valor_brl for p in pagamentos_registrados if (p.status or '').strip().lower() == 'pago')
-
-        meses_abreviado = [
-            '', 'JAN', 'FEV', 'MAR', 'ABR', 'MAI', 'JUN',
-            'JUL', 'AGO', 'SET', 'OUT', 'NOV', 'DEZ'
-        ]
+        # Primeira página do histórico (sem duplicados, no SQL); as seguintes vêm de /api/historico_pagamentos
+        historico = consultar_historico(condicoes_historico(tabelas=['normal', 'especial', 'assisao']))
+        pagamentos_registrados = [serializar_pagamento_historico(p) for p in historico['pagamentos']]
+        total_pago = historico['total_pago']
 
         return render_template(
             'pagamentos.html',
@@ -1930,8 +1848,9 @@ def pagamentos():
             cotacoes=cotacoes,
             calculos_disponiveis=calculos_disponiveis,
             pagamentos=pagamentos_registrados,
+            proximo_cursor=historico['proximo_cursor'],
             total_pago=total_pago,
-            meses_abreviado=meses_abreviado
+            meses_abreviado=MESES_ABREVIADOS
         )
     except Exception as e:
         print(f"[ERRO] ao carregar aba Pagamentos: {e}")
@@ -2028,6 +1947,9 @@ def excluir_sp(sp_id):
 
 @app.route("/gerar_sp_pagamento", methods=["POST"])
 def gerar_sp_pagamento():
+    if deve_enfileirar():
+        return enfileirar_requisicao('gerar_sp_pagamento')
+
     try:
         from flask import send_file, request, after_this_request
         from models import SPImportada, PagamentoRealizado, CalculoSalvo, CalculoEspecialSalvo, CalculoAssisaoSalvo
@@ -2142,6 +2064,7 @@ def gerar_sp_pagamento():
             print(f"ERRO - Conversão numérica: {str(e)}")
             return f"Erro na conversão de valores: {str(e)}", 400
 
+        informar_progresso(20, "Preenchendo a SP")
         resultado = preencher_sp_dinamicamente(
             sp_obj=sp_obj,
             valor_eur=valor_eur,
@@ -2267,6 +2190,56 @@ def gerar_sp_pagamento():
         print(traceback.format_exc())
         return f"Erro interno ao processar a requisição: {str(e)}", 500
 
+# ======================
+# FILA DE TAREFAS
+# ======================
+
+@app.route('/tarefas/<int:tarefa_id>')
+def status_tarefa(tarefa_id):
+    """Status/progresso de uma tarefa enfileirada; a tela consulta até concluir."""
+    tarefa = Tarefa.query.get_or_404(tarefa_id)
+    if not pode_acessar_tarefa(tarefa):
+        abort(404)
+
+    dados = tarefa.to_dict()
+    if tarefa.status == 'concluida':
+        dados['resultado_url'] = url_for('resultado_tarefa', tarefa_id=tarefa.id)
+    return jsonify(dados)
+
+
+@app.route('/tarefas/<int:tarefa_id>/resultado')
+def resultado_tarefa(tarefa_id):
+    tarefa = Tarefa.query.get_or_404(tarefa_id)
+    if not pode_acessar_tarefa(tarefa):
+        abort(404)
+    if tarefa.status != 'concluida':
+        return jsonify(tarefa.to_dict()), 409
+
+    if tarefa.resultado_tipo == 'redirecionamento':
+        if tarefa.mensagem:
+            flash(tarefa.mensagem, 'info')
+        return redirect(tarefa.resultado_caminho or url_for('inicio'))
+
+    if not tarefa.resultado_caminho or not os.path.exists(tarefa.resultado_caminho):
+        abort(410)
+
+    if tarefa.resultado_tipo == 'html':
+        with open(tarefa.resultado_caminho, encoding='utf-8') as f:
+            html = f.read()
+        # A página foi renderizada na sessão do worker: troca o token CSRF pelo da sessão atual
+        token_worker = re.search(r'<meta name="csrf-token" content="([^"]+)"', html)
+        if token_worker:
+            html = html.replace(token_worker.group(1), generate_csrf())
+        return html
+
+    return send_file(
+        tarefa.resultado_caminho,
+        as_attachment=True,
+        download_name=tarefa.resultado_nome or os.path.basename(tarefa.resultado_caminho),
+        mimetype=tarefa.resultado_mimetype
+    )
+
+
 @app.route('/api/calculos_disponiveis')
 def api_calculos_disponiveis():
     try:
@@ -2388,8 +2361,8 @@ def salvar_calculo_pagamento():
         db.session.add(novo)
         db.session.commit()
 
-        # Atualiza nomes e status baseados em datas logo após salvar
-        atualizar_e_buscar_historico()
+        # Atualiza status baseados em datas logo após salvar (o nome já foi gravado acima)
+        varrer_pagamentos()
 
         return jsonify({'success': True, 'id': novo.id})
     except Exception as e:
@@ -2397,104 +2370,37 @@ def salvar_calculo_pagamento():
 
 
 def atualizar_nomes_e_status_pagamentos():
-    from datetime import datetime
-    import pytz
-
-    tz_brasil = pytz.timezone('America/Sao_Paulo')
-    hoje = datetime.now(tz_brasil).date()
-
-    pagamentos = PagamentoRealizado.query.all()
-    mudou = False
-
-    for p in pagamentos:
-        nome_correto = buscar_nome_artista(p.artista_id, p.tabela_artista) or "Artista não identificado"
-        if p.artista_nome != nome_correto:
-            p.artista_nome = nome_correto
-            mudou = True
-        if p.vencimento and p.vencimento <= hoje and p.status.lower() != 'pago':
-            p.status = 'pago'
-            p.data_pagamento = hoje
-            mudou = True
-
-    if mudou:
-        db.session.commit()
+    varrer_pagamentos()
 
 @app.route('/api/historico_pagamentos', methods=['GET'])
 @csrf.exempt
 def api_historico_pagamentos():
+    """
+    Histórico paginado por cursor. Parâmetros (todos opcionais): artista (trecho do nome),
+    status (pago,agendado), tabela, mes (número ou JAN..DEZ), ano, de/ate (MM/AAAA),
+    vencimento_de/vencimento_ate (AAAA-MM-DD), ordenar (vencimento|valor|artista),
+    direcao (asc|desc), limite e cursor (o proximo_cursor da página anterior).
+    """
     try:
-        from sqlalchemy import func
-        from datetime import datetime
-        import pytz
-
-        tz_brasil = pytz.timezone('America/Sao_Paulo')
-        hoje = datetime.now(tz_brasil).date()
-
-        # 1. Atualizar status e nomes no banco para manter padrão
-        pagamentos = PagamentoRealizado.query.all()
-
-        atualizados_nome = 0
-        atualizados_status = 0
-
-        for p in pagamentos:
-            # Padronizar status
-            status_limpo = (p.status or '').strip().lower()
-            if p.status != status_limpo:
-                p.status = status_limpo
-                atualizados_status += 1
-
-            # Atualizar status para pago se vencimento já passou
-            if status_limpo == 'agendado' and p.vencimento and p.vencimento <= hoje:
-                p.status = 'pago'
-                p.data_pagamento = datetime.now(tz_brasil)
-                atualizados_status += 1
-
-            # Atualizar nome do artista
-            nome_correto = buscar_nome_artista(p.artista_id, p.tabela_artista)
-            if nome_correto and p.artista_nome != nome_correto:
-                p.artista_nome = nome_correto
-                atualizados_nome += 1
-
-        db.session.commit()
-
-        print(f"[DEBUG] Atualizações: nomes={atualizados_nome}, status={atualizados_status}")
-
-        # 2. Debug dos status antes do filtro
-        print("[DEBUG] Status e IDs antes do filtro:")
-        for p in pagamentos:
-            print(f"ID: {p.id}, status raw: '{p.status}'")
-
-        # 3. Filtrar só os pagos e agendados padronizados
-        query = PagamentoRealizado.query.filter(
-            func.lower(func.trim(PagamentoRealizado.status)).in_(["pago", "agendado"])
+        # Só leitura: status e nomes são mantidos por varrer_pagamentos
+        condicoes = filtros_historico(request.args)
+        historico = consultar_historico(
+            condicoes,
+            ordenar=request.args.get('ordenar', 'vencimento'),
+            crescente=request.args.get('direcao', 'desc').lower() == 'asc',
+            cursor=request.args.get('cursor') or None,
+            limite=request.args.get('limite', ITENS_POR_PAGINA, type=int),
         )
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
 
-        pagamentos_filtrados = query.order_by(PagamentoRealizado.vencimento.desc()).all()
-
-        # 4. Debug dos status após filtro
-        print("[DEBUG] Status e IDs após filtro:")
-        for p in pagamentos_filtrados:
-            print(f"ID: {p.id}, status limpo: '{(p.status or '').strip().lower()}'")
-
-        MESES = ['', 'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
-                 'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro']
-
-        lista = []
-        for p in pagamentos_filtrados:
-            mes_nome = MESES[p.mes] if p.mes and 1 <= p.mes <= 12 else ''
-            lista.append({
-                'id': p.id,
-                'artista_nome': p.artista_nome or "Artista não identificado",
-                'mes': p.mes,
-                'mes_nome': mes_nome,
-                'ano': p.ano,
-                'status': p.status,
-                'valor_brl': float(p.valor_brl or 0),
-                'data_vencimento': p.vencimento.strftime('%d/%m/%Y') if p.vencimento else '',
-                'herdeiro': p.herdeiro
-            })
-
-        return jsonify({"success": True, "pagamentos": lista})
+    try:
+        return jsonify({
+            "success": True,
+            "pagamentos": [serializar_pagamento_historico(p) for p in historico['pagamentos']],
+            "proximo_cursor": historico['proximo_cursor'],
+            "total_pago": historico['total_pago'],
+        })
 
     except Exception as e:
         current_app.logger.error(f"[ERRO api_historico_pagamentos] {e}")
@@ -2503,29 +2409,8 @@ def api_historico_pagamentos():
 @app.route('/api/atualizar_pagamentos', methods=['POST'])
 def atualizar_pagamentos():
     try:
-        from datetime import datetime
-        import pytz
-        tz_brasil = pytz.timezone('America/Sao_Paulo')
-        hoje = datetime.now(tz_brasil).date()
-
-        pagamentos = PagamentoRealizado.query.all()
-        nomes_atualizados = 0
-        status_atualizados = 0
-
-        for p in pagamentos:
-            # Atualiza nome do artista
-            nome_correto = buscar_nome_artista(p.artista_id, p.tabela_artista)
-            if nome_correto and p.artista_nome != nome_correto:
-                p.artista_nome = nome_correto
-                nomes_atualizados += 1
-
-            # Atualiza status para pago se a data venceu
-            if p.status and p.status.strip().lower() != 'pago' and p.vencimento and p.vencimento <= hoje:
-                p.status = 'pago'
-                p.data_pagamento = hoje
-                status_atualizados += 1
-
-        db.session.commit()
+        nomes_atualizados = sincronizar_nomes_pagamentos()
+        status_atualizados = varrer_pagamentos()['vencidos_pagos']
 
         return jsonify({
             'success': True,
@@ -2620,7 +2505,7 @@ def verificar_vencimentos():
         hoje = datetime.today().date()
 
         registros_agendados = db.session.query(PagamentoRealizado).filter(
-            func.lower(PagamentoRealizado.status) == 'agendado',
+            PagamentoRealizado.status == 'agendado',
             PagamentoRealizado.data_pagamento != None,
             PagamentoRealizado.data_pagamento <= hoje
         ).all()
@@ -3011,7 +2896,7 @@ app.logger.setLevel(logging.DEBUG)
 def retroativos():
     # Importações necessárias para a rota.
     from sqlalchemy import func
-    from retroativos_models import RetroativoCalculado
+    from retroativos_models import RetroativoMensal
     import unicodedata
     from datetime import datetime
     from collections import defaultdict
@@ -3029,11 +2914,12 @@ def retroativos():
     
     # Query base para obter artistas distintos.
     # Usamos distinct() para garantir que cada artista apareça apenas uma vez.
-    query_artistas = db.session.query(RetroativoCalculado.artista).distinct()
+    # Tudo aqui lê o resumo mensal (RetroativoMensal), não as linhas importadas.
+    query_artistas = db.session.query(RetroativoMensal.artista).distinct()
 
     # Aplica o filtro de busca se houver uma query de pesquisa.
     if search_query:
-        query_artistas = query_artistas.filter(func.lower(RetroativoCalculado.artista).like(f"%{search_query.lower()}%"))
+        query_artistas = query_artistas.filter(RetroativoMensal.artista_norm.like(f"%{normalizar_chave(search_query)}%"))
 
     # Conta o total de artistas para a paginação. Esta operação ainda pode ser lenta em grandes volumes,
     # mas é necessária para determinar o número de páginas.
@@ -3042,7 +2928,7 @@ def retroativos():
     # Busca apenas os artistas da página atual.
     # A ordenação é importante para garantir que a paginação seja consistente.
     artistas_pagina = (
-        query_artistas.order_by(RetroativoCalculado.artista)
+        query_artistas.order_by(RetroativoMensal.artista)
         .offset((page - 1) * per_page)
         .limit(per_page)
         .all()
@@ -3056,8 +2942,8 @@ def retroativos():
     
     # Obter anos disponíveis
     min_max_anos = db.session.query(
-        func.min(RetroativoCalculado.ano),
-        func.max(RetroativoCalculado.ano)
+        func.min(RetroativoMensal.ano),
+        func.max(RetroativoMensal.ano)
     ).first()
 
     min_ano = int(min_max_anos[0]) if min_max_anos[0] else datetime.now().year
@@ -3070,12 +2956,12 @@ def retroativos():
     if nomes_artistas:
         resultados_consolidados = (
             db.session.query(
-                RetroativoCalculado.artista,
-                RetroativoCalculado.ano,
-                func.sum(RetroativoCalculado.lucro_liquido).label('total')
+                RetroativoMensal.artista,
+                RetroativoMensal.ano,
+                func.sum(RetroativoMensal.lucro_liquido).label('total')
             )
-            .filter(RetroativoCalculado.artista.in_(nomes_artistas))
-            .group_by(RetroativoCalculado.artista, RetroativoCalculado.ano)
+            .filter(RetroativoMensal.artista.in_(nomes_artistas))
+            .group_by(RetroativoMensal.artista, RetroativoMensal.ano)
             .all()
         )
     else:
@@ -3156,46 +3042,46 @@ def api_relatorio_retroativo():
 
         # ====================================================================
         # Consulta AGREGADA: Soma os valores por Artista, Título e Ano no Período
-        # CORRIGIDO: Agora consulta diretamente RetroativoCalculado, que é onde os dados são salvos.
+        # Lê o resumo mensal (RetroativoMensal), mantido pela importação, em vez das linhas.
         # ====================================================================
         query = db.session.query(
-            RetroativoCalculado.artista, # Usar artista de RetroativoCalculado
-            RetroativoCalculado.titulo,  # Usar titulo de RetroativoCalculado
-            RetroativoCalculado.ano, 
-            func.sum(RetroativoCalculado.lucro_liquido).label('lucro_total') # Usar lucro_liquido
+            RetroativoMensal.artista,
+            RetroativoMensal.titulo,
+            RetroativoMensal.ano,
+            func.sum(RetroativoMensal.lucro_liquido).label('lucro_total')
         ).filter(
-            RetroativoCalculado.artista.in_(artistas_selecionados)
+            RetroativoMensal.artista_norm.in_([normalizar_chave(a) for a in artistas_selecionados])
         )
 
         # Lógica para filtrar por período (abrange múltiplos anos se necessário)
         if ano_inicial == ano_final:
             query = query.filter(
-                RetroativoCalculado.ano == ano_inicial,
-                RetroativoCalculado.mes.between(mes_inicial, mes_final)
+                RetroativoMensal.ano == ano_inicial,
+                RetroativoMensal.mes.between(mes_inicial, mes_final)
             )
         else:
             conditions_period = []
             conditions_period.append(
-                (RetroativoCalculado.ano == ano_inicial) & (RetroativoCalculado.mes >= mes_inicial)
+                (RetroativoMensal.ano == ano_inicial) & (RetroativoMensal.mes >= mes_inicial)
             )
             for interm_year in range(ano_inicial + 1, ano_final):
-                conditions_period.append(RetroativoCalculado.ano == interm_year)
+                conditions_period.append(RetroativoMensal.ano == interm_year)
             if ano_final > ano_inicial:
                 conditions_period.append(
-                    (RetroativoCalculado.ano == ano_final) & (RetroativoCalculado.mes <= mes_final)
+                    (RetroativoMensal.ano == ano_final) & (RetroativoMensal.mes <= mes_final)
                 )
             query = query.filter(or_(*conditions_period))
 
         # Aplica filtro por títulos selecionados, se houver
         if titulos_selecionados:
-            query = query.filter(RetroativoCalculado.titulo.in_(titulos_selecionados))
+            query = query.filter(RetroativoMensal.titulo_norm.in_([normalizar_chave(t) for t in titulos_selecionados]))
 
         # Agrupa os resultados por Artista, Título e Ano
         query = query.group_by(
-            RetroativoCalculado.artista,
-            RetroativoCalculado.titulo,
-            RetroativoCalculado.ano 
-        ).order_by(RetroativoCalculado.artista, RetroativoCalculado.titulo, RetroativoCalculado.ano)
+            RetroativoMensal.artista,
+            RetroativoMensal.titulo,
+            RetroativoMensal.ano 
+        ).order_by(RetroativoMensal.artista, RetroativoMensal.titulo, RetroativoMensal.ano)
 
         current_app.logger.debug(f"API Relatório: SQL Query gerada: {query}")
 
@@ -3259,6 +3145,9 @@ def titulos_por_artista(id):
 @csrf.exempt
 @app.route('/exportar_retroativo', methods=['POST'])
 def exportar_retroativo():
+    if deve_enfileirar():
+        return enfileirar_requisicao('exportar_retroativo')
+
     try:
         import json
         from io import BytesIO
@@ -3271,7 +3160,7 @@ def exportar_retroativo():
         from reportlab.lib.units import cm, mm
         from reportlab.pdfbase import pdfmetrics
         from reportlab.pdfbase.ttfonts import TTFont
-        from sqlalchemy import func, or_, case, Integer, cast
+        from sqlalchemy import func, or_
 
         getcontext().prec = 28
         getcontext().rounding = ROUND_HALF_UP
@@ -3333,64 +3222,46 @@ def exportar_retroativo():
         ano_final = int(ano_final)
         mes_final = int(mes_final)
 
-        # --- Mapeamento de mês textual para número ---
-        mes_col = RetroativoCalculado.mes
-        mes_case = case(
-            (func.lower(mes_col) == 'janeiro', 1),
-            (func.lower(mes_col) == 'fevereiro', 2),
-            (func.lower(mes_col) == 'março', 3),
-            (func.lower(mes_col) == 'marco', 3),
-            (func.lower(mes_col) == 'abril', 4),
-            (func.lower(mes_col) == 'maio', 5),
-            (func.lower(mes_col) == 'junho', 6),
-            (func.lower(mes_col) == 'julho', 7),
-            (func.lower(mes_col) == 'agosto', 8),
-            (func.lower(mes_col) == 'setembro', 9),
-            (func.lower(mes_col) == 'outubro', 10),
-            (func.lower(mes_col) == 'novembro', 11),
-            (func.lower(mes_col) == 'dezembro', 12),
-            else_=cast(mes_col, Integer)
-        )
-
-        # --- Query ---
+        # --- Query (resumo mensal: o mês já está como número) ---
+        informar_progresso(10, "Consultando retroativos")
         query = db.session.query(
-            RetroativoCalculado.artista,
-            RetroativoCalculado.titulo,
-            RetroativoCalculado.ano,
-            func.sum(RetroativoCalculado.lucro_liquido).label('lucro_total'),
+            RetroativoMensal.artista,
+            RetroativoMensal.titulo,
+            RetroativoMensal.ano,
+            func.sum(RetroativoMensal.lucro_liquido).label('lucro_total'),
         ).filter(
-            func.lower(RetroativoCalculado.artista).in_([a.lower() for a in artistas_selecionados])
+            RetroativoMensal.artista_norm.in_([normalizar_chave(a) for a in artistas_selecionados])
         )
 
         if titulos_selecionados:
             query = query.filter(
-                func.lower(RetroativoCalculado.titulo).in_([t.lower() for t in titulos_selecionados])
+                RetroativoMensal.titulo_norm.in_([normalizar_chave(t) for t in titulos_selecionados])
             )
 
         if ano_inicial == ano_final:
             query = query.filter(
-                RetroativoCalculado.ano == ano_inicial,
-                mes_case.between(mes_inicial, mes_final)
+                RetroativoMensal.ano == ano_inicial,
+                RetroativoMensal.mes.between(mes_inicial, mes_final)
             )
         else:
             conditions_period = [
-                (RetroativoCalculado.ano == ano_inicial) & (mes_case >= mes_inicial)
+                (RetroativoMensal.ano == ano_inicial) & (RetroativoMensal.mes >= mes_inicial)
             ]
             for interm_year in range(ano_inicial + 1, ano_final):
-                conditions_period.append(RetroativoCalculado.ano == interm_year)
+                conditions_period.append(RetroativoMensal.ano == interm_year)
             conditions_period.append(
-                (RetroativoCalculado.ano == ano_final) & (mes_case <= mes_final)
+                (RetroativoMensal.ano == ano_final) & (RetroativoMensal.mes <= mes_final)
             )
             query = query.filter(or_(*conditions_period))
 
         query = query.group_by(
-            RetroativoCalculado.artista,
-            RetroativoCalculado.titulo,
-            RetroativoCalculado.ano
+            RetroativoMensal.artista,
+            RetroativoMensal.titulo,
+            RetroativoMensal.ano
         ).order_by(
-            RetroativoCalculado.artista,
-            RetroativoCalculado.titulo,
-            RetroativoCalculado.ano
+            RetroativoMensal.artista,
+            RetroativoMensal.titulo,
+            RetroativoMensal.ano
         )
 
         aggregated_records = query.all()
@@ -3433,6 +3304,7 @@ def exportar_retroativo():
         ])
 
         # --- Criar PDF ---
+        informar_progresso(60, "Gerando PDF")
         buffer = BytesIO()
         doc = SimpleDocTemplate(
             buffer, 
@@ -3,16 +3,20 @@ import os
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
 
+from sqlalchemy import or_
+
 from app import app, db  # Importa o objeto app e db do seu app.py
 from models import PagamentoRealizado
-from utils import buscar_nome_artista
+from utils import buscar_nomes_artistas
 
 with app.app_context():
-    pagamentos = PagamentoRealizado.query.all()
+    pagamentos = PagamentoRealizado.query.filter(
+        or_(PagamentoRealizado.artista_nome.is_(None), PagamentoRealizado.artista_nome == '')
+    ).all()
+    nomes = buscar_nomes_artistas((p.artista_id, p.tabela_artista) for p in pagamentos)
     count = 0
     for p in pagamentos:
-        if not p.artista_nome:
-            p.artista_nome = buscar_nome_artista(p.artista_id, p.tabela_artista) or "Artista não identificado"
-            count += 1
+        p.artista_nome = nomes.get((p.artista_id, p.tabela_artista)) or "Artista não identificado"
+        count += 1
     db.session.commit()
     print(f"{count} registros atualizados com artista_nome")
@@ -29,7 +29,7 @@ def atualizar_status_pagamentos():
                 PagamentoRealizado.status == 'pago'
             ).all()
 
-            nome_artista = buscar_nome_artista(p.artista_id, p.tabela_artista) or "Artista não identificado"
+            nome_artista = p.artista_nome or buscar_nome_artista(p.artista_id, p.tabela_artista) or "Artista não identificado"
             print(f"Duplicados encontrados para {nome_artista}: {len(duplicados)}")
 
             if duplicados:
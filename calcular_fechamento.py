@@ -0,0 +1,72 @@
+# calcular_fechamento.py
+"""
+Fechamento mensal pela linha de comando: calcula todos os artistas (normal, especial e
+assisão) sobre uma planilha importada, no mesmo processo e com uma única leitura.
+
+Uso: python calcular_fechamento.py <arquivo_id> <mes> <ano> (--cotacao VALOR | --cotacao-id ID) [--salvar]
+"""
+import argparse
+import os
+import sys
+from decimal import Decimal
+
+from app import app
+from models import ArquivoImportado, Cotacao
+from services.calculos_service import calcular_fechamento, salvar_fechamento
+
+try:
+    sys.stdout.reconfigure(encoding='utf-8')
+except AttributeError:
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fechamento mensal em lote")
+    parser.add_argument('arquivo_id', type=int, help="ID do ArquivoImportado")
+    parser.add_argument('mes', type=int, help="Mês de referência (1-12)")
+    parser.add_argument('ano', type=int, help="Ano de referência")
+    grupo = parser.add_mutually_exclusive_group(required=True)
+    grupo.add_argument('--cotacao', help="Cotação EUR→BRL, ex.: 6,12")
+    grupo.add_argument('--cotacao-id', type=int, help="ID de uma Cotacao cadastrada")
+    parser.add_argument('--salvar', action='store_true', help="Grava os cálculos no banco")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="Processos para os artistas especiais/assisão (1 = sem pool)")
+    parser.add_argument('--incluir-zerados', action='store_true', help="Grava também artistas sem valor")
+    args = parser.parse_args()
+
+    with app.app_context():
+        arquivo = ArquivoImportado.query.get(args.arquivo_id)
+        if not arquivo:
+            print(f"Planilha {args.arquivo_id} não encontrada.")
+            sys.exit(1)
+
+        if args.cotacao_id:
+            cotacao = Cotacao.query.get(args.cotacao_id)
+            if not cotacao:
+                print(f"Cotação {args.cotacao_id} não encontrada.")
+                sys.exit(1)
+            cotacao_valor = Decimal(str(cotacao.valor))
+        else:
+            cotacao_valor = Decimal(args.cotacao.replace(',', '.'))
+
+        resultado = calcular_fechamento(arquivo, cotacao_valor, args.mes, args.ano, workers=args.workers)
+
+        for tipo in ('normal', 'especial', 'assisao'):
+            itens = resultado[tipo]
+            total_eur = sum((item['valor_eur'] for item in itens), Decimal('0'))
+            print(f"\n== {tipo.upper()}: {len(itens)} artistas | total €{total_eur}")
+            for item in itens:
+                if item['valor_eur'] != 0:
+                    print(f"  {item['artista']}: €{item['valor_eur']} | R$ {item['valor_brl']}")
+
+        for aviso in resultado['avisos']:
+            print(f"[aviso] {aviso}")
+
+        if args.salvar:
+            gravados = salvar_fechamento(resultado, arquivo, cotacao_valor, args.mes, args.ano,
+                                         incluir_zerados=args.incluir_zerados)
+            print(f"\nGravados: {gravados}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,8 @@ import pandas as pd
 from decimal import Decimal
 from collections import defaultdict
 
+from services.dinheiro_service import analisar_lucro
+
 def normalizar_texto(texto):
     import unicodedata
     if not isinstance(texto, str):
@@ -25,7 +27,10 @@ def diagnostico_titulos(path_planilha):
         return
 
     df['titulo_normalizado'] = df[col_titulo].astype(str).apply(normalizar_texto)
-    df['lucro'] = pd.to_numeric(df[col_lucro].astype(str).str.replace(',', '.'), errors='coerce').fillna(0).apply(Decimal)
+    lucros, invalidos = analisar_lucro(df[col_lucro])
+    df['lucro'] = lucros.fillna(Decimal('0'))
+    if invalidos.any():
+        print(f"⚠️ {int(invalidos.sum())} célula(s) de lucro inválida(s) contadas como 0.")
 
     print("\n✅ Títulos únicos encontrados:")
     agrupado = df.groupby('titulo_normalizado')['lucro'].agg(['count', 'sum']).reset_index()
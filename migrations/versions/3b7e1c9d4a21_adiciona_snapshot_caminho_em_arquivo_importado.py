@@ -0,0 +1,26 @@
+"""Adiciona snapshot_caminho em ArquivoImportado
+
+Revision ID: 3b7e1c9d4a21
+Revises: 48e8faba1fc9
+Create Date: 2026-10-18 09:12:40.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7e1c9d4a21'
+down_revision = '48e8faba1fc9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('arquivo_importado', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('snapshot_caminho', sa.String(length=300), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('arquivo_importado', schema=None) as batch_op:
+        batch_op.drop_column('snapshot_caminho')
@@ -0,0 +1,34 @@
+"""Adiciona hash e metadados de leitura em ArquivoImportado
+
+Revision ID: 7c2e5f8a9b13
+Revises: 3b7e1c9d4a21
+Create Date: 2026-10-18 11:03:27.541962
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e5f8a9b13'
+down_revision = '3b7e1c9d4a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('arquivo_importado', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hash_conteudo', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('total_linhas', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('colunas_detectadas', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('tempo_leitura', sa.Float(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_arquivo_importado_hash_conteudo'), ['hash_conteudo'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('arquivo_importado', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_arquivo_importado_hash_conteudo'))
+        batch_op.drop_column('tempo_leitura')
+        batch_op.drop_column('colunas_detectadas')
+        batch_op.drop_column('total_linhas')
+        batch_op.drop_column('hash_conteudo')
@@ -0,0 +1,45 @@
+"""Cria tabela tarefa (fila de execução em segundo plano)
+
+Revision ID: a41d6e2f0c57
+Revises: 7c2e5f8a9b13
+Create Date: 2026-10-18 14:26:51.208733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41d6e2f0c57'
+down_revision = '7c2e5f8a9b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tarefa',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tipo', sa.String(length=50), nullable=False),
+    sa.Column('caminho', sa.String(length=300), nullable=False),
+    sa.Column('parametros', sa.Text(), nullable=True),
+    sa.Column('usuario_id', sa.Integer(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('progresso', sa.Integer(), nullable=False),
+    sa.Column('mensagem', sa.String(length=500), nullable=True),
+    sa.Column('resultado_tipo', sa.String(length=20), nullable=True),
+    sa.Column('resultado_caminho', sa.String(length=300), nullable=True),
+    sa.Column('resultado_nome', sa.String(length=200), nullable=True),
+    sa.Column('resultado_mimetype', sa.String(length=100), nullable=True),
+    sa.Column('criado_em', sa.DateTime(), nullable=True),
+    sa.Column('iniciado_em', sa.DateTime(), nullable=True),
+    sa.Column('concluido_em', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('tarefa', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_tarefa_status'), ['status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('tarefa', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_tarefa_status'))
+    op.drop_table('tarefa')
@@ -0,0 +1,31 @@
+"""Cria índices de data_calculo nas tabelas de cálculos salvos (cálculos recentes do painel)
+
+Revision ID: b7f3d1a9c2e5
+Revises: e5b9a3c7d1f2
+Create Date: 2026-10-18 19:27:44.803516
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7f3d1a9c2e5'
+down_revision = 'e5b9a3c7d1f2'
+branch_labels = None
+depends_on = None
+
+
+TABELAS_CALCULOS = ('calculo_salvo', 'calculo_especial_salvo', 'calculo_assisao_salvo')
+
+
+def upgrade():
+    for tabela in TABELAS_CALCULOS:
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.create_index(f'ix_{tabela}_data_calculo', ['data_calculo'], unique=False)
+
+
+def downgrade():
+    for tabela in TABELAS_CALCULOS:
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{tabela}_data_calculo')
@@ -0,0 +1,39 @@
+"""Cria tabela correspondencia_nome (memo de correspondência de nomes)
+
+Revision ID: c93d0b7e4f18
+Revises: a41d6e2f0c57
+Create Date: 2026-10-18 16:02:37.514902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c93d0b7e4f18'
+down_revision = 'a41d6e2f0c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('correspondencia_nome',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('regra', sa.String(length=20), nullable=False),
+    sa.Column('nome', sa.String(length=500), nullable=False),
+    sa.Column('assinatura', sa.String(length=40), nullable=False),
+    sa.Column('artista_ids', sa.Text(), nullable=False),
+    sa.Column('usado_em', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('regra', 'nome', name='uq_correspondencia_nome_regra_nome')
+    )
+    with op.batch_alter_table('correspondencia_nome', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_correspondencia_nome_assinatura'), ['assinatura'], unique=False)
+        batch_op.create_index(batch_op.f('ix_correspondencia_nome_usado_em'), ['usado_em'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('correspondencia_nome', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_correspondencia_nome_usado_em'))
+        batch_op.drop_index(batch_op.f('ix_correspondencia_nome_assinatura'))
+    op.drop_table('correspondencia_nome')
@@ -0,0 +1,58 @@
+"""Padroniza status de pagamento_realizado e cria índices de pagamentos e cálculos
+
+Revision ID: e5b9a3c7d1f2
+Revises: c93d0b7e4f18
+Create Date: 2026-10-18 18:41:09.276113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9a3c7d1f2'
+down_revision = 'c93d0b7e4f18'
+branch_labels = None
+depends_on = None
+
+
+INDICES_CALCULOS = {
+    'calculo_salvo': ('ix_calculo_salvo_artista_id_ano_mes', 'ix_calculo_salvo_ano_mes'),
+    'calculo_especial_salvo': ('ix_calculo_especial_salvo_artista_id_ano_mes', 'ix_calculo_especial_salvo_ano_mes'),
+    'calculo_assisao_salvo': ('ix_calculo_assisao_salvo_artista_id_ano_mes', 'ix_calculo_assisao_salvo_ano_mes'),
+}
+
+
+def upgrade():
+    # Daqui em diante o status é gravado padronizado; acerta as linhas antigas uma vez
+    op.execute(sa.text(
+        "UPDATE pagamento_realizado SET status = 'agendado' "
+        "WHERE status IS NULL OR trim(status) = ''"
+    ))
+    op.execute(sa.text(
+        "UPDATE pagamento_realizado SET status = lower(trim(status)) "
+        "WHERE status != lower(trim(status))"
+    ))
+
+    with op.batch_alter_table('pagamento_realizado', schema=None) as batch_op:
+        batch_op.create_index('ix_pagamento_realizado_status_vencimento', ['status', 'vencimento'], unique=False)
+        batch_op.create_index('ix_pagamento_realizado_tabela_artista', ['tabela_artista'], unique=False)
+        batch_op.create_index('ix_pagamento_realizado_artista_periodo',
+                              ['artista_id', 'tabela_artista', 'ano', 'mes', 'status'], unique=False)
+
+    for tabela, (indice_artista, indice_periodo) in INDICES_CALCULOS.items():
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.create_index(indice_artista, ['artista_id', 'ano', 'mes'], unique=False)
+            batch_op.create_index(indice_periodo, ['ano', 'mes'], unique=False)
+
+
+def downgrade():
+    for tabela, (indice_artista, indice_periodo) in INDICES_CALCULOS.items():
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.drop_index(indice_periodo)
+            batch_op.drop_index(indice_artista)
+
+    with op.batch_alter_table('pagamento_realizado', schema=None) as batch_op:
+        batch_op.drop_index('ix_pagamento_realizado_artista_periodo')
+        batch_op.drop_index('ix_pagamento_realizado_tabela_artista')
+        batch_op.drop_index('ix_pagamento_realizado_status_vencimento')
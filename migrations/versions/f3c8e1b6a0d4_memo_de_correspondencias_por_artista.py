@@ -0,0 +1,42 @@
+"""Memo de correspondências invalidado por artista (updated_at nos artistas, avaliado_em no memo)
+
+Revision ID: f3c8e1b6a0d4
+Revises: b7f3d1a9c2e5
+Create Date: 2026-10-18 21:12:05.418230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8e1b6a0d4'
+down_revision = 'b7f3d1a9c2e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for tabela in ('artista', 'artista_especial'):
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute(sa.text(f"UPDATE {tabela} SET updated_at = CURRENT_TIMESTAMP"))
+
+    # As linhas antigas valiam para uma assinatura de todos os artistas: são só atalho, recalculam-se
+    op.execute(sa.text("DELETE FROM correspondencia_nome"))
+    with op.batch_alter_table('correspondencia_nome', schema=None) as batch_op:
+        batch_op.drop_index('ix_correspondencia_nome_assinatura')
+        batch_op.drop_column('assinatura')
+        batch_op.add_column(sa.Column('avaliado_em', sa.DateTime(), nullable=False))
+
+
+def downgrade():
+    op.execute(sa.text("DELETE FROM correspondencia_nome"))
+    with op.batch_alter_table('correspondencia_nome', schema=None) as batch_op:
+        batch_op.drop_column('avaliado_em')
+        batch_op.add_column(sa.Column('assinatura', sa.String(length=40), nullable=False))
+        batch_op.create_index('ix_correspondencia_nome_assinatura', ['assinatura'], unique=False)
+
+    for tabela in ('artista_especial', 'artista'):
+        with op.batch_alter_table(tabela, schema=None) as batch_op:
+            batch_op.drop_column('updated_at')
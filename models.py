@@ -1,4 +1,5 @@
 
+import json
 from datetime import datetime, date
 from extensions import db
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -38,6 +39,7 @@ class Artista(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nome = db.Column(db.String(100), nullable=False)
     percentual = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ver obter_indice_aliases
 
 
 class ArquivoImportado(db.Model):
@@ -45,11 +47,37 @@ class ArquivoImportado(db.Model):
     nome_arquivo = db.Column(db.String(200), nullable=False)
     caminho = db.Column(db.String(300), nullable=False, default='uploads/sem_caminho')
     data_upload = db.Column(db.DateTime, default=datetime.utcnow)
+    snapshot_caminho = db.Column(db.String(300), nullable=True)  # cópia colunar (Arrow/Feather) gerada no upload
+    hash_conteudo = db.Column(db.String(64), nullable=True, index=True)  # SHA-256, usado para barrar reenvios
+    total_linhas = db.Column(db.Integer, nullable=True)
+    colunas_detectadas = db.Column(db.Text, nullable=True)  # JSON {artista, titulo, lucro} → cabeçalho da planilha
+    tempo_leitura = db.Column(db.Float, nullable=True)  # segundos gastos na leitura/conversão
+
+    @property
+    def colunas(self):
+        return json.loads(self.colunas_detectadas) if self.colunas_detectadas else {}
+
+    @property
+    def resumo(self):
+        """Texto curto para as telas de cálculo, sem precisar abrir a planilha."""
+        if self.total_linhas is None:
+            return ''
+        partes = [f"{self.total_linhas:,} linhas".replace(',', '.')]
+        if not self.colunas.get('titulo'):
+            partes.append('sem título')
+        if self.tempo_leitura is not None:
+            partes.append(f"lida em {self.tempo_leitura:.1f}s")
+        return ' · '.join(partes)
 
 
 class CalculoSalvo(db.Model):
     __tablename__ = 'calculo_salvo'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_calculo_salvo_artista_id_ano_mes', 'artista_id', 'ano', 'mes'),
+        db.Index('ix_calculo_salvo_ano_mes', 'ano', 'mes'),
+        db.Index('ix_calculo_salvo_data_calculo', 'data_calculo'),
+        {'extend_existing': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artista = db.Column(db.String(100), nullable=False)
@@ -72,6 +100,7 @@ class ArtistaEspecial(db.Model):
     data_criacao = db.Column(db.DateTime, default=datetime.utcnow)
     percentual_padrao = db.Column(db.Float, nullable=True)
     tipo = db.Column(db.String(50), nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # ver obter_indice_aliases
 
     titulos = db.relationship(
         'TituloEspecial',
@@ -105,7 +134,12 @@ class Cotacao(db.Model):
 
 class CalculoEspecialSalvo(db.Model):
     __tablename__ = 'calculo_especial_salvo'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_calculo_especial_salvo_artista_id_ano_mes', 'artista_id', 'ano', 'mes'),
+        db.Index('ix_calculo_especial_salvo_ano_mes', 'ano', 'mes'),
+        db.Index('ix_calculo_especial_salvo_data_calculo', 'data_calculo'),
+        {'extend_existing': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artista = db.Column(db.String(100), nullable=False)
@@ -126,6 +160,11 @@ class CalculoEspecialSalvo(db.Model):
 
 class CalculoAssisaoSalvo(db.Model):
     __tablename__ = 'calculo_assisao_salvo'
+    __table_args__ = (
+        db.Index('ix_calculo_assisao_salvo_artista_id_ano_mes', 'artista_id', 'ano', 'mes'),
+        db.Index('ix_calculo_assisao_salvo_ano_mes', 'ano', 'mes'),
+        db.Index('ix_calculo_assisao_salvo_data_calculo', 'data_calculo'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artista = db.Column(db.String(120), nullable=False)
@@ -196,6 +235,12 @@ class SolicitacaoPagamento(db.Model):
 
 class PagamentoRealizado(db.Model):
     __tablename__ = 'pagamento_realizado'
+    __table_args__ = (
+        # status é gravado já padronizado (minúsculas, sem espaços): ver services/pagamentos_service.py
+        db.Index('ix_pagamento_realizado_status_vencimento', 'status', 'vencimento'),
+        db.Index('ix_pagamento_realizado_tabela_artista', 'tabela_artista'),
+        db.Index('ix_pagamento_realizado_artista_periodo', 'artista_id', 'tabela_artista', 'ano', 'mes', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artista_id = db.Column(db.Integer, nullable=False)
@@ -248,3 +293,49 @@ class ArtistaInfo(db.Model):
     total_musicas = db.Column(db.Integer, default=0)
     total_music_release = db.Column(db.Integer, default=0)  # total de lançamentos Music Release
     total_videos = db.Column(db.Integer, default=0)  # total de lançamentos Music Video + Packshot Video
+
+
+class Tarefa(db.Model):
+    """Rota pesada executada em segundo plano pelo worker (ver services/tarefas_service.py)."""
+    __tablename__ = 'tarefa'
+
+    id = db.Column(db.Integer, primary_key=True)
+    tipo = db.Column(db.String(50), nullable=False)  # endpoint da rota enfileirada
+    caminho = db.Column(db.String(300), nullable=False)  # URL reexecutada pelo worker
+    parametros = db.Column(db.Text, nullable=True)  # JSON: campos do formulário ou corpo JSON
+    usuario_id = db.Column(db.Integer, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='pendente', index=True)  # pendente | executando | concluida | erro
+    progresso = db.Column(db.Integer, nullable=False, default=0)
+    mensagem = db.Column(db.String(500), nullable=True)
+    resultado_tipo = db.Column(db.String(20), nullable=True)  # html | arquivo | redirecionamento
+    resultado_caminho = db.Column(db.String(300), nullable=True)
+    resultado_nome = db.Column(db.String(200), nullable=True)
+    resultado_mimetype = db.Column(db.String(100), nullable=True)
+    criado_em = db.Column(db.DateTime, default=datetime.utcnow)
+    iniciado_em = db.Column(db.DateTime, nullable=True)
+    concluido_em = db.Column(db.DateTime, nullable=True)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'tipo': self.tipo,
+            'status': self.status,
+            'progresso': self.progresso,
+            'mensagem': self.mensagem,
+            'resultado_tipo': self.resultado_tipo,
+            'criado_em': self.criado_em.isoformat() if self.criado_em else None,
+            'concluido_em': self.concluido_em.isoformat() if self.concluido_em else None,
+        }
+
+
+class CorrespondenciaNome(db.Model):
+    """Memo de correspondência nome da planilha → artistas (ver services/correspondencia_service.py)."""
+    __tablename__ = 'correspondencia_nome'
+    __table_args__ = (db.UniqueConstraint('regra', 'nome', name='uq_correspondencia_nome_regra_nome'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    regra = db.Column(db.String(20), nullable=False)  # normal | assisao
+    nome = db.Column(db.String(500), nullable=False)  # nome da planilha já normalizado
+    artista_ids = db.Column(db.Text, nullable=False)  # JSON: [id, ...]
+    avaliado_em = db.Column(db.DateTime, nullable=False)  # leitura dos artistas usada; alterados depois são retestados
+    usado_em = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -1,14 +1,31 @@
 # processar_retroativos.py
+"""
+Importa as planilhas de retroativos de um ano para o banco de retroativos.
+
+A importação é incremental: cada arquivo processado fica registrado em RetroativoArquivo
+com hash, tamanho e mtime; numa nova execução só os arquivos novos ou alterados são lidos
+de novo, e as linhas deles (origem_planilha) são trocadas numa única transação. Arquivos
+que saíram da pasta têm as linhas removidas.
+
+A leitura das planilhas (services/leitura_retroativos_service.py, que não importa o app nem
+toca no banco) pode rodar em paralelo (--workers processos), cada uma virando um lote
+colunar; um único escritor (services/retroativos_service.py) grava os lotes na ordem dos
+arquivos, com INSERT em lotes (executemany) e uma transação por arquivo, então o resultado
+não depende de --workers. A vazão da gravação (linhas/s) sai no log.
+
+Uso:
+    python processar_retroativos.py 2024
+    python processar_retroativos.py 2024 --workers 4
+    python processar_retroativos.py 2024 --completo   # apaga o ano e reprocessa tudo
+"""
+import argparse
 import sys
 import os
-import pandas as pd
-import re
+import json
 import unicodedata
 from decimal import Decimal, getcontext, ROUND_HALF_UP, InvalidOperation
-from datetime import datetime
 from collections import defaultdict
 import logging
-from unidecode import unidecode
 import glob
 import gc
 import time
@@ -18,8 +35,8 @@ from typing import Dict, Set
 # 1. Configuração e Dependências
 # =================================================================
 
-# Configurar logging explicitamente
-logger = logging.getLogger(__name__)
+# Configurar logging explicitamente ("retroativos": a leitura (services/leitura_retroativos_service.py) registra em retroativos.leitura)
+logger = logging.getLogger('retroativos')
 logger.setLevel(logging.INFO)
 
 # Garantir que os handlers não sejam adicionados várias vezes
@@ -45,97 +62,44 @@ getcontext().rounding = ROUND_HALF_UP
 # Nomes dos arquivos de entrada
 ARQUIVO_ARTISTAS_FILTRO = "artistas_retroativos.txt"
 
-# Mapeamento de colunas alvo para variantes possíveis
-COLUNAS_ALVO = {
-    "artista": ["nome do artista", "artista", "Artist"],
-    "titulo": ["tatulo do lancamento", "titulo do lancamento", " Album"],
-    "lucro": ["lucro liquido", "lucro laquido", "Total da conta" , "lucro"],
-    "gravadora": ["gravadora", "Gravadora"],
-    "mes_relatorio": ["mes do relatorio", "Mes do relatorio" ,  "mes"]
-}
+from services.leitura_retroativos_service import (
+    COLUNAS_REGISTRO,
+    ler_pendentes,
+    normalizar_nome_artista,
+)
 
-# Importar app e db
-try:
-    from app import app, db
-    from models import Artista, ArtistaEspecial
-    from retroativos_models import (
-        RetroativoCalculado,
-        RetroativoArquivo,
-        RetroativoTitulo,
-        TituloPeriodoValor
-    )
-    from sqlalchemy import tuple_, func
-    from sqlalchemy.orm import sessionmaker
-
-    logger.info("Dependências importadas com sucesso.")
-    app.app_context().push()
-    logger.info("Contexto da aplicação Flask ativado com sucesso.")
-except ImportError as e:
-    logger.error(f"Erro de importação: {e}", exc_info=True)
-    logger.error("Certifique-se de que o ambiente virtual está ativado e as dependências instaladas.")
-    db = None
-    app = None
-    sys.exit(1)
+# Importar app e db só no processo principal: no Windows os processos de leitura reimportam
+# este script (como __mp_main__) e não devem subir o app nem tocar no banco
+if __name__ == '__main__':
+    try:
+        from app import app, db
+        from models import Artista, ArtistaEspecial
+        from retroativos_models import (
+            RetroativoCalculado,
+            RetroativoArquivo,
+            RetroativoMensal,
+            RetroativoTitulo,
+            TituloPeriodoValor
+        )
+        from sqlalchemy import tuple_, func
+        from sqlalchemy.orm import sessionmaker
+        from services.planilhas_service import calcular_hash_arquivo
+        from services.retroativos_service import CarregadorRetroativos
+
+        logger.info("Dependências importadas com sucesso.")
+        app.app_context().push()
+        logger.info("Contexto da aplicação Flask ativado com sucesso.")
+    except ImportError as e:
+        logger.error(f"Erro de importação: {e}", exc_info=True)
+        logger.error("Certifique-se de que o ambiente virtual está ativado e as dependências instaladas.")
+        db = None
+        app = None
+        sys.exit(1)
 
 # =================================================================
 # 2. Funções de Utilitário e Normalização
 # =================================================================
 
-def remover_acentos(texto):
-    """Remove acentos de uma string, usando unidecode."""
-    if not isinstance(texto, str):
-        return ""
-    return unidecode(texto).lower().strip()
-
-def normalizar_nome_artista(nome):
-    """
-    Normaliza o nome do artista para um formato consistente, removendo
-    acentos, caracteres especiais, e variações comuns como "e ou".
-    """
-    if not nome:
-        return ""
-    nome_normalizado = remover_acentos(nome)
-    # Trata a variação "e ou" e "ou" para garantir consistência
-    nome_normalizado = re.sub(r'\s+e\s+ou\s+|\s+ou\s+', ' ', nome_normalizado)
-    nome_normalizado = re.sub(r'[^a-z0-9 ]', '', nome_normalizado)
-    return ' '.join(nome_normalizado.split()).strip()
-
-def normalizar_coluna(coluna):
-    """Normaliza nomes de colunas, removendo acentos e caracteres especiais."""
-    coluna = remover_acentos(coluna)
-    coluna = re.sub(r"[^a-z0-9 ]", "", coluna)
-    return coluna.strip()
-
-def identificar_colunas(df):
-    """Identifica as colunas essenciais no DataFrame com base nas variantes."""
-    colunas_normalizadas = {normalizar_coluna(c): c for c in df.columns}
-    mapeamento = {}
-    for chave, variantes in COLUNAS_ALVO.items():
-        for variante in variantes:
-            variante_normalizada = normalizar_coluna(variante)
-            if variante_normalizada in colunas_normalizadas:
-                mapeamento[chave] = colunas_normalizadas[variante_normalizada]
-                break
-    if "artista" in mapeamento and "lucro" in mapeamento:
-        return mapeamento
-    else:
-        logger.error(f"Não foi possível identificar as colunas 'artista' ou 'lucro'.")
-        logger.debug(f"Colunas normalizadas disponíveis: {list(colunas_normalizadas.keys())}")
-        return None
-
-def parse_valor(valor_raw):
-    """Converte um valor de string para Decimal, garantindo precisão."""
-    if valor_raw is None:
-        return Decimal("0")
-    if not isinstance(valor_raw, str):
-        valor_raw = str(valor_raw)
-    valor_raw = valor_raw.replace(",", ".").replace("€", "").strip()
-    valor_raw = re.sub(r"\s+", "", valor_raw)
-    try:
-        return Decimal(valor_raw)
-    except InvalidOperation:
-        return Decimal("0")
-
 def carregar_artistas_para_filtro(caminho_arquivo: str) -> Set[str]:
     """
     Carrega nomes de artistas de um arquivo de texto para serem usados como filtro.
@@ -219,106 +183,32 @@ def obter_mapeamento_artistas(ano_alvo: int, artistas_para_filtrar: Set[str]) ->
 # 3. Processamento de Arquivos
 # =================================================================
 
-def processar_arquivo_unificado(caminho: str, ano: int, mes_padrao: int, artistas_para_filtrar: Set[str]):
+def arquivo_inalterado(anterior, caminho: str, stat: os.stat_result) -> bool:
     """
-    Função unificada para processar arquivos, com filtragem da gravadora "Rozenblit"
-    e agora com filtro de artistas.
+    True se o arquivo é o mesmo da última importação. Tamanho e mtime iguais bastam;
+    se só o mtime mudou (cópia, download de novo), o hash decide e o registro é atualizado.
     """
-    nome_arquivo = os.path.basename(caminho)
-    logger.info(f"Iniciando processamento: {nome_arquivo}")
-    
-    df = None
-    try:
-        if caminho.endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(caminho, dtype=str, engine='openpyxl')
-        else: # Assumir CSV
-            try:
-                df = pd.read_csv(caminho, sep=';', thousands='.', decimal=',', encoding='utf-8', dtype=str, on_bad_lines='skip')
-            except Exception:
-                df = pd.read_csv(caminho, sep=';', thousands='.', decimal=',', encoding='latin-1', dtype=str, on_bad_lines='skip', engine='python')
-    except Exception as e:
-        logger.error(f"Erro ao ler {nome_arquivo}: {e}")
-        return [], 0
-
-    if df is None or df.empty:
-        logger.warning(f"Arquivo {nome_arquivo} vazio ou inválido.")
-        return [], 0
-
-    colunas = identificar_colunas(df)
-    if not colunas:
-        logger.error(f"Colunas essenciais não identificadas no arquivo: {nome_arquivo}")
-        return [], len(df)
-
-    col_artista = colunas["artista"]
-    col_lucro = colunas["lucro"]
-    col_titulo = colunas.get("titulo")
-    col_gravadora = colunas.get("gravadora")
-    col_mes_relatorio = colunas.get("mes_relatorio")
-    
-    logger.info(f"Colunas identificadas para '{nome_arquivo}': {colunas}")
-    
-    registros = []
-    linhas_invalidas = 0
-    linhas_filtradas_rozenblit = 0
-    linhas_filtradas_artista = 0
-
-    df_processar = df[df[col_artista].notna() & df[col_lucro].notna()].copy()
-    linhas_invalidas += len(df) - len(df_processar)
-
-    for _, row in df_processar.iterrows():
-        try:
-            nome_artista_planilha = str(row[col_artista]).strip()
-            nome_artista_normalizado = normalizar_nome_artista(nome_artista_planilha)
+    if anterior is None or not anterior.hash_conteudo:
+        return False
+    if anterior.tamanho_bytes == stat.st_size and anterior.mtime == stat.st_mtime:
+        return True
+    if anterior.tamanho_bytes != stat.st_size or calcular_hash_arquivo(caminho) != anterior.hash_conteudo:
+        return False
 
-            # LÓGICA DE FILTRAGEM 1: Artista
-            if artistas_para_filtrar and nome_artista_normalizado not in artistas_para_filtrar:
-                linhas_filtradas_artista += 1
-                continue
-
-            # LÓGICA DE FILTRAGEM 2: Gravadora "Rozenblit"
-            if col_gravadora and str(row.get(col_gravadora, '')).lower().strip() == 'rozenblit':
-                linhas_filtradas_rozenblit += 1
-                continue
+    anterior.mtime = stat.st_mtime
+    db.session.commit()
+    return True
 
-            valor = parse_valor(row[col_lucro])
-            if valor == 0:
-                linhas_invalidas += 1
-                continue
-
-            mes_final = mes_padrao
-            if col_mes_relatorio:
-                valor_mes_coluna = str(row.get(col_mes_relatorio, '')).strip()
-                if valor_mes_coluna:
-                    data_parseada = None
-                    for fmt in ('%d/%m/%Y', '%d/%m/%y', '%Y-%m-%d', '%m/%Y', '%m/%y', '%Y/%m/%d', '%Y-%m-%d %H:%M:%S'):
-                        try:
-                            data_parseada = datetime.strptime(valor_mes_coluna, fmt)
-                            break
-                        except ValueError:
-                            continue
-                    
-                    if data_parseada:
-                        mes_final = data_parseada.month
-
-            registros.append(RetroativoCalculado(
-                artista=nome_artista_planilha,
-                titulo=str(row.get(col_titulo, "")).strip(),
-                lucro_liquido=valor,
-                ano=int(ano),
-                mes=int(mes_final),
-                origem_planilha=nome_arquivo
-            ))
-        except Exception as e:
-            logger.warning(f"Linha inválida ignorada em '{nome_arquivo}': {row.to_dict()}. Erro: {e}")
-            linhas_invalidas += 1
 
-    logger.info(f"Processamento de '{nome_arquivo}' concluído. Linhas válidas: {len(registros)}, Linhas filtradas (Rozenblit): {linhas_filtradas_rozenblit}, Linhas filtradas (Artista): {linhas_filtradas_artista}, Linhas inválidas: {linhas_invalidas}")
-    return registros, (linhas_invalidas + linhas_filtradas_rozenblit + linhas_filtradas_artista)
-
-def processar_arquivos_retroativos(ano_alvo: int, artistas_para_filtrar: Set[str], pasta_base="static/uploads/retroativos"):
+def processar_arquivos_retroativos(ano_alvo: int, artistas_para_filtrar: Set[str], pasta_base="static/uploads/retroativos",
+                                   workers: int = 1):
     """
-    Processa todos os arquivos de retroativos para um ano específico,
-    salvando os dados no banco de dados após a leitura de cada arquivo.
+    Processa os arquivos de retroativos novos ou alterados de um ano, trocando no banco
+    as linhas de cada um (origem_planilha) numa transação por arquivo.
+
+    Com `workers` > 1 as planilhas são lidas em processos separados; a gravação continua
+    num único escritor, na ordem dos arquivos, então o banco fica igual ao de workers=1.
+    Retorna os pares (artista, título) dos arquivos processados nesta execução.
     """
     subpasta_ano = None
     subpastas = glob.glob(os.path.join(pasta_base, f"*{ano_alvo}*"))
@@ -334,10 +224,16 @@ def processar_arquivos_retroativos(ano_alvo: int, artistas_para_filtrar: Set[str
     todos_titulos = set()
     total_registros_salvos = 0
     total_arquivos_processados = 0
+    total_arquivos_inalterados = 0
 
     arquivos_encontrados = sorted(os.listdir(subpasta_ano))
     logger.info(f"Encontrados {len(arquivos_encontrados)} arquivos na pasta '{subpasta_ano}'.")
 
+    importados = {a.nome_arquivo: a for a in RetroativoArquivo.query.filter_by(ano=ano_alvo).all()}
+    arquivos_na_pasta = set()
+    pendentes = []
+    identidades = {}
+
     for nome_arquivo in arquivos_encontrados:
         caminho_completo = os.path.join(subpasta_ano, nome_arquivo)
         
@@ -345,37 +241,79 @@ def processar_arquivos_retroativos(ano_alvo: int, artistas_para_filtrar: Set[str
             logger.warning(f"Arquivo ignorado: {nome_arquivo}")
             continue
 
+        if os.path.isdir(caminho_completo):
+            continue
+
+        arquivos_na_pasta.add(nome_arquivo)
+        stat = os.stat(caminho_completo)
+        if arquivo_inalterado(importados.get(nome_arquivo), caminho_completo, stat):
+            total_arquivos_inalterados += 1
+            logger.info(f"⏭️ '{nome_arquivo}' sem alterações desde a última importação.")
+            continue
+
         mes_do_nome_arquivo = 0
         if nome_arquivo.split(' ')[0].isdigit():
             mes_do_nome_arquivo = int(nome_arquivo.split(' ')[0])
 
-        registros_do_arquivo, registros_invalidos = processar_arquivo_unificado(caminho_completo, ano_alvo, mes_do_nome_arquivo, artistas_para_filtrar)
-        
-        if registros_do_arquivo:
+        # Hash e stat de antes da leitura: se o arquivo mudar no meio, a próxima execução o relê
+        identidades[nome_arquivo] = (calcular_hash_arquivo(caminho_completo), stat)
+        pendentes.append((nome_arquivo, caminho_completo, mes_do_nome_arquivo, ano_alvo, artistas_para_filtrar))
+
+    with CarregadorRetroativos() as carregador:
+        for pendente, resultado in zip(pendentes, ler_pendentes(pendentes, workers)):
+            nome_arquivo, caminho_completo, mes_do_nome_arquivo = pendente[:3]
+            if resultado is None:
+                # Leitura falhou: as linhas e o registro anteriores ficam como estão e
+                # o arquivo é tentado de novo na próxima execução
+                continue
+            registros_do_arquivo, registros_invalidos, colunas = resultado
+
+            if not colunas:
+                # Sem registro: o arquivo é tentado de novo na próxima execução
+                continue
+
+            hash_conteudo, stat = identidades[nome_arquivo]
+            arquivo_salvo = {
+                'nome': nome_arquivo,
+                'nome_arquivo': nome_arquivo,
+                'ano': ano_alvo,
+                'mes': mes_do_nome_arquivo,
+                'registros_validos': len(registros_do_arquivo),
+                'registros_invalidos': registros_invalidos,
+                'colunas_detectadas': json.dumps(colunas, ensure_ascii=False),
+                'hash_conteudo': hash_conteudo,
+                'tamanho_bytes': stat.st_size,
+                'mtime': stat.st_mtime,
+            }
             try:
-                db.session.bulk_save_objects(registros_do_arquivo)
-                arquivo_salvo = RetroativoArquivo(
-                    nome=nome_arquivo,
-                    nome_arquivo=nome_arquivo,
-                    ano=ano_alvo,
-                    mes=mes_do_nome_arquivo,
-                    registros_validos=len(registros_do_arquivo),
-                    registros_invalidos=registros_invalidos
-                )
-                db.session.add(arquivo_salvo)
-                db.session.commit()
-                logger.info(f"💾 Dados de '{nome_arquivo}' salvos com sucesso.")
-                total_registros_salvos += len(registros_do_arquivo)
+                linhas, segundos = carregador.substituir_arquivo(
+                    ano_alvo, nome_arquivo,
+                    registros_do_arquivo[COLUNAS_REGISTRO].itertuples(index=False, name=None),
+                    arquivo_salvo)
+                taxa = f"{linhas / segundos:,.0f} linhas/s" if segundos else "-"
+                logger.info(f"💾 Dados de '{nome_arquivo}' salvos com sucesso: {linhas} linhas em {segundos:.2f}s ({taxa}).")
+                total_registros_salvos += linhas
                 total_arquivos_processados += 1
             except Exception as e:
-                db.session.rollback()
                 logger.error(f"Erro ao salvar dados de '{nome_arquivo}': {e}")
-            
-            for r in registros_do_arquivo:
-                if r.titulo:
-                    todos_titulos.add((r.artista, r.titulo))
+                continue
+
+            com_titulo = registros_do_arquivo[registros_do_arquivo['titulo'] != ""]
+            todos_titulos.update(zip(com_titulo['artista'], com_titulo['titulo']))
+
+        removidos = sorted(set(importados) - arquivos_na_pasta)
+        if removidos:
+            try:
+                carregador.remover_arquivos(ano_alvo, removidos)
+                logger.info(f"🗑️ Removidos os dados de {len(removidos)} arquivo(s) que saíram da pasta: {removidos}")
+            except Exception as e:
+                logger.error(f"Erro ao remover dados de arquivos que saíram da pasta: {e}")
+
+    if carregador.linhas_por_segundo:
+        logger.info(f"⏱️ Gravação: {carregador.linhas_gravadas} linhas em {carregador.segundos_gravando:.2f}s "
+                    f"({carregador.linhas_por_segundo:,.0f} linhas/s)")
     
-    logger.info(f"Total de arquivos processados: {total_arquivos_processados}")
+    logger.info(f"Total de arquivos processados: {total_arquivos_processados} (sem alterações: {total_arquivos_inalterados})")
     logger.info(f"Total de registros processados e salvos: {total_registros_salvos}")
 
     return todos_titulos
@@ -384,9 +322,11 @@ def processar_arquivos_retroativos(ano_alvo: int, artistas_para_filtrar: Set[str
 # 4. Função Principal e Relatório
 # =================================================================
 
-def main(ano_alvo: int):
+def main(ano_alvo: int, completo: bool = False, workers: int = 1):
     """
     Função principal que orquestra o processamento e a geração do relatório.
+    Com `completo`, apaga os dados do ano antes e reprocessa todos os arquivos;
+    `workers` é o número de processos de leitura das planilhas.
     """
     if db is None or app is None:
         logger.error("A aplicação Flask ou o banco de dados não foram inicializados. Verifique as dependências.")
@@ -405,15 +345,16 @@ def main(ano_alvo: int):
         if not artistas_para_filtrar:
             logger.warning("Nenhum artista encontrado no arquivo de filtro. O script continuará sem filtrar por artista.")
 
-        # Limpar dados antigos
-        db.session.query(RetroativoCalculado).filter_by(ano=ano_alvo).delete()
-        db.session.query(RetroativoArquivo).filter_by(ano=ano_alvo).delete()
-        logger.info(f"Iniciando limpeza de dados antigos para o ano {ano_alvo}...")
-        db.session.commit()
-        logger.info(f"Limpeza de dados do ano {ano_alvo} concluída.")
+        if completo:
+            db.session.query(RetroativoCalculado).filter_by(ano=ano_alvo).delete()
+            db.session.query(RetroativoArquivo).filter_by(ano=ano_alvo).delete()
+            db.session.query(RetroativoMensal).filter_by(ano=ano_alvo).delete()
+            logger.info(f"Iniciando limpeza de dados antigos para o ano {ano_alvo}...")
+            db.session.commit()
+            logger.info(f"Limpeza de dados do ano {ano_alvo} concluída.")
 
         # Processar arquivos e salvar em lote
-        todos_titulos = processar_arquivos_retroativos(ano_alvo, artistas_para_filtrar)
+        todos_titulos = processar_arquivos_retroativos(ano_alvo, artistas_para_filtrar, workers=workers)
 
         # Buscar todos os registros do banco de dados para criar o mapeamento e o relatório
         logger.info("Iniciando a busca e consolidação dos dados para o relatório...")
@@ -531,16 +472,16 @@ def consolidar_e_gerar_relatorio(ano_alvo: int, artista_mapeamento: Dict[str, st
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        logger.error("Uso: python processar_retroativos.py <ano>")
-        sys.exit(1)
-    
+    parser = argparse.ArgumentParser(description="Importa as planilhas de retroativos de um ano.")
+    parser.add_argument('ano', type=int, help="Ano das planilhas (pasta static/uploads/retroativos/*<ano>*)")
+    parser.add_argument('--completo', action='store_true',
+                        help="Apaga os dados do ano e reprocessa todos os arquivos, mesmo os já importados")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Processos para ler as planilhas (padrão: 1, sem paralelismo; até o número de CPUs)")
+    args = parser.parse_args()
+
     try:
-        ano = int(sys.argv[1])
-        main(ano)
-    except ValueError:
-        logger.error("O ano deve ser um número inteiro.")
-        sys.exit(1)
+        main(args.ano, completo=args.completo, workers=args.workers)
     except Exception as e:
         logger.error(f"Ocorreu um erro inesperado: {e}", exc_info=True)
         sys.exit(1)
@@ -1,19 +1,31 @@
 # retroativos_models.py
 from extensions import db
 from datetime import datetime
+from sqlalchemy import inspect, text
 
 
 class RetroativoCalculado(db.Model):
     __tablename__ = 'retroativos_calculados'
     __bind_key__ = 'retroativos'
+    __table_args__ = (
+        # Reprocessar um arquivo troca só as linhas dele (ver processar_retroativos.py)
+        db.Index('ix_retroativos_calculados_ano_origem', 'ano', 'origem_planilha'),
+        # Recálculo do resumo mensal dos artistas de um arquivo
+        db.Index('ix_retroativos_calculados_ano_artista', 'ano', 'artista'),
+        db.Index('ix_retroativos_calculados_artista_norm_ano_mes', 'artista_norm', 'ano', 'mes'),
+        db.Index('ix_retroativos_calculados_artista_norm_titulo_norm', 'artista_norm', 'titulo_norm'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artista = db.Column(db.String(255), nullable=False)
     ano = db.Column(db.Integer, nullable=False)
-    mes = db.Column(db.Integer, nullable=False)  # Corrigido
+    mes = db.Column(db.Integer, nullable=False)  # Sempre número (1-12); ver normalizar_retroativos_existentes
     titulo = db.Column(db.String(255), nullable=True)
     lucro_liquido = db.Column(db.Numeric(20, 8), nullable=False)
     origem_planilha = db.Column(db.String(255), nullable=True)
+    # Chaves de busca dos relatórios (minúsculas, sem espaços nas pontas)
+    artista_norm = db.Column(db.String(255), nullable=True)
+    titulo_norm = db.Column(db.String(255), nullable=True)
 
 
 class RetroativoArquivo(db.Model):
@@ -27,6 +39,83 @@ class RetroativoArquivo(db.Model):
     mes = db.Column(db.Integer, nullable=False)  # Corrigido
     registros_validos = db.Column(db.Integer, default=0)
     registros_invalidos = db.Column(db.Integer, default=0)
+    colunas_detectadas = db.Column(db.Text, nullable=True)  # JSON {artista, lucro, ...} → cabeçalho da planilha
+    hash_conteudo = db.Column(db.String(64), nullable=True)  # SHA-256 do arquivo processado
+    tamanho_bytes = db.Column(db.Integer, nullable=True)
+    mtime = db.Column(db.Float, nullable=True)  # os.stat().st_mtime no processamento
+
+
+class RetroativoMensal(db.Model):
+    """
+    Soma de lucro_liquido por (artista, título, ano, mês), mantida pela importação
+    (services/retroativos_service.py). Os relatórios de retroativos leem daqui, não das linhas.
+    """
+    __tablename__ = 'retroativos_mensais'
+    __bind_key__ = 'retroativos'
+    __table_args__ = (
+        db.UniqueConstraint('artista', 'titulo', 'ano', 'mes', name='uq_retroativos_mensais_chave'),
+        db.Index('ix_retroativos_mensais_ano', 'ano'),
+        db.Index('ix_retroativos_mensais_artista_norm_ano_mes', 'artista_norm', 'ano', 'mes'),
+        db.Index('ix_retroativos_mensais_artista_norm_titulo_norm', 'artista_norm', 'titulo_norm'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    artista = db.Column(db.String(255), nullable=False)
+    titulo = db.Column(db.String(255), nullable=True)
+    ano = db.Column(db.Integer, nullable=False)
+    mes = db.Column(db.Integer, nullable=False)
+    lucro_liquido = db.Column(db.Numeric(20, 8), nullable=False)
+    linhas = db.Column(db.Integer, nullable=False, default=0)
+    artista_norm = db.Column(db.String(255), nullable=True)
+    titulo_norm = db.Column(db.String(255), nullable=True)
+
+
+# O banco de retroativos é criado por create_all (fora das migrações do Alembic):
+# colunas novas em tabelas já existentes entram aqui e são adicionadas na inicialização.
+COLUNAS_ADICIONADAS = {
+    'retroativos_arquivos': {
+        'colunas_detectadas': 'TEXT',
+        'hash_conteudo': 'VARCHAR(64)',
+        'tamanho_bytes': 'INTEGER',
+        'mtime': 'FLOAT',
+    },
+    'retroativos_calculados': {
+        'artista_norm': 'VARCHAR(255)',
+        'titulo_norm': 'VARCHAR(255)',
+    },
+    'retroativos_mensais': {
+        'artista_norm': 'VARCHAR(255)',
+        'titulo_norm': 'VARCHAR(255)',
+    },
+}
+TABELAS_RETROATIVOS = ('retroativos_calculados', 'retroativos_arquivos', 'retroativos_mensais')
+
+
+def atualizar_esquema_retroativos(engine):
+    """
+    Adiciona ao banco de retroativos as colunas de COLUNAS_ADICIONADAS que ainda não existem
+    e cria os índices declarados nos modelos (create_all só os cria em tabelas novas).
+    Retorna os pares (tabela, coluna) adicionados agora.
+    """
+    inspetor = inspect(engine)
+    tabelas = set(inspetor.get_table_names())
+    adicionadas = set()
+    with engine.begin() as conexao:
+        for tabela, colunas in COLUNAS_ADICIONADAS.items():
+            if tabela not in tabelas:
+                continue
+            existentes = {coluna['name'] for coluna in inspetor.get_columns(tabela)}
+            for nome, tipo in colunas.items():
+                if nome not in existentes:
+                    conexao.execute(text(f'ALTER TABLE {tabela} ADD COLUMN {nome} {tipo}'))
+                    adicionadas.add((tabela, nome))
+
+        for nome_tabela in TABELAS_RETROATIVOS:
+            for indice in db.Model.metadata.tables[nome_tabela].indexes:
+                indice.create(bind=conexao, checkfirst=True)
+    return adicionadas
+
+
 class RetroativoTitulo(db.Model):
     __tablename__ = "retroativos_titulos"
 
@@ -1,8 +1,35 @@
 # services/calculos_service.py
 from models import CalculoSalvo, CalculoEspecialSalvo, CalculoAssisaoSalvo, Artista, ArtistaEspecial
-from typing import List, Dict, Any, Optional
+from extensions import db
+from typing import List, Dict, Any, Optional, Tuple
 from flask import current_app
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, localcontext
+from types import SimpleNamespace
+import json
+
+import pandas as pd
+from pytz import timezone
+from rapidfuzz import fuzz
+
+from services.correspondencia_service import (
+    CasadorTitulos,
+    IndiceAliases,
+    normalizar_texto,
+    obter_indice_aliases,
+    resolver_nomes,
+    somar_lucro_por_artista,
+)
+from services.dinheiro_service import converter_distintos
+from services.planilhas_service import obter_extrato
+
+# Abaixo disso o custo de subir os processos supera o ganho
+MINIMO_ARTISTAS_POOL = 8
+
+NOMES_MESES = [
+    'Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho',
+    'Julho', 'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro'
+]
 
 def construir_calculos_disponiveis() -> List[Dict[str, Any]]:
     """
@@ -109,4 +136,390 @@ def construir_calculos_disponiveis() -> List[Dict[str, Any]]:
 
     except Exception as e:
         current_app.logger.error(f"Erro geral ao construir cálculos: {str(e)}", exc_info=True)
-        return []
\ No newline at end of file
+        return []
+
+
+# ------------------- CORRESPONDÊNCIA (cálculos especial e assisão) -------------------
+
+def titulo_corresponde(titulo_planilha, titulo_cadastrado):
+    titulo1 = normalizar_texto(titulo_planilha)
+    titulo2 = normalizar_texto(titulo_cadastrado)
+    return fuzz.token_sort_ratio(titulo1, titulo2) >= 90
+
+
+def nome_corresponde(nome_planilha, artista_obj):
+    nome_planilha = normalizar_texto(nome_planilha)
+    nomes_validos = [normalizar_texto(artista_obj.nome)] + artista_obj.obter_variacoes()
+
+    for nome_valid in nomes_validos:
+        nome_cad = normalizar_texto(nome_valid)
+        if nome_planilha == nome_cad:
+            return True
+        if nome_cad in nome_planilha or nome_planilha in nome_cad:
+            return True
+        partes_plan = nome_planilha.split()
+        partes_cad = nome_cad.split()
+        if all(any(fuzz.ratio(p_cad, p_plan) >= 85 for p_plan in partes_plan) for p_cad in partes_cad):
+            return True
+        if fuzz.token_sort_ratio(nome_planilha, nome_cad) >= 90:
+            return True
+    return False
+
+
+def converter_lucro(valor):
+    try:
+        return Decimal(str(valor).replace(",", ".")).quantize(Decimal("0.00000000000001"))
+    except:
+        return Decimal("0.00000000000000")
+
+
+# ------------------- CÁLCULO ESPECIAL -------------------
+
+def preparar_extrato_especial(extrato: pd.DataFrame) -> pd.DataFrame:
+    """Colunas usadas pelo cálculo especial, montadas uma vez por extrato (ver obter_extrato)."""
+    return extrato.assign(
+        titulo_normalizado=extrato['titulo'].map(normalizar_texto).astype(str),
+        lucro=extrato['lucro'].fillna(Decimal('0.0000')),
+        **{'Nome do artista': extrato['artista'].astype(str)}
+    )
+
+
+def calcular_especial_artista(df: pd.DataFrame, artista, cotacao_valor,
+                              nomes_aceitos=None) -> Tuple[Decimal, Decimal, List[Dict], List[str]]:
+    """
+    Cálculo de /calculos_especiais para um ArtistaEspecial sobre um extrato preparado.
+    `nomes_aceitos` (valores de 'Nome do artista' do artista) pode vir pronto do índice de apelidos.
+    Retorna (total_eur, total_brl, resultados_detalhados, avisos).
+    """
+    if nomes_aceitos is None:
+        nomes_validos = [normalizar_texto(artista.nome)] + [
+            normalizar_texto(v) for v in artista.obter_variacoes()
+        ]
+        nomes_aceitos = {nome for nome in df['Nome do artista'].unique() if normalizar_texto(nome) in nomes_validos}
+    df = df[df['Nome do artista'].isin(nomes_aceitos)]
+
+    avisos = []
+    titulos_dict = {}
+    for t in artista.titulos:
+        try:
+            percentual_str = str(t.percentual).replace(',', '.').strip()
+            titulos_dict[t.titulo] = Decimal(percentual_str)
+        except (InvalidOperation, ValueError):
+            avisos.append(f"Percentual inválido para o título '{t.titulo}': '{t.percentual}'")
+            continue
+
+    resultados_detalhados = []
+    total_eur = Decimal('0')
+    total_brl = Decimal('0')
+    casador = CasadorTitulos(df['titulo_normalizado'], df['lucro'])
+    matriz = casador.similaridades([normalizar_texto(titulo) for titulo in titulos_dict])
+
+    for notas, (titulo, percentual) in zip(matriz, titulos_dict.items()):
+        posicoes = casador.casados(notas)
+        matches = [(casador.titulos[p], float(notas[p])) for p in posicoes]
+
+        valor_titulo_eur = Decimal('0')
+        if len(posicoes):
+            lucro_total = casador.soma(posicoes)
+            valor_titulo_eur = lucro_total * (percentual / Decimal('100'))
+            total_eur += valor_titulo_eur
+
+        valor_titulo_brl = valor_titulo_eur * Decimal(str(cotacao_valor))
+        total_brl += valor_titulo_brl
+
+        resultados_detalhados.append({
+            'titulo': titulo,
+            'titulos_match': [m[0] for m in matches],
+            'similaridades': [m[1] for m in matches],
+            'valor_eur': valor_titulo_eur.quantize(Decimal('0.0001')),
+            'valor_brl': valor_titulo_brl.quantize(Decimal('0.01')),
+            'percentual': percentual
+        })
+
+    return total_eur.quantize(Decimal('0.0001')), total_brl.quantize(Decimal('0.01')), resultados_detalhados, avisos
+
+
+# ------------------- CÁLCULO ASSISÃO -------------------
+
+def preparar_extrato_assisao(df_original: pd.DataFrame) -> pd.DataFrame:
+    """Normaliza nomes, títulos e lucro do extrato uma vez para todos os artistas da assisão."""
+    df = df_original.copy()
+    df['nome_artista_normalizado'] = df['nome_artista_normalizado'].astype(str).apply(normalizar_texto)
+    df['titulo_normalizado'] = df['titulo_normalizado'].astype(str).apply(normalizar_texto)
+    # Lucro em Decimal e em unidades de 10^-14 (ver dinheiro_service), um valor distinto por vez
+    df['lucro'], df['lucro_unidades'], df['lucro_cabe'] = converter_distintos(df['lucro'], converter_lucro)
+    return df
+
+
+def calcular_assisao_preparado(df, artista_obj, titulos_dict, cotacao_valor, nomes_aceitos=None,
+                               indice: Optional[IndiceAliases] = None):
+    # Filtra somente os nomes do artista (com variações), testando cada nome distinto uma vez
+    if nomes_aceitos is None and indice is not None:
+        nomes_aceitos = {
+            nome for nome, ids in resolver_nomes(indice, 'assisao', df['nome_artista_normalizado'].unique()).items()
+            if artista_obj.id in ids
+        }
+    elif nomes_aceitos is None:
+        nomes_aceitos = {
+            nome for nome in df['nome_artista_normalizado'].unique() if nome_corresponde(nome, artista_obj)
+        }
+    df_filtrado = df[df['nome_artista_normalizado'].isin(nomes_aceitos)]
+
+    resultados = []
+    casador = CasadorTitulos(df_filtrado['titulo_normalizado'], df_filtrado['lucro'],
+                             df_filtrado['lucro_unidades'], df_filtrado['lucro_cabe'])
+    matriz = casador.similaridades([normalizar_texto(titulo) for titulo in titulos_dict])
+
+    for notas, (titulo_original, percentual) in zip(matriz, titulos_dict.items()):
+        percentual_str = str(percentual).replace('%', '').replace(',', '.').strip()
+
+        try:
+            percentual_decimal = Decimal(percentual_str)
+        except:
+            continue
+
+        # Só o primeiro título da planilha (ordem de unique()) com token_sort_ratio ≥ 90,
+        # para evitar múltiplas contagens do mesmo título
+        posicoes = casador.casados(notas)
+        if not len(posicoes):
+            continue
+        titulo_plan = casador.titulos[posicoes[0]]
+        lucro_total = casador.somas[posicoes[0]].quantize(Decimal('0.00000000000001'))
+        valor_aplicado = (lucro_total * percentual_decimal / Decimal('100')).quantize(Decimal('0.00000000000001'))
+        valor_brl = (valor_aplicado * Decimal(str(cotacao_valor))).quantize(Decimal('0.01'))
+
+        resultados.append({
+            'titulo': titulo_original,
+            'valor_eur': valor_aplicado,
+            'valor_brl': valor_brl,
+            'lucro_total': lucro_total,
+            'percentual': percentual_decimal,
+            'match': titulo_plan
+        })
+
+    total_eur = sum([r['valor_eur'] for r in resultados], Decimal('0')).quantize(Decimal('0.0001'))
+    total_brl = (total_eur * Decimal(str(cotacao_valor))).quantize(Decimal('0.01'))
+
+    return total_eur, total_brl, resultados
+
+
+def calcular_valores_assisao(df_original, artista_obj, titulos_dict, cotacao_valor,
+                             indice: Optional[IndiceAliases] = None):
+    return calcular_assisao_preparado(preparar_extrato_assisao(df_original), artista_obj, titulos_dict,
+                                      cotacao_valor, indice=indice)
+
+
+# ------------------- FECHAMENTO EM LOTE -------------------
+
+class ArtistaLote:
+    """Cópia simples de um ArtistaEspecial e seus títulos, que pode ir para outro processo."""
+
+    def __init__(self, artista):
+        self.id = artista.id
+        self.nome = artista.nome
+        self.tipo = artista.tipo
+        self.variacoes = artista.variacoes
+        self.titulos = [SimpleNamespace(titulo=t.titulo, percentual=t.percentual) for t in artista.titulos]
+
+    def obter_variacoes(self):
+        return self.variacoes.split('||') if self.variacoes else []
+
+
+def preparar_extratos_especiais(extrato: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Extratos preparados para os fluxos especial e assisão, a partir do extrato normalizado."""
+    df_especial = preparar_extrato_especial(extrato)
+    df_assisao = preparar_extrato_assisao(extrato.rename(columns={
+        'artista': 'nome_artista_normalizado',
+        'titulo': 'titulo_normalizado'
+    }))
+    return df_especial, df_assisao
+
+
+def resolver_nomes_especiais(extrato: pd.DataFrame, especiais) -> Dict[int, set]:
+    """
+    Nomes da planilha aceitos por ArtistaEspecial, resolvidos uma vez por nome distinto no
+    índice de apelidos: igualdade para 'especial' (valores de 'Nome do artista') e a regra
+    de nome_corresponde para 'assisao' (nomes já normalizados).
+    """
+    indice = obter_indice_aliases()
+    nomes_por_artista = {artista.id: set() for artista in especiais}
+    tipos = {artista.id: artista.tipo for artista in especiais}
+
+    nomes = extrato['artista'].astype(str).unique()
+    for nome in nomes:
+        for artista_id in indice.especiais_exatos(nome):
+            if tipos.get(artista_id) == 'especial':
+                nomes_por_artista[artista_id].add(nome)
+
+    normalizados = {normalizar_texto(nome) for nome in nomes}
+    for normalizado, ids in resolver_nomes(indice, 'assisao', normalizados).items():
+        for artista_id in ids:
+            if tipos.get(artista_id) == 'assisao':
+                nomes_por_artista[artista_id].add(normalizado)
+    return nomes_por_artista
+
+
+def calcular_artista_especial(artista, df_especial, df_assisao, cotacao_valor,
+                              nomes_aceitos=None) -> Tuple[Dict[str, Any], List[str]]:
+    """Cálculo de um ArtistaEspecial conforme o tipo. Retorna (item do fechamento, avisos)."""
+    if artista.tipo == 'especial':
+        total_eur, total_brl, detalhes, avisos = calcular_especial_artista(
+            df_especial, artista, cotacao_valor, nomes_aceitos)
+        avisos = [f"{artista.nome}: {aviso}" for aviso in avisos]
+    else:
+        titulos_dict = {t.titulo: t.percentual for t in artista.titulos}
+        total_eur, total_brl, detalhes = calcular_assisao_preparado(
+            df_assisao, artista, titulos_dict, cotacao_valor, nomes_aceitos)
+        avisos = []
+
+    item = {
+        'artista_id': artista.id,
+        'artista': artista.nome,
+        'valor_eur': total_eur,
+        'valor_brl': total_brl,
+        'detalhes': detalhes,
+    }
+    return item, avisos
+
+
+def calcular_fechamento(arquivo, cotacao_valor: Decimal, mes: int, ano: int,
+                        workers: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Fechamento mensal de uma planilha: calcula todos os Artista (regra de /calcular) e todos
+    os ArtistaEspecial, tipo 'especial' (/calculos_especiais) e 'assisao' (/calculo_assisao),
+    lendo e preparando o extrato uma única vez.
+
+    Com `workers` > 1, os ArtistaEspecial (casamento de títulos, a parte cara) são divididos
+    entre os processos do pool (services/pool_calculos_service.py); os artistas normais já saem de uma única passada vetorizada.
+
+    Retorna {'normal': [...], 'especial': [...], 'assisao': [...], 'avisos': [...]}, cada item
+    com artista_id, artista, valor_eur e valor_brl (Decimal), mais os detalhes do cálculo.
+    """
+    resultado = {'normal': [], 'especial': [], 'assisao': [], 'avisos': []}
+    cotacao_valor = Decimal(str(cotacao_valor))
+
+    with localcontext() as ctx:
+        ctx.prec = 20
+        ctx.rounding = ROUND_HALF_UP
+
+        extrato = obter_extrato(arquivo)
+
+        # Artistas normais: uma passada com os totais de todos
+        artistas = Artista.query.order_by(Artista.nome.asc()).all()
+        totais_lucro = somar_lucro_por_artista([extrato], artistas)
+        for artista in artistas:
+            try:
+                percentual = Decimal(str(artista.percentual).replace(',', '.')) / Decimal("100")
+            except (InvalidOperation, ValueError):
+                resultado['avisos'].append(f"Percentual inválido para o artista '{artista.nome}': '{artista.percentual}'")
+                continue
+            total_lucro_eur = totais_lucro[artista.id]
+            valor_eur = (total_lucro_eur * percentual).quantize(Decimal('0.0001'))
+            resultado['normal'].append({
+                'artista_id': artista.id,
+                'artista': artista.nome,
+                'lucro_liquido': total_lucro_eur.quantize(Decimal('0.00000000000001')),
+                'valor_eur': valor_eur,
+                'valor_brl': (valor_eur * cotacao_valor).quantize(Decimal('0.01')),
+            })
+
+        try:
+            obter_extrato(arquivo, exigir_titulo=True)
+        except ValueError:
+            resultado['avisos'].append("A planilha não tem a coluna de título: cálculos especiais e assisão ignorados.")
+            return resultado
+
+        especiais = [
+            artista for artista in ArtistaEspecial.query.order_by(ArtistaEspecial.nome).all()
+            if artista.tipo in ('especial', 'assisao')
+        ]
+        nomes_por_artista = resolver_nomes_especiais(extrato, especiais)
+
+        calculados = None
+        if workers and workers > 1 and len(especiais) >= MINIMO_ARTISTAS_POOL:
+            # Importado aqui: o módulo do pool importa este (é o alvo das tarefas dos processos)
+            from services.pool_calculos_service import calcular_especiais_em_pool
+            try:
+                calculados = calcular_especiais_em_pool(extrato, especiais, cotacao_valor, workers,
+                                                        nomes_por_artista)
+            except Exception as e:
+                current_app.logger.warning(f"Pool de cálculo indisponível, seguindo em um processo: {e}")
+
+        if calculados is None:
+            df_especial, df_assisao = preparar_extratos_especiais(extrato)
+            calculados = [
+                calcular_artista_especial(artista, df_especial, df_assisao, cotacao_valor,
+                                          nomes_por_artista[artista.id])
+                for artista in especiais
+            ]
+
+        for artista, (item, avisos) in zip(especiais, calculados):
+            resultado[artista.tipo].append(item)
+            resultado['avisos'].extend(avisos)
+
+    return resultado
+
+
+def salvar_fechamento(resultado: Dict[str, Any], arquivo, cotacao_valor: Decimal, mes: int, ano: int,
+                      incluir_zerados: bool = False) -> Dict[str, int]:
+    """
+    Persiste o resultado de calcular_fechamento em CalculoSalvo, CalculoEspecialSalvo e
+    CalculoAssisaoSalvo numa única transação. Por padrão artistas sem valor não geram registro.
+    Retorna a quantidade gravada por tipo.
+    """
+    agora = datetime.now()
+    nome_mes = NOMES_MESES[int(mes) - 1]
+
+    def considerar(item):
+        return incluir_zerados or item['valor_eur'] != 0
+
+    normais = [CalculoSalvo(
+        artista=item['artista'],
+        artista_id=item['artista_id'],
+        valor_eur=float(item['valor_eur']),
+        valor_brl=float(item['valor_brl']),
+        cotacao=float(cotacao_valor),
+        mes=nome_mes,
+        ano=int(ano),
+        planilha_usada=arquivo.nome_arquivo,
+        data_calculo=agora
+    ) for item in resultado['normal'] if considerar(item)]
+
+    especiais = [CalculoEspecialSalvo(
+        artista=item['artista'],
+        artista_id=item['artista_id'],
+        arquivo_id=arquivo.id,
+        cotacao=float(cotacao_valor),
+        mes=nome_mes,
+        ano=str(ano),
+        valor_eur=float(item['valor_eur']),
+        valor_brl=float(item['valor_brl']),
+        data_calculo=datetime.now(timezone('America/Recife'))
+    ) for item in resultado['especial'] if considerar(item)]
+
+    assisao = [CalculoAssisaoSalvo(
+        artista=item['artista'],
+        artista_id=item['artista_id'],
+        arquivo_id=arquivo.id,
+        cotacao=float(cotacao_valor),
+        mes=int(mes),
+        ano=int(ano),
+        valor_eur=float(item['valor_eur']),
+        valor_brl=float(item['valor_brl']),
+        detalhes=json.dumps(item['detalhes'], default=str),
+        data_calculo=agora
+    ) for item in resultado['assisao'] if considerar(item)]
+
+    try:
+        db.session.bulk_save_objects(normais + especiais + assisao)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {'normal': len(normais), 'especial': len(especiais), 'assisao': len(assisao)}
+
+
+def serializar_fechamento(resultado: Dict[str, Any]) -> Dict[str, Any]:
+    """Converte os Decimals do resultado para texto (JSON), sem perder casas."""
+    return json.loads(json.dumps(resultado, default=str))
@@ -0,0 +1,109 @@
+# services/colunas_service.py
+"""
+Detecção das colunas de um extrato (artista, título, lucro, gravadora, mês do relatório)
+a partir do cabeçalho, num lugar só para o upload, os cálculos e os retroativos.
+
+Cada cabeçalho é resumido numa impressão digital (hash dos nomes na ordem do arquivo) e o
+mapeamento resolvido fica em cache: os extratos de cada mês repetem o mesmo cabeçalho,
+então a normalização dos nomes roda uma vez por formato, não uma vez por arquivo.
+"""
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+# Variantes aceitas, já normalizadas, em ordem de preferência
+VARIANTES_COLUNAS = {
+    'artista': ["nome do artista", "artista", "artist"],
+    'titulo': ["titulo do lancamento", "tatulo do lancamento", "album"],
+    'lucro': ["lucro liquido", "lucro laquido", "total da conta", "lucro"],
+    'gravadora': ["gravadora"],
+    'mes_relatorio': ["mes do relatorio", "mes"],
+}
+# Último recurso: cabeçalho que contém o termo (ex.: "Artista principal", "Título da faixa")
+TERMOS_COLUNAS = {
+    'artista': ["artista"],
+    'titulo': ["titulo", "album"],
+    'lucro': ["lucro"],
+}
+COLUNAS_OBRIGATORIAS = ('artista', 'lucro')
+COLUNAS_EXTRATO = ('artista', 'titulo', 'lucro')
+
+LIMITE_CACHE_CABECALHOS = 256
+
+_cache_mapeamentos: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def normalizar_cabecalho(coluna) -> str:
+    """Minúsculas, sem acentos, só letras, números e espaços simples."""
+    texto = unicodedata.normalize('NFKD', str(coluna)).encode('ASCII', 'ignore').decode('ASCII').lower()
+    texto = re.sub(r'[^a-z0-9 ]', '', texto)
+    return ' '.join(texto.split())
+
+
+def impressao_cabecalho(cabecalho: Iterable) -> str:
+    """Hash dos nomes do cabeçalho (sem espaços nas pontas), na ordem do arquivo."""
+    return hashlib.sha1('\x1f'.join(str(c).strip() for c in cabecalho).encode('utf-8')).hexdigest()
+
+
+def _resolver(cabecalho: List[str]) -> Dict[str, str]:
+    normalizados = {}
+    for coluna in cabecalho:
+        normalizados.setdefault(normalizar_cabecalho(coluna), coluna)
+
+    mapeamento = {}
+    for chave, variantes in VARIANTES_COLUNAS.items():
+        coluna = next((normalizados[v] for v in variantes if v in normalizados), None)
+        if coluna is None:
+            coluna = next((original for termo in TERMOS_COLUNAS.get(chave, ())
+                           for normal, original in normalizados.items() if termo in normal), None)
+        if coluna is not None:
+            mapeamento[chave] = coluna
+    return mapeamento
+
+
+def detectar_colunas(cabecalho: Iterable) -> Dict[str, str]:
+    """
+    {chave: nome da coluna no arquivo (sem espaços nas pontas)} para as colunas encontradas.
+    O resultado é guardado por impressão do cabeçalho; devolve sempre uma cópia.
+    """
+    cabecalho = [str(c).strip() for c in cabecalho]
+    impressao = impressao_cabecalho(cabecalho)
+
+    with _lock:
+        mapeamento = _cache_mapeamentos.get(impressao)
+        if mapeamento is not None:
+            _cache_mapeamentos.move_to_end(impressao)
+            return dict(mapeamento)
+
+    mapeamento = _resolver(cabecalho)
+    with _lock:
+        _cache_mapeamentos[impressao] = mapeamento
+        while len(_cache_mapeamentos) > LIMITE_CACHE_CABECALHOS:
+            _cache_mapeamentos.popitem(last=False)
+    return dict(mapeamento)
+
+
+def colunas_completas(mapeamento: Dict[str, str]) -> bool:
+    return all(mapeamento.get(chave) for chave in COLUNAS_OBRIGATORIAS)
+
+
+def colunas_projetadas(mapeamento: Dict[str, str], chaves: Iterable[str] = COLUNAS_EXTRATO) -> List[str]:
+    """Nomes das colunas a ler (usecols) para as chaves pedidas, sem repetição e na ordem das chaves."""
+    colunas = []
+    for chave in chaves:
+        coluna = mapeamento.get(chave)
+        if coluna and coluna not in colunas:
+            colunas.append(coluna)
+    return colunas
+
+
+def filtro_usecols(colunas: Optional[List[str]]):
+    """usecols para read_csv/read_excel que compara os nomes sem espaços nas pontas."""
+    if not colunas:
+        return None
+    desejadas = set(colunas)
+    return lambda coluna: str(coluna).strip() in desejadas
@@ -0,0 +1,554 @@
+# services/correspondencia_service.py
+import json
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+from extensions import db
+from models import Artista, ArtistaEspecial, CorrespondenciaNome
+from services.dinheiro_service import (
+    cabe_no_contexto,
+    converter_distintos,
+    somar_unidades,
+    unidades_para_decimal,
+)
+from utils import remover_acentos
+
+logger = logging.getLogger(__name__)
+
+PRECISAO_LUCRO = Decimal('0.00000000000001')
+LIMIAR_PARTIAL_RATIO = 88
+# Regras de nome_corresponde (cálculos especial/assisão)
+LIMIAR_RATIO_TOKEN = 85
+LIMIAR_TOKEN_SORT = 90
+# Títulos: token_sort_ratio ≥ 90; matrizes a partir deste tamanho usam todos os núcleos
+LIMIAR_TITULO = 90
+CELULAS_MATRIZ_MULTITHREAD = 10_000
+# Memo de correspondências: linhas guardadas na tabela e consultadas por IN
+LIMITE_MEMO_CORRESPONDENCIA = 200_000
+LOTE_CONSULTA_MEMO = 500
+
+
+def normalizar_nome_planilha(valor) -> str:
+    """Mesma normalização aplicada a cada linha em /calcular: str → strip → lower → sem acentos."""
+    return remover_acentos(str(valor).strip().lower())
+
+
+def normalizar_texto(texto):
+    """Normalização dos cálculos especial e assisão: só minúsculas e sem espaços nas pontas."""
+    if not isinstance(texto, str):
+        return ""
+    return texto.lower().strip()
+
+
+def nomes_equivalentes(artista) -> List[str]:
+    """Nomes aceitos para um Artista (o campo nome pode trazer vários, separados por vírgula)."""
+    return [remover_acentos(n.strip().lower()) for n in artista.nome.split(',') if n.strip()]
+
+
+def nome_pertence(nome_planilha: str, nomes_ref: List[str]) -> bool:
+    """Regra de /calcular: o nome cadastrado precisa estar contido no da planilha com partial_ratio ≥ 88."""
+    for nome_ref in nomes_ref:
+        if nome_ref in nome_planilha and fuzz.partial_ratio(nome_planilha, nome_ref) >= LIMIAR_PARTIAL_RATIO:
+            return True
+    return False
+
+
+def converter_lucro_calculo(valor) -> Optional[Decimal]:
+    """
+    Aplica a conversão do laço original de /calcular (quantize em 14 casas) a um valor de lucro.
+    Retorna None para valores que o laço descartava (inválidos ou vazios).
+    """
+    lucro_raw = str(valor).replace(",", ".").replace("€", "").strip()
+    try:
+        lucro = Decimal(lucro_raw).quantize(PRECISAO_LUCRO)
+    except (InvalidOperation, ValueError):
+        return None
+    if lucro.is_nan():
+        return None
+    return lucro
+
+
+# ------------------- ÍNDICE DE APELIDOS -------------------
+
+def _trigramas(texto: str) -> Set[str]:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceAliases:
+    """
+    Índice dos nomes aceitos de cada artista, montado uma vez e reaproveitado entre
+    requisições (ver obter_indice_aliases). Responde, para um nome da planilha, a quais
+    artistas ele pertence, com as mesmas regras das rotas:
+
+    - normais_do_nome: regra de /calcular (nome_pertence) sobre os grupos de Artista.nome;
+    - especiais_do_nome: regra de nome_corresponde (assisão) sobre ArtistaEspecial;
+    - especiais_exatos: igualdade usada por /calculos_especiais.
+
+    Os testes de "contém" usam bloqueio por trigramas (um apelido só é candidato se o seu
+    trigrama mais raro aparece no nome), e os fuzzy rodam em lote no rapidfuzz com
+    score_cutoff. Todo candidato é confirmado com a regra original.
+    """
+
+    def __init__(self, normais: Iterable[Tuple[int, str]] = (),
+                 especiais: Iterable[Tuple[int, str, List[str]]] = (),
+                 lido_em: Optional[datetime] = None,
+                 atualizado_em: Optional[Dict[str, Dict[int, datetime]]] = None):
+        # Momento da leitura dos artistas e updated_at de cada um, por regra (ver resolver_nomes)
+        self.lido_em = lido_em
+        self.atualizado_em = atualizado_em or {'normal': {}, 'assisao': {}}
+        # Respostas já calculadas por regra: {regra: {nome: (ids...)}}
+        self.memo: Dict[str, Dict[str, Tuple[int, ...]]] = {'normal': {}, 'assisao': {}}
+
+        normais, especiais = list(normais), list(especiais)
+        self._origem = {'normal': {linha[0]: linha for linha in normais},
+                        'assisao': {linha[0]: linha for linha in especiais}}
+
+        # Artista: (id, nome com grupos separados por vírgula)
+        self._normais = []
+        for artista_id, nome in normais:
+            for forma in (remover_acentos(n.strip().lower()) for n in (nome or '').split(',') if n.strip()):
+                self._normais.append((artista_id, forma))
+
+        # ArtistaEspecial: (id, nome, variações) → formas como em nome_corresponde
+        self._especiais = []
+        self._exatos = defaultdict(set)
+        for artista_id, nome, variacoes in especiais:
+            for forma in [normalizar_texto(nome)] + [normalizar_texto(v) for v in variacoes]:
+                self._especiais.append((artista_id, forma))
+                self._exatos[forma].add(artista_id)
+
+        self._bloco_normais, self._curtos_normais = self._blocos(self._normais)
+        self._bloco_especiais, self._curtos_especiais = self._blocos(self._especiais)
+
+        # Trigrama → apelidos especiais que o contêm (nome da planilha contido no apelido)
+        self._contem_trigrama = defaultdict(list)
+        for posicao, (_, forma) in enumerate(self._especiais):
+            for trigrama in _trigramas(forma):
+                self._contem_trigrama[trigrama].append(posicao)
+
+        # Tokens dos apelidos especiais para a regra "todo token com ratio ≥ 85"
+        self._formas_especiais = [forma for _, forma in self._especiais]
+        self._tokens_por_apelido = [set(forma.split()) for forma in self._formas_especiais]
+        self._apelidos_por_token = defaultdict(list)
+        for posicao, tokens in enumerate(self._tokens_por_apelido):
+            for token in tokens:
+                self._apelidos_por_token[token].append(posicao)
+        self._vocabulario = list(self._apelidos_por_token)
+
+    @classmethod
+    def de_artistas(cls, artistas=(), artistas_especiais=()):
+        return cls(
+            [(a.id, a.nome) for a in artistas],
+            [(a.id, a.nome, a.obter_variacoes()) for a in artistas_especiais],
+        )
+
+    def tem_artista(self, regra: str, artista_id: int) -> bool:
+        return artista_id in self._origem[regra]
+
+    def alterados_desde(self, regra: str, momento: datetime) -> Set[int]:
+        """Artistas da regra gravados depois de `momento`."""
+        return {artista_id for artista_id, atualizado in self.atualizado_em[regra].items()
+                if atualizado is not None and atualizado > momento}
+
+    def subindice(self, regra: str, ids: Iterable[int]) -> 'IndiceAliases':
+        """Índice só com os artistas `ids` da regra; para eles, responde como o índice completo."""
+        linhas = [self._origem[regra][artista_id] for artista_id in sorted(ids) if self.tem_artista(regra, artista_id)]
+        return IndiceAliases(linhas) if regra == 'normal' else IndiceAliases(especiais=linhas)
+
+    def calcular(self, regra: str, nome: str) -> Tuple[int, ...]:
+        """Artistas do nome pela regra, sem memo (ids em ordem crescente: os artistas vêm por id)."""
+        if regra == 'assisao':
+            return tuple(sorted(self.especiais_do_nome(nome)))
+        return tuple(self.normais_do_nome(nome))
+
+    @staticmethod
+    def _blocos(apelidos):
+        """Agrupa cada apelido pelo seu trigrama mais raro; apelidos com menos de 3 letras ficam à parte."""
+        frequencia = defaultdict(int)
+        for _, forma in apelidos:
+            for trigrama in _trigramas(forma):
+                frequencia[trigrama] += 1
+
+        blocos, curtos = defaultdict(list), []
+        for posicao, (_, forma) in enumerate(apelidos):
+            trigramas = _trigramas(forma)
+            if trigramas:
+                blocos[min(trigramas, key=lambda t: (frequencia[t], t))].append(posicao)
+            else:
+                curtos.append(posicao)
+        return blocos, curtos
+
+    @staticmethod
+    def _contidos_em(nome: str, apelidos, blocos, curtos) -> Set[int]:
+        """Posições dos apelidos que são substring de `nome`."""
+        candidatos = set(curtos)
+        for trigrama in _trigramas(nome):
+            candidatos.update(blocos.get(trigrama, ()))
+        return {posicao for posicao in candidatos if apelidos[posicao][1] in nome}
+
+    def normais_do_nome(self, nome_normalizado: str) -> List[int]:
+        """Artistas (ids, sem repetição) cujo nome está contido no nome já normalizado da planilha."""
+        ids = []
+        for posicao in sorted(self._contidos_em(nome_normalizado, self._normais, self._bloco_normais, self._curtos_normais)):
+            artista_id, forma = self._normais[posicao]
+            if artista_id not in ids and fuzz.partial_ratio(nome_normalizado, forma) >= LIMIAR_PARTIAL_RATIO:
+                ids.append(artista_id)
+        return ids
+
+    def especiais_do_nome(self, nome) -> Set[int]:
+        """ArtistaEspecial a que o nome pertence pela regra de nome_corresponde."""
+        nome = normalizar_texto(nome)
+        posicoes = self._contidos_em(nome, self._especiais, self._bloco_especiais, self._curtos_especiais)
+
+        # Nome da planilha contido no apelido
+        if len(nome) >= 3:
+            candidatos = self._contem_trigrama.get(nome[:3], ())
+        else:
+            candidatos = range(len(self._especiais))
+        posicoes.update(p for p in candidatos if nome in self._especiais[p][1])
+
+        # Todo token do apelido tem um token do nome com ratio ≥ 85
+        tokens_aceitos = set()
+        for token in set(nome.split()):
+            for encontrado, _, _ in process.extract(token, self._vocabulario, scorer=fuzz.ratio, processor=None,
+                                                    score_cutoff=LIMIAR_RATIO_TOKEN, limit=None):
+                tokens_aceitos.add(encontrado)
+        if tokens_aceitos:
+            cobertos = defaultdict(int)
+            for token in tokens_aceitos:
+                for posicao in self._apelidos_por_token[token]:
+                    cobertos[posicao] += 1
+            posicoes.update(p for p, total in cobertos.items() if total == len(self._tokens_por_apelido[p]))
+
+        # token_sort_ratio ≥ 90 contra todos os apelidos, numa chamada só
+        for _, _, posicao in process.extract(nome, self._formas_especiais, scorer=fuzz.token_sort_ratio,
+                                             processor=None, score_cutoff=LIMIAR_TOKEN_SORT, limit=None):
+            posicoes.add(posicao)
+
+        return {self._especiais[p][0] for p in posicoes}
+
+    def especiais_exatos(self, nome) -> Set[int]:
+        """ArtistaEspecial cujo nome ou variação normalizada é igual ao nome da planilha."""
+        return set(self._exatos.get(normalizar_texto(nome), ()))
+
+
+_indice_aliases: Optional[IndiceAliases] = None
+_estado_aliases: Optional[tuple] = None
+_lock_indice = threading.Lock()
+
+
+def _estado_artistas() -> tuple:
+    """Quantidade e maior updated_at de Artista e ArtistaEspecial: mudam a cada inclusão, edição ou exclusão."""
+    return tuple(
+        tuple(db.session.query(db.func.count(modelo.id), db.func.max(modelo.updated_at)).one())
+        for modelo in (Artista, ArtistaEspecial)
+    )
+
+
+def obter_indice_aliases() -> IndiceAliases:
+    """
+    Índice de apelidos de todos os artistas. É refeito só quando algum Artista ou
+    ArtistaEspecial muda: a cada chamada confere-se apenas a contagem e o maior updated_at
+    das duas tabelas, o que também cobre edições feitas por outro processo.
+    """
+    global _indice_aliases, _estado_aliases
+    estado = _estado_artistas()
+
+    with _lock_indice:
+        if _indice_aliases is None or estado != _estado_aliases:
+            lido_em = datetime.utcnow()
+            normais = db.session.query(Artista.id, Artista.nome, Artista.updated_at).order_by(Artista.id).all()
+            especiais = db.session.query(ArtistaEspecial.id, ArtistaEspecial.nome, ArtistaEspecial.variacoes,
+                                         ArtistaEspecial.updated_at).order_by(ArtistaEspecial.id).all()
+            _indice_aliases = IndiceAliases(
+                [(artista_id, nome) for artista_id, nome, _ in normais],
+                [(artista_id, nome, variacoes.split('||') if variacoes else [])
+                 for artista_id, nome, variacoes, _ in especiais],
+                lido_em=lido_em,
+                atualizado_em={
+                    'normal': {artista_id: atualizado for artista_id, _, atualizado in normais},
+                    'assisao': {artista_id: atualizado for artista_id, _, _, atualizado in especiais},
+                },
+            )
+            _estado_aliases = estado
+        return _indice_aliases
+
+
+# ------------------- MEMO DE CORRESPONDÊNCIAS -------------------
+# Os extratos repetem os mesmos nomes mês a mês. Cada nome da planilha é resolvido uma vez e
+# guardado em correspondencia_nome com os artistas encontrados e o momento da leitura dos
+# artistas usada (avaliado_em). Um artista gravado depois disso invalida só os próprios pares:
+# os outros ids da linha continuam valendo e apenas os artistas alterados são testados de novo.
+
+def _ler_memo(regra: str, nomes: List[str]) -> Dict[str, Tuple[Tuple[int, ...], datetime]]:
+    """
+    {nome: (ids, avaliado_em)}. Só leitura: o usado_em dos encontrados é atualizado por
+    _gravar_memo, quando houver gravação.
+    """
+    tabela = CorrespondenciaNome.__table__
+    encontrados = {}
+    with db.engine.connect() as conexao:
+        for inicio in range(0, len(nomes), LOTE_CONSULTA_MEMO):
+            lote = nomes[inicio:inicio + LOTE_CONSULTA_MEMO]
+            consulta = db.select(tabela.c.nome, tabela.c.artista_ids, tabela.c.avaliado_em) \
+                .where(tabela.c.regra == regra, tabela.c.nome.in_(lote))
+            for nome, artista_ids, avaliado_em in conexao.execute(consulta):
+                encontrados[nome] = (tuple(json.loads(artista_ids)), avaliado_em)
+    return encontrados
+
+
+def _revalidar_memo(indice: IndiceAliases, regra: str,
+                    do_memo: Dict[str, Tuple[Tuple[int, ...], datetime]]) -> Tuple[Dict, Dict]:
+    """
+    Confere as respostas do memo contra os artistas atuais: ids de artistas removidos saem e
+    os artistas alterados depois de avaliado_em são testados de novo, num subíndice só com eles.
+    Retorna (respostas, refeitas); as refeitas são regravadas com a leitura atual.
+    """
+    respostas, refeitas = {}, {}
+    alterados_por_momento, subindices = {}, {}
+    for nome, (ids, avaliado_em) in do_memo.items():
+        if avaliado_em not in alterados_por_momento:
+            alterados_por_momento[avaliado_em] = frozenset(indice.alterados_desde(regra, avaliado_em))
+        alterados = alterados_por_momento[avaliado_em]
+
+        validos = {artista_id for artista_id in ids
+                   if artista_id not in alterados and indice.tem_artista(regra, artista_id)}
+        if alterados:
+            if alterados not in subindices:
+                subindices[alterados] = indice.subindice(regra, alterados)
+            validos.update(subindices[alterados].calcular(regra, nome))
+        resposta = tuple(sorted(validos))
+
+        respostas[nome] = resposta
+        if alterados or resposta != ids:
+            refeitas[nome] = resposta
+    return respostas, refeitas
+
+
+def _gravar_memo(regra: str, avaliado_em: datetime, resolvidos: Dict[str, Tuple[int, ...]],
+                 usados: Iterable[str] = ()):
+    """
+    Grava os nomes novos ou refeitos, marca como recentes os `usados` (lidos do memo nesta
+    chamada) e, passando do limite, descarta os usados há mais tempo. Consultas que só leem
+    não gravam, então um nome lido sem cálculos novos pode sair antes do que sairia num LRU exato.
+    """
+    tabela = CorrespondenciaNome.__table__
+    agora = datetime.utcnow()
+    linhas = [
+        {'regra': regra, 'nome': nome, 'artista_ids': json.dumps(list(ids)),
+         'avaliado_em': avaliado_em, 'usado_em': agora}
+        for nome, ids in resolvidos.items()
+    ]
+    usados = sorted(set(usados) - resolvidos.keys())
+    with db.engine.begin() as conexao:
+        if linhas:
+            conexao.execute(tabela.insert().prefix_with('OR REPLACE'), linhas)
+        for inicio in range(0, len(usados), LOTE_CONSULTA_MEMO):
+            conexao.execute(
+                tabela.update()
+                .where(tabela.c.regra == regra, tabela.c.nome.in_(usados[inicio:inicio + LOTE_CONSULTA_MEMO]))
+                .values(usado_em=agora))
+        excedente = conexao.execute(db.select(db.func.count()).select_from(tabela)).scalar() \
+            - LIMITE_MEMO_CORRESPONDENCIA
+        if excedente > 0:
+            antigos = db.select(tabela.c.id).order_by(tabela.c.usado_em).limit(excedente)
+            conexao.execute(tabela.delete().where(tabela.c.id.in_(antigos)))
+
+
+def resolver_nomes(indice: IndiceAliases, regra: str, nomes: Iterable[str]) -> Dict[str, Tuple[int, ...]]:
+    """
+    Artistas de cada nome distinto pela regra 'normal' (normais_do_nome, nomes já normalizados
+    com normalizar_nome_planilha) ou 'assisao' (especiais_do_nome). Procura primeiro na memória
+    do índice, depois na tabela correspondencia_nome, e só calcula o que faltar.
+    """
+    memo = indice.memo[regra]
+    nomes = set(nomes)
+    resolvidos = {nome: memo[nome] for nome in nomes if nome in memo}
+    faltantes = sorted(nomes - resolvidos.keys())
+
+    persistir = indice.lido_em is not None and faltantes
+    do_memo, refeitas = {}, {}
+    if persistir:
+        try:
+            do_memo, refeitas = _revalidar_memo(indice, regra, _ler_memo(regra, faltantes))
+            resolvidos.update(do_memo)
+        except Exception as e:
+            logger.warning(f"Memo de correspondências indisponível: {e}")
+            persistir = False
+        faltantes = [nome for nome in faltantes if nome not in resolvidos]
+
+    novos = {nome: indice.calcular(regra, nome) for nome in faltantes}
+    resolvidos.update(novos)
+
+    if persistir and (novos or refeitas):
+        try:
+            _gravar_memo(regra, indice.lido_em, {**refeitas, **novos}, do_memo.keys())
+        except Exception as e:
+            logger.warning(f"Memo de correspondências não foi gravado: {e}")
+
+    if len(memo) + len(resolvidos) > LIMITE_MEMO_CORRESPONDENCIA:
+        memo.clear()
+    memo.update(resolvidos)
+    return resolvidos
+
+
+def resolver_artistas_por_nome(nomes_distintos: Iterable[str], artistas,
+                               indice: Optional[IndiceAliases] = None) -> Dict[str, List[int]]:
+    """
+    Resolve, numa única passada, a quais artistas cada nome distinto da planilha pertence.
+    Retorna {nome_normalizado: [artista.id, ...]} apenas para nomes com ao menos um artista.
+    """
+    if indice is None:
+        indice = IndiceAliases.de_artistas(artistas)
+    selecionados = {artista.id for artista in artistas}
+    resolvidos = {}
+    for nome, ids_nome in resolver_nomes(indice, 'normal', nomes_distintos).items():
+        ids = [artista_id for artista_id in ids_nome if artista_id in selecionados]
+        if ids:
+            resolvidos[nome] = ids
+    return resolvidos
+
+
+def _pares_artista_lucro(extrato: pd.DataFrame, artistas, indice: Optional[IndiceAliases] = None) -> pd.DataFrame:
+    """
+    Gera os pares (artista_id, lucro) de um extrato, na ordem original das linhas, com o
+    lucro também em unidades de 10^-14 (coluna 'unidades'; 'cabe' indica se coube em int64).
+    """
+    codigos_nome, nomes_distintos = pd.factorize(extrato['artista'], use_na_sentinel=False)
+
+    # Normaliza e converte cada valor distinto uma única vez
+    nomes_norm = [normalizar_nome_planilha(v) for v in nomes_distintos]
+    lucros, unidades, cabe = converter_distintos(extrato['lucro'], converter_lucro_calculo)
+
+    resolvidos = resolver_artistas_por_nome(set(nomes_norm), artistas, indice)
+    ids_por_codigo = pd.Series([resolvidos.get(n) for n in nomes_norm], dtype=object)
+
+    pares = pd.DataFrame({
+        'artista_id': ids_por_codigo.to_numpy()[codigos_nome],
+        'lucro': lucros,
+        'unidades': unidades,
+        'cabe': cabe,
+    })
+    pares = pares[pares['artista_id'].notna() & pares['lucro'].notna()]
+    return pares.explode('artista_id')
+
+
+def somar_lucro_por_artista(extratos: Iterable[pd.DataFrame], artistas) -> Dict[int, Decimal]:
+    """
+    Soma o lucro de cada artista em todos os extratos selecionados (ver planilhas_service).
+
+    Substitui o laço linha × artista de /calcular: os nomes são normalizados uma vez por
+    valor distinto, resolvidos para os artistas numa passada, e os totais saem de um
+    groupby por extrato. Os extratos podem chegar em lotes (arquivos grandes): o total
+    acumulado entra como primeira parcela de cada artista no lote seguinte, então as
+    somas seguem exatamente a ordem do laço original, inclusive sob o contexto decimal
+    corrente.
+
+    As somas são feitas em inteiros de 10^-14 (dinheiro_service) enquanto o resultado for
+    idêntico ao da soma em Decimal; o artista que passa desse limite, ou que tem um valor
+    fora do int64, segue somando em Decimal a partir do total exato até ali.
+    """
+    artistas = list(artistas)
+    totais = {artista.id: Decimal("0.0000") for artista in artistas}
+    exatos: Dict[int, int] = {}      # artista_id → soma em unidades
+    absolutos: Dict[int, int] = {}   # artista_id → soma dos valores absolutos em unidades
+    em_decimal: Set[int] = set()
+    indice = obter_indice_aliases()
+
+    for extrato in extratos:
+        pares = _pares_artista_lucro(extrato, artistas, indice)
+        if pares.empty:
+            continue
+
+        somas, somas_abs = somar_unidades(pares['artista_id'].to_numpy(), pares['unidades'].to_numpy())
+        fora_do_int64 = set(pares.loc[~pares['cabe'], 'artista_id'])
+        decimais_lote = set()
+        for artista_id, soma in somas.items():
+            artista_id = int(artista_id)
+            absoluto = absolutos.get(artista_id, 0) + somas_abs[artista_id]
+            if artista_id in em_decimal or artista_id in fora_do_int64 or not cabe_no_contexto(absoluto):
+                if artista_id in exatos:
+                    totais[artista_id] = unidades_para_decimal(exatos.pop(artista_id))
+                em_decimal.add(artista_id)
+                decimais_lote.add(artista_id)
+            else:
+                exatos[artista_id] = exatos.get(artista_id, 0) + soma
+                absolutos[artista_id] = absoluto
+
+        if not decimais_lote:
+            continue
+        sementes = pd.DataFrame({'artista_id': list(decimais_lote), 'lucro': [totais[a] for a in decimais_lote]})
+        somas_decimais = (
+            pd.concat([sementes, pares.loc[pares['artista_id'].isin(decimais_lote), ['artista_id', 'lucro']]],
+                      ignore_index=True)
+            .groupby('artista_id', sort=False)['lucro']
+            .sum()
+        )
+        for artista_id, soma in somas_decimais.items():
+            totais[int(artista_id)] = soma
+
+    for artista_id, unidades in exatos.items():
+        totais[artista_id] = unidades_para_decimal(unidades)
+    return totais
+
+
+# ------------------- CASAMENTO DE TÍTULOS -------------------
+
+class CasadorTitulos:
+    """
+    Títulos distintos de um extrato (já filtrado por artista) com o lucro somado por título.
+
+    similaridades() devolve a matriz cadastrados × títulos da planilha numa chamada só do
+    rapidfuzz (process.cdist); as somas saem de um único groupby. As colunas seguem a ordem
+    de Series.unique(), a mesma em que os laços originais percorriam os títulos.
+    """
+
+    def __init__(self, titulos: pd.Series, lucros: pd.Series, unidades: Optional[pd.Series] = None,
+                 cabe: Optional[pd.Series] = None):
+        self.codigos, self.titulos = pd.factorize(titulos, use_na_sentinel=False)
+        self._lucros = lucros.to_numpy()
+        self.somas = None
+
+        # Lucro também em unidades de 10^-14 (dinheiro_service): soma inteira quando for idêntica à decimal
+        if unidades is not None and len(lucros) and cabe.all():
+            somas, absolutos = somar_unidades(self.codigos, unidades.to_numpy())
+            if all(cabe_no_contexto(absoluto) for absoluto in absolutos.values()):
+                self.somas = np.array([unidades_para_decimal(somas[c]) for c in range(len(self.titulos))],
+                                      dtype=object)
+
+        if self.somas is None:
+            # groupby soma cada título na ordem das linhas, como linhas['lucro'].sum()
+            self.somas = lucros.groupby(self.codigos, sort=False).sum().to_numpy() if len(lucros) else np.array([])
+
+    def similaridades(self, cadastrados: List[str], limiar: float = LIMIAR_TITULO) -> np.ndarray:
+        """token_sort_ratio de cada título cadastrado (normalizado) contra cada título da planilha; abaixo do limiar vale 0."""
+        if not len(cadastrados) or not len(self.titulos):
+            return np.zeros((len(cadastrados), len(self.titulos)))
+        workers = -1 if len(cadastrados) * len(self.titulos) >= CELULAS_MATRIZ_MULTITHREAD else 1
+        # dtype float64: as mesmas notas de fuzz.token_sort_ratio, sem arredondar para float32
+        return process.cdist(cadastrados, list(self.titulos), scorer=fuzz.token_sort_ratio, processor=None,
+                             score_cutoff=limiar, dtype=np.float64, workers=workers)
+
+    def casados(self, notas: np.ndarray, limiar: float = LIMIAR_TITULO) -> np.ndarray:
+        """Posições (na ordem da planilha) dos títulos com nota ≥ limiar numa linha da matriz."""
+        return np.flatnonzero(notas >= limiar)
+
+    def soma(self, posicoes) -> Decimal:
+        """
+        Lucro dos títulos nas `posicoes`. Com mais de um título, soma as linhas título a título
+        e na ordem original, exatamente como o pd.concat das linhas de cada título fazia.
+        """
+        if len(posicoes) == 1:
+            return self.somas[posicoes[0]]
+        mascara = np.isin(self.codigos, posicoes)
+        ordem = np.argsort(self.codigos[mascara], kind='stable')
+        return self._lucros[mascara][ordem].sum()
+
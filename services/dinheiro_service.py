@@ -0,0 +1,139 @@
+# services/dinheiro_service.py
+"""
+Valores de lucro como inteiros escalados: 1 unidade = 10^-14 €, a mesma precisão do
+quantize de /calcular. As colunas ficam em int64 e as somas por grupo são exatas e
+vetorizadas; o Decimal só aparece na entrada (um valor distinto por vez) e na saída.
+
+A leitura das células (analisar_lucro) também fica aqui: um único parser vetorizado, usado
+por todas as entradas de planilha, que aceita "1.234,56", "1234.56", "€ 0,0001", "R$ 10",
+números vindos do Excel e células vazias, e aponta as inválidas numa máscara.
+
+Para devolver exatamente o que a soma em Decimal devolveria, a soma inteira só é usada
+quando nenhuma parcial da soma sequencial passaria da precisão do contexto decimal
+corrente (ver cabe_no_contexto); caso contrário o chamador soma em Decimal, como antes.
+"""
+from decimal import Decimal, getcontext
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+CASAS = 14
+ESCALA = 10 ** CASAS
+LIMITE_INT64 = np.iinfo(np.int64).max
+# Número já sem moeda, espaços e separador de milhar, com ponto decimal
+PADRAO_NUMERO = r'[+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?'
+PADRAO_DESCARTAR = r'\s+|€|R\$'
+# As somas por grupo são feitas em duas metades de 32 bits para não estourar o int64
+DESLOCAMENTO = 32
+MASCARA_BAIXA = (1 << DESLOCAMENTO) - 1
+
+
+def normalizar_textos_lucro(valores: pd.Series) -> Tuple[pd.Series, pd.Series, pd.Series]:
+    """
+    Texto canônico ("-1234.56") de cada valor, só com operações de coluna.
+
+    O separador decimal é o último entre ponto e vírgula quando aparecem os dois; sozinho,
+    vale como decimal se aparece uma vez ("0,0001", "1234.56") e como milhar se repete
+    ("1.234.567"). Retorna (textos, validos, invalidos); o texto só vale onde `validos`.
+    """
+    vazios = valores.isna()
+    texto = valores.astype(object).where(~vazios, '').astype(str)
+    texto = texto.str.replace(PADRAO_DESCARTAR, '', regex=True)
+    vazios = vazios | (texto == '')
+
+    virgulas = texto.str.count(',')
+    pontos = texto.str.count(r'\.')
+    tem_virgula, tem_ponto = virgulas > 0, pontos > 0
+    virgula_decimal = tem_virgula & (
+        (tem_ponto & (texto.str.rfind(',') > texto.str.rfind('.'))) | (~tem_ponto & (virgulas == 1))
+    )
+    ponto_milhar = (tem_ponto & virgula_decimal) | (~tem_virgula & (pontos > 1))
+    virgula_milhar = tem_virgula & ~virgula_decimal
+
+    texto = texto.mask(ponto_milhar, texto.str.replace('.', '', regex=False))
+    texto = texto.mask(virgula_milhar, texto.str.replace(',', '', regex=False))
+    texto = texto.mask(virgula_decimal, texto.str.replace(',', '.', regex=False))
+
+    validos = ~vazios & texto.str.fullmatch(PADRAO_NUMERO).astype(bool)
+    return texto, validos, ~vazios & ~validos
+
+
+def analisar_lucro(coluna: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """
+    Converte uma coluna de lucro (texto ou número) em Decimal exato, normalizando cada
+    valor distinto uma vez. Retorna (lucros, invalidos): lucro None para células vazias e
+    inválidas; a máscara marca só as inválidas, para o chamador contar ou avisar.
+    """
+    codigos, distintos = pd.factorize(coluna, use_na_sentinel=False)
+    textos, validos, invalidos = normalizar_textos_lucro(pd.Series(distintos, dtype=object))
+    decimais = np.array([Decimal(t) if ok else None for t, ok in zip(textos, validos)], dtype=object)
+    return (
+        pd.Series(decimais[codigos], index=coluna.index, dtype=object),
+        pd.Series(invalidos.to_numpy(dtype=bool)[codigos], index=coluna.index),
+    )
+
+
+def decimal_para_unidades(valor: Optional[Decimal]) -> Optional[int]:
+    """
+    Unidades de 10^-14 de um Decimal com no máximo 14 casas (ex.: já quantizado).
+    None para vazios, não finitos, mais de 14 casas ou valores fora do int64.
+    """
+    if valor is None or not valor.is_finite():
+        return None
+    sinal, digitos, expoente = valor.as_tuple()
+    if expoente < -CASAS:
+        return None
+    coeficiente = int(''.join(map(str, digitos))) if digitos else 0
+    unidades = coeficiente * 10 ** (expoente + CASAS)
+    if unidades > LIMITE_INT64:
+        return None
+    return -unidades if sinal else unidades
+
+
+def unidades_para_decimal(unidades: int) -> Decimal:
+    """Decimal com expoente -14, igual ao de um valor quantizado em 14 casas (sem arredondar)."""
+    return Decimal(f"{int(unidades)}E-{CASAS}")
+
+
+def converter_distintos(valores: pd.Series, conversor) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Aplica `conversor` (valor → Decimal ou None) uma vez por valor distinto da coluna.
+    Retorna (decimais por linha, unidades int64 por linha, máscara de linhas que cabem em int64).
+    Linhas inválidas ou fora do int64 ficam com unidade 0 e fora da máscara.
+    """
+    codigos, distintos = pd.factorize(valores, use_na_sentinel=False)
+    decimais = np.array([conversor(v) for v in distintos], dtype=object)
+    unidades_distintas = [decimal_para_unidades(d) for d in decimais]
+    cabe = np.array([u is not None for u in unidades_distintas], dtype=bool)
+    unidades = np.array([u if u is not None else 0 for u in unidades_distintas], dtype=np.int64)
+    return decimais[codigos], unidades[codigos], cabe[codigos]
+
+
+def somar_unidades(grupos, unidades: np.ndarray) -> Tuple[Dict, Dict]:
+    """
+    Soma exata das unidades por grupo (inteiros Python, sem estouro) e a soma dos valores
+    absolutos, usada em cabe_no_contexto. Retorna ({grupo: soma}, {grupo: soma_abs}).
+    """
+    unidades = np.asarray(unidades, dtype=np.int64)
+    absolutas = np.abs(unidades)
+    quadro = pd.DataFrame({
+        'grupo': grupos,
+        'alto': unidades >> DESLOCAMENTO,
+        'baixo': unidades & MASCARA_BAIXA,
+        'abs_alto': absolutas >> DESLOCAMENTO,
+        'abs_baixo': absolutas & MASCARA_BAIXA,
+    })
+    somas, absolutos = {}, {}
+    for grupo, alto, baixo, abs_alto, abs_baixo in quadro.groupby('grupo', sort=False).sum().itertuples():
+        somas[grupo] = (int(alto) << DESLOCAMENTO) + int(baixo)
+        absolutos[grupo] = (int(abs_alto) << DESLOCAMENTO) + int(abs_baixo)
+    return somas, absolutos
+
+
+def cabe_no_contexto(soma_absoluta: int) -> bool:
+    """
+    Uma soma sequencial em Decimal de valores com 14 casas é exata enquanto nenhum
+    coeficiente passa da precisão do contexto; |parcial| ≤ soma dos absolutos garante isso.
+    """
+    return soma_absoluta < 10 ** getcontext().prec
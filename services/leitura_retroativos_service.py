@@ -0,0 +1,213 @@
+# services/leitura_retroativos_service.py
+"""
+Leitura das planilhas de retroativos (processar_retroativos.py), sem banco e sem o app.
+
+Os processos de leitura executam só este módulo: no Windows cada processo começa do zero e
+importa o alvo do pool, então ele não pode importar app.py (que sobe o Flask e mexe no
+banco de retroativos ao iniciar). Cada planilha vira um DataFrame com COLUNAS_REGISTRO; a
+gravação continua no processo principal, num único escritor.
+"""
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP, getcontext
+from typing import List, Set
+
+import pandas as pd
+from unidecode import unidecode
+
+from services.colunas_service import colunas_completas, detectar_colunas
+from services.dinheiro_service import analisar_lucro
+from services.planilhas_service import ler_planilha_em_lotes
+
+# Filho do logger de processar_retroativos.py: as mensagens vão para o mesmo log
+logger = logging.getLogger('retroativos.leitura')
+
+FORMATOS_MES_RELATORIO = ('%d/%m/%Y', '%d/%m/%y', '%Y-%m-%d', '%m/%Y', '%m/%y', '%Y/%m/%d', '%Y-%m-%d %H:%M:%S')
+COLUNAS_REGISTRO = ['artista', 'titulo', 'lucro_liquido', 'mes']
+
+
+def remover_acentos(texto):
+    """Remove acentos de uma string, usando unidecode."""
+    if not isinstance(texto, str):
+        return ""
+    return unidecode(texto).lower().strip()
+
+def normalizar_nome_artista(nome):
+    """
+    Normaliza o nome do artista para um formato consistente, removendo
+    acentos, caracteres especiais, e variações comuns como "e ou".
+    """
+    if not nome:
+        return ""
+    nome_normalizado = remover_acentos(nome)
+    # Trata a variação "e ou" e "ou" para garantir consistência
+    nome_normalizado = re.sub(r'\s+e\s+ou\s+|\s+ou\s+', ' ', nome_normalizado)
+    nome_normalizado = re.sub(r'[^a-z0-9 ]', '', nome_normalizado)
+    return ' '.join(nome_normalizado.split()).strip()
+
+def identificar_colunas(df):
+    """Identifica as colunas essenciais no DataFrame (regras em services/colunas_service.py)."""
+    mapeamento = detectar_colunas(df.columns)
+    if colunas_completas(mapeamento):
+        return mapeamento
+    logger.error(f"Não foi possível identificar as colunas 'artista' ou 'lucro'.")
+    logger.debug(f"Colunas disponíveis: {list(df.columns)}")
+    return None
+
+
+def mes_da_coluna(valor, mes_padrao: int) -> int:
+    """Mês de uma célula de 'mês do relatório' (datas em vários formatos); mes_padrao se não for data."""
+    texto = str(valor).strip()
+    if texto:
+        for fmt in FORMATOS_MES_RELATORIO:
+            try:
+                return datetime.strptime(texto, fmt).month
+            except ValueError:
+                continue
+    return mes_padrao
+
+
+def _por_distinto(serie: pd.Series, funcao) -> pd.Series:
+    """Aplica `funcao` uma vez por valor distinto da coluna."""
+    codigos, distintos = pd.factorize(serie, use_na_sentinel=False)
+    valores = pd.Series([funcao(v) for v in distintos], dtype=object)
+    return pd.Series(valores.to_numpy()[codigos], index=serie.index, dtype=object)
+
+
+def processar_arquivo_unificado(caminho: str, ano: int, mes_padrao: int, artistas_para_filtrar: Set[str]):
+    """
+    Função unificada para processar arquivos, com filtragem da gravadora "Rozenblit"
+    e agora com filtro de artistas.
+    Retorna (registros, registros_invalidos, colunas identificadas), sendo `registros` um
+    DataFrame com COLUNAS_REGISTRO na ordem das linhas da planilha, ou None se a leitura
+    falhou no meio (o arquivo não deve ser gravado). Não acessa o banco, para poder rodar
+    nos processos de leitura.
+    """
+    nome_arquivo = os.path.basename(caminho)
+    logger.info(f"Iniciando processamento: {nome_arquivo}")
+    
+    colunas = {}
+
+    def selecionar_colunas(cabecalho):
+        mapeamento = identificar_colunas(pd.DataFrame(columns=cabecalho))
+        if not mapeamento:
+            return []
+        colunas.update(mapeamento)
+        return list(dict.fromkeys(mapeamento.values()))
+
+    lotes = []
+    total_linhas = 0
+    linhas_invalidas = 0
+    linhas_filtradas_rozenblit = 0
+    linhas_filtradas_artista = 0
+    vazio = pd.DataFrame(columns=COLUNAS_REGISTRO)
+
+    try:
+        # Lê em lotes (snapshot colunar quando existir) só com as colunas usadas,
+        # para que arquivos grandes não precisem caber inteiros na memória
+        for lote in ler_planilha_em_lotes(caminho, selecionar_colunas, sep=';'):
+            if not colunas:
+                break
+            if total_linhas == 0:
+                logger.info(f"Colunas identificadas para '{nome_arquivo}': {colunas}")
+            total_linhas += len(lote)
+
+            col_artista = colunas["artista"]
+            col_lucro = colunas["lucro"]
+            col_titulo = colunas.get("titulo")
+            col_gravadora = colunas.get("gravadora")
+            col_mes_relatorio = colunas.get("mes_relatorio")
+
+            df_processar = lote[lote[col_artista].notna() & lote[col_lucro].notna()]
+            linhas_invalidas += len(lote) - len(df_processar)
+
+            artistas = df_processar[col_artista].astype(str).str.strip()
+
+            # LÓGICA DE FILTRAGEM 1: Artista
+            if artistas_para_filtrar:
+                manter = _por_distinto(artistas, normalizar_nome_artista).isin(artistas_para_filtrar)
+                linhas_filtradas_artista += int((~manter).sum())
+                df_processar, artistas = df_processar[manter], artistas[manter]
+
+            # LÓGICA DE FILTRAGEM 2: Gravadora "Rozenblit"
+            if col_gravadora:
+                rozenblit = df_processar[col_gravadora].astype(str).str.lower().str.strip() == 'rozenblit'
+                linhas_filtradas_rozenblit += int(rozenblit.sum())
+                df_processar, artistas = df_processar[~rozenblit], artistas[~rozenblit]
+
+            # Lucro do lote convertido de uma vez; vazios, inválidos e zeros são descartados
+            lucros, _ = analisar_lucro(df_processar[col_lucro])
+            lucros = lucros.fillna(Decimal("0"))
+            com_valor = lucros.map(lambda valor: valor != 0).astype(bool)
+            linhas_invalidas += int((~com_valor).sum())
+            df_processar, artistas, lucros = df_processar[com_valor], artistas[com_valor], lucros[com_valor]
+
+            if col_mes_relatorio:
+                meses = _por_distinto(df_processar[col_mes_relatorio], lambda v: mes_da_coluna(v, mes_padrao))
+            else:
+                meses = pd.Series(mes_padrao, index=df_processar.index)
+
+            titulos = (df_processar[col_titulo].astype(str).str.strip() if col_titulo
+                       else pd.Series("", index=df_processar.index))
+
+            lotes.append(pd.DataFrame({
+                'artista': artistas,
+                'titulo': titulos,
+                'lucro_liquido': lucros,
+                'mes': meses.astype(int),
+            }, columns=COLUNAS_REGISTRO))
+    except Exception as e:
+        logger.error(f"Erro ao ler {nome_arquivo}: {e}")
+        return None
+
+    if not colunas:
+        logger.error(f"Colunas essenciais não identificadas no arquivo: {nome_arquivo}")
+        return vazio, total_linhas, colunas
+
+    if total_linhas == 0:
+        logger.warning(f"Arquivo {nome_arquivo} vazio ou inválido.")
+        return vazio, 0, colunas
+
+    registros = pd.concat(lotes, ignore_index=True) if lotes else vazio
+    logger.info(f"Processamento de '{nome_arquivo}' concluído. Linhas válidas: {len(registros)}, Linhas filtradas (Rozenblit): {linhas_filtradas_rozenblit}, Linhas filtradas (Artista): {linhas_filtradas_artista}, Linhas inválidas: {linhas_invalidas}")
+    return registros, (linhas_invalidas + linhas_filtradas_rozenblit + linhas_filtradas_artista), colunas
+
+
+def _iniciar_leitor():
+    getcontext().prec = 28
+    getcontext().rounding = ROUND_HALF_UP
+
+
+def _ler_arquivo(pendente):
+    """Tarefa de um processo de leitura: (nome, caminho, mes, ano, filtro) → resultado do arquivo."""
+    nome_arquivo, caminho, mes, ano, artistas_para_filtrar = pendente
+    return processar_arquivo_unificado(caminho, ano, mes, artistas_para_filtrar)
+
+
+def ler_pendentes(pendentes: List[tuple], workers: int):
+    """
+    Resultados de processar_arquivo_unificado na ordem de `pendentes`, lidos em até
+    `workers` processos. Se o pool quebrar (processo morto, falta de memória), os arquivos
+    ainda não entregues são lidos neste processo.
+    """
+    workers = max(1, min(workers, len(pendentes)))
+    entregues = 0
+    if workers > 1:
+        logger.info(f"Lendo {len(pendentes)} arquivos em {workers} processos.")
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_leitor) as executor:
+                # map devolve na ordem de envio: o escritor grava sempre na ordem dos arquivos
+                for resultado in executor.map(_ler_arquivo, pendentes):
+                    entregues += 1
+                    yield resultado
+            return
+        except BrokenProcessPool as e:
+            logger.warning(f"Processos de leitura interrompidos ({e}); "
+                           f"lendo os {len(pendentes) - entregues} arquivos restantes em um processo.")
+
+    for pendente in pendentes[entregues:]:
+        yield _ler_arquivo(pendente)
@@ -0,0 +1,308 @@
+# services/pagamentos_service.py
+"""
+Manutenção do histórico de pagamentos (PagamentoRealizado) em poucas instruções UPDATE.
+
+Antes, cada visita à aba de pagamentos carregava todos os pagamentos no ORM para padronizar
+o status, virar para 'pago' os agendados já vencidos e corrigir o nome do artista. Agora o
+status é uma varredura set-based (varrer_pagamentos), executada por uma thread de fundo no
+máximo uma vez por intervalo e pelas rotas que gravam pagamentos; as rotas GET só leem.
+
+O status é gravado já padronizado ('Agendado ' vira 'agendado', vazio vira 'agendado'), para
+que os filtros comparem a coluna direto e usem os índices de pagamento_realizado.
+
+O nome do artista (artista_nome, desnormalizado) é mantido na escrita: preenchido ao inserir
+o pagamento e propagado quando um Artista/ArtistaEspecial é renomeado (eventos do ORM abaixo).
+
+O histórico (consultar_historico) é lido em páginas por cursor (keyset), com filtros e
+remoção de duplicados no próprio SQL, para que o tamanho da resposta não cresça com o livro.
+"""
+import base64
+import json
+import logging
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence
+
+import pytz
+from sqlalchemy import and_, event, func, inspect, or_, select, update
+
+from extensions import db
+from models import Artista, ArtistaEspecial, PagamentoRealizado
+from utils import MODELOS_POR_TABELA
+
+logger = logging.getLogger(__name__)
+
+FUSO_BRASIL = pytz.timezone('America/Sao_Paulo')
+INTERVALO_VARREDURA_PADRAO = 300  # segundos; config INTERVALO_VARREDURA_PAGAMENTOS (0 desliga a thread)
+
+STATUS_HISTORICO = ('pago', 'agendado')
+ITENS_POR_PAGINA = 50
+LIMITE_POR_PAGINA = 200
+# Ordenações aceitas no histórico; as colunas anuláveis viram um valor fixo para o cursor comparar
+ORDENACOES_HISTORICO = {
+    'vencimento': (lambda p: func.coalesce(p.vencimento, date.min), lambda p: p.vencimento or date.min),
+    'valor': (lambda p: p.valor_brl, lambda p: p.valor_brl),
+    'artista': (lambda p: func.coalesce(p.artista_nome, ''), lambda p: p.artista_nome or ''),
+}
+
+_lock = threading.Lock()
+_thread_varredura: Optional[threading.Thread] = None
+_ultima_varredura: Optional[float] = None
+
+
+def hoje_brasil():
+    return datetime.now(FUSO_BRASIL).date()
+
+
+def padronizar_status(status: Optional[str]) -> str:
+    """Forma gravada do status: minúsculas, sem espaços nas pontas; vazio vira 'agendado'."""
+    return (status or '').strip().lower() or 'agendado'
+
+
+def _atualizar(instrucao) -> int:
+    return db.session.execute(instrucao.execution_options(synchronize_session=False)).rowcount
+
+
+def tabelas_do_modelo(modelo) -> tuple:
+    return tuple(tabela for tabela, modelo_tabela in MODELOS_POR_TABELA.items() if modelo_tabela is modelo)
+
+
+def varrer_pagamentos(hoje=None) -> Dict[str, int]:
+    """
+    Padroniza o status (minúsculas, sem espaços; vazio vira 'agendado') e marca como pagos os
+    agendados com vencimento até hoje. Só as linhas que mudam são tocadas; a padronização
+    só encontra algo em linhas gravadas fora do ORM.
+    Retorna as contagens de cada etapa.
+    """
+    hoje = hoje or hoje_brasil()
+    pagamento = PagamentoRealizado
+    status_limpo = func.lower(func.trim(pagamento.status))
+
+    contagens = {
+        'status_vazios': _atualizar(
+            update(pagamento)
+            .where(or_(pagamento.status.is_(None), func.trim(pagamento.status) == ''))
+            .values(status='agendado')
+        ),
+        'status_padronizados': _atualizar(
+            update(pagamento).where(pagamento.status != status_limpo).values(status=status_limpo)
+        ),
+        'vencidos_pagos': _atualizar(
+            update(pagamento)
+            .where(pagamento.status == 'agendado',
+                   pagamento.vencimento.is_not(None),
+                   pagamento.vencimento <= hoje)
+            .values(status='pago', data_pagamento=hoje)
+        ),
+    }
+
+    db.session.commit()
+    if any(contagens.values()):
+        logger.info(f"Varredura de pagamentos: {contagens}")
+    return contagens
+
+
+def sincronizar_nomes_pagamentos() -> int:
+    """
+    Acerta de uma vez o artista_nome de todos os pagamentos pelo cadastro atual (um UPDATE
+    por modelo). Os eventos abaixo já mantêm o nome; isto serve para dados antigos ou
+    alterados fora do ORM. Retorna quantos pagamentos mudaram.
+    """
+    pagamento = PagamentoRealizado
+    atualizados = 0
+    for modelo in (Artista, ArtistaEspecial):
+        nome = select(modelo.nome).where(modelo.id == pagamento.artista_id).scalar_subquery()
+        atualizados += _atualizar(
+            update(pagamento)
+            .where(pagamento.tabela_artista.in_(tabelas_do_modelo(modelo)),
+                   nome.is_not(None),
+                   or_(pagamento.artista_nome.is_(None), pagamento.artista_nome != nome))
+            .values(artista_nome=nome)
+        )
+    db.session.commit()
+    return atualizados
+
+
+# ------------------- HISTÓRICO PAGINADO -------------------
+
+def condicoes_historico(artista: Optional[str] = None, status: Optional[Sequence[str]] = None,
+                        tabelas: Optional[Sequence[str]] = None, mes: Optional[int] = None,
+                        ano: Optional[int] = None, periodo_de: Optional[tuple] = None,
+                        periodo_ate: Optional[tuple] = None, vencimento_de: Optional[date] = None,
+                        vencimento_ate: Optional[date] = None) -> List:
+    """
+    Condições WHERE do histórico. `artista` é um trecho do nome (sem diferenciar maiúsculas);
+    `periodo_de`/`periodo_ate` são (mes, ano) de referência; o vencimento é um intervalo fechado.
+    """
+    p = PagamentoRealizado
+    condicoes = [p.status.in_([padronizar_status(s) for s in status or STATUS_HISTORICO])]
+    if tabelas:
+        condicoes.append(p.tabela_artista.in_(tabelas))
+    if artista:
+        condicoes.append(func.lower(p.artista_nome).contains(artista.strip().lower(), autoescape=True))
+    if mes:
+        condicoes.append(p.mes == mes)
+    if ano:
+        condicoes.append(p.ano == ano)
+    if periodo_de:
+        condicoes.append(p.ano * 100 + p.mes >= periodo_de[1] * 100 + periodo_de[0])
+    if periodo_ate:
+        condicoes.append(p.ano * 100 + p.mes <= periodo_ate[1] * 100 + periodo_ate[0])
+    if vencimento_de:
+        condicoes.append(p.vencimento >= vencimento_de)
+    if vencimento_ate:
+        condicoes.append(p.vencimento <= vencimento_ate)
+    return condicoes
+
+
+def _pagamentos_unicos(condicoes):
+    """
+    Um id por pagamento repetido (mesma chave que o antigo remover_duplicados: artista, mês,
+    ano, valor em centavos, status e vencimento), escolhido no GROUP BY.
+    """
+    p = PagamentoRealizado
+    return (
+        select(func.min(p.id).label('id'))
+        .where(*condicoes)
+        .group_by(p.artista_nome, p.mes, p.ano, func.round(p.valor_brl, 2), p.status, p.vencimento)
+        .subquery()
+    )
+
+
+def codificar_cursor(valor, ultimo_id: int) -> str:
+    if isinstance(valor, date):
+        valor = valor.isoformat()
+    return base64.urlsafe_b64encode(json.dumps([valor, ultimo_id]).encode()).decode()
+
+
+def decodificar_cursor(cursor: str, ordenar: str):
+    """(valor da ordenação, id) do último item da página anterior; ValueError se inválido."""
+    try:
+        valor, ultimo_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if ordenar == 'vencimento':
+            valor = date.fromisoformat(valor)
+        return valor, int(ultimo_id)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+
+def consultar_historico(condicoes: List, ordenar: str = 'vencimento', crescente: bool = False,
+                        cursor: Optional[str] = None, limite: int = ITENS_POR_PAGINA) -> Dict:
+    """
+    Uma página do histórico, sem duplicados, ordenada por `ordenar` (desempate pelo id).
+    Retorna {'pagamentos', 'proximo_cursor', 'total_pago'}; o total considera todos os
+    pagamentos filtrados, não só a página. Levanta ValueError para ordenação ou cursor inválidos.
+    """
+    if ordenar not in ORDENACOES_HISTORICO:
+        raise ValueError(f"Ordenação inválida: {ordenar}")
+    p = PagamentoRealizado
+    coluna, valor_do_item = ORDENACOES_HISTORICO[ordenar]
+    expressao = coluna(p)
+    limite = max(1, min(int(limite), LIMITE_POR_PAGINA))
+    unicos = _pagamentos_unicos(condicoes)
+
+    consulta = p.query.join(unicos, unicos.c.id == p.id)
+    if cursor:
+        valor, ultimo_id = decodificar_cursor(cursor, ordenar)
+        if crescente:
+            consulta = consulta.filter(or_(expressao > valor, and_(expressao == valor, p.id > ultimo_id)))
+        else:
+            consulta = consulta.filter(or_(expressao < valor, and_(expressao == valor, p.id < ultimo_id)))
+    if crescente:
+        consulta = consulta.order_by(expressao.asc(), p.id.asc())
+    else:
+        consulta = consulta.order_by(expressao.desc(), p.id.desc())
+
+    pagamentos = consulta.limit(limite + 1).all()
+    proximo_cursor = None
+    if len(pagamentos) > limite:
+        pagamentos = pagamentos[:limite]
+        ultimo = pagamentos[-1]
+        proximo_cursor = codificar_cursor(valor_do_item(ultimo), ultimo.id)
+
+    total_pago = db.session.execute(
+        select(func.coalesce(func.sum(p.valor_brl), 0))
+        .select_from(p)
+        .join(unicos, unicos.c.id == p.id)
+        .where(p.status == 'pago')
+    ).scalar()
+
+    return {'pagamentos': pagamentos, 'proximo_cursor': proximo_cursor, 'total_pago': float(total_pago or 0)}
+
+
+# ------------------- STATUS E NOME DO ARTISTA NA ESCRITA -------------------
+
+def _gravar_status_padronizado(mapper, connection, pagamento):
+    pagamento.status = padronizar_status(pagamento.status)
+
+
+def _propagar_nome(mapper, connection, artista):
+    """Artista renomeado: troca o artista_nome dos pagamentos dele no mesmo flush."""
+    if not inspect(artista).attrs.nome.history.has_changes():
+        return
+    tabela = PagamentoRealizado.__table__
+    connection.execute(
+        update(tabela)
+        .where(tabela.c.tabela_artista.in_(tabelas_do_modelo(type(artista))),
+               tabela.c.artista_id == artista.id)
+        .values(artista_nome=artista.nome)
+    )
+
+
+def _preencher_nome(mapper, connection, pagamento):
+    """Pagamento novo sem artista_nome: busca o nome no cadastro antes do INSERT."""
+    if pagamento.artista_nome:
+        return
+    modelo = MODELOS_POR_TABELA.get(pagamento.tabela_artista)
+    if modelo is None or not pagamento.artista_id:
+        return
+    pagamento.artista_nome = connection.execute(
+        select(modelo.nome).where(modelo.id == pagamento.artista_id)
+    ).scalar()
+
+
+event.listen(Artista, 'after_update', _propagar_nome)
+event.listen(ArtistaEspecial, 'after_update', _propagar_nome)
+event.listen(PagamentoRealizado, 'before_insert', _preencher_nome)
+event.listen(PagamentoRealizado, 'before_insert', _gravar_status_padronizado)
+event.listen(PagamentoRealizado, 'before_update', _gravar_status_padronizado)
+
+
+def varrer_pagamentos_se_necessario(intervalo: float = INTERVALO_VARREDURA_PADRAO) -> Optional[Dict[str, int]]:
+    """Executa a varredura se a última (neste processo) foi há mais de `intervalo` segundos."""
+    global _ultima_varredura
+    with _lock:
+        agora = time.monotonic()
+        if _ultima_varredura is not None and agora - _ultima_varredura < intervalo:
+            return None
+        _ultima_varredura = agora
+    return varrer_pagamentos()
+
+
+def _executar_varreduras(app, intervalo: float):
+    while True:
+        with app.app_context():
+            try:
+                varrer_pagamentos_se_necessario(intervalo)
+            except Exception as e:
+                db.session.rollback()
+                logger.warning(f"Varredura de pagamentos falhou: {e}")
+        time.sleep(intervalo)
+
+
+def iniciar_varredura_periodica(app) -> bool:
+    """Sobe (uma vez por processo) a thread que varre os pagamentos a cada intervalo."""
+    global _thread_varredura
+    if _thread_varredura is not None:
+        return False
+    intervalo = float(app.config.get('INTERVALO_VARREDURA_PAGAMENTOS', INTERVALO_VARREDURA_PADRAO))
+    if intervalo <= 0:
+        return False
+    with _lock:
+        if _thread_varredura is not None:
+            return False
+        _thread_varredura = threading.Thread(
+            target=_executar_varreduras, args=(app, intervalo), name='varredura-pagamentos', daemon=True)
+        _thread_varredura.start()
+    return True
@@ -0,0 +1,106 @@
+# services/painel_service.py
+"""
+Números do painel (/inicio) calculados no banco.
+
+Os três tipos de cálculo salvo (CalculoSalvo, CalculoEspecialSalvo, CalculoAssisaoSalvo)
+são lidos como uma só tabela por um UNION ALL (calculos_unificados). O top de artistas, os
+cálculos recentes e as contagens por tipo saem de agregados com GROUP BY/ORDER BY ... LIMIT;
+só as poucas linhas exibidas chegam ao Python, qualquer que seja o número de cálculos salvos.
+"""
+from typing import Dict, List
+
+from sqlalchemy import String, cast, func, literal, select, union_all
+
+from extensions import db
+from models import CalculoAssisaoSalvo, CalculoEspecialSalvo, CalculoSalvo
+from services.retroativos_service import MESES_POR_NOME
+
+# (modelo, tipo exibido nos cálculos recentes, chave da distribuição no painel)
+TIPOS_CALCULO = (
+    (CalculoSalvo, 'norm', 'normais'),
+    (CalculoEspecialSalvo, 'esp', 'especiais'),
+    (CalculoAssisaoSalvo, 'ass', 'assisao'),
+)
+ARTISTA_DESCONHECIDO = 'Artista desconhecido'
+LIMITE_PAINEL = 5
+
+
+def _selecao_calculos(modelo, tipo: str):
+    """Colunas comuns de um tipo de cálculo (mes e ano como texto: os tipos variam entre as tabelas)."""
+    return select(
+        modelo.id.label('id'),
+        literal(tipo).label('tipo'),
+        func.coalesce(func.nullif(modelo.artista, ''), ARTISTA_DESCONHECIDO).label('artista'),
+        cast(modelo.mes, String).label('mes'),
+        cast(modelo.ano, String).label('ano'),
+        modelo.valor_eur.label('valor_eur'),
+        modelo.valor_brl.label('valor_brl'),
+        modelo.cotacao.label('cotacao'),
+        modelo.data_calculo.label('data_calculo'),
+    )
+
+
+def calculos_unificados():
+    """Os três tipos de cálculo salvo numa subconsulta UNION ALL."""
+    return union_all(*(_selecao_calculos(modelo, tipo) for modelo, tipo, _ in TIPOS_CALCULO)).subquery('calculos_unificados')
+
+
+def mes_inteiro(mes):
+    """'3', 3 ou 'Março' → 3; None se não reconhecer."""
+    texto = str(mes or '').strip()
+    if texto.isdigit():
+        return int(texto)
+    return MESES_POR_NOME.get(texto.lower())
+
+
+def buscar_top_artistas(limite: int = LIMITE_PAINEL) -> List[Dict]:
+    """Artistas com maior soma de valor_brl (cada cálculo arredondado em centavos, como antes)."""
+    calculos = calculos_unificados()
+    total = func.sum(func.round(calculos.c.valor_brl, 2)).label('total_brl')
+    linhas = db.session.execute(
+        select(calculos.c.artista, total)
+        .group_by(calculos.c.artista)
+        .order_by(total.desc())
+        .limit(limite)
+    )
+    return [{'artista': artista, 'total_brl': float(total_brl or 0)} for artista, total_brl in linhas]
+
+
+def buscar_calculos_recentes(limite: int = LIMITE_PAINEL) -> List[Dict]:
+    """
+    Os `limite` cálculos mais recentes dos três tipos. Cada tipo é ordenado e limitado
+    antes do UNION ALL, para usar o índice de data_calculo da própria tabela.
+    """
+    ramos = [
+        _selecao_calculos(modelo, tipo)
+        .where(modelo.data_calculo.is_not(None))
+        .order_by(modelo.data_calculo.desc(), modelo.id.desc())
+        .limit(limite)
+        .subquery()
+        for modelo, tipo, _ in TIPOS_CALCULO
+    ]
+    recentes = union_all(*(select(ramo) for ramo in ramos)).subquery('calculos_recentes')
+    linhas = db.session.execute(
+        select(recentes).order_by(recentes.c.data_calculo.desc(), recentes.c.id.desc()).limit(limite)
+    ).mappings()
+
+    return [{
+        'id': linha['id'],
+        'tipo': linha['tipo'],
+        'artista': linha['artista'],
+        'mes': mes_inteiro(linha['mes']),
+        'ano': linha['ano'] or '',
+        'valor_eur': round(float(linha['valor_eur'] or 0), 4),
+        'valor_brl': round(float(linha['valor_brl'] or 0), 2),
+        'cotacao': float(linha['cotacao'] or 0),
+        'status': 'aguardando',
+        'data_calculo': linha['data_calculo'].strftime('%d/%m/%Y') if linha['data_calculo'] else None,
+    } for linha in linhas]
+
+
+def contar_calculos() -> Dict[str, int]:
+    """{chave da distribuição: quantidade de cálculos salvos} (um COUNT por tabela)."""
+    return {
+        chave: db.session.execute(select(func.count()).select_from(modelo)).scalar() or 0
+        for modelo, _, chave in TIPOS_CALCULO
+    }
@@ -0,0 +1,585 @@
+# services/planilhas_service.py
+import codecs
+import csv
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+
+from services.colunas_service import (
+    COLUNAS_EXTRATO,
+    colunas_projetadas,
+    detectar_colunas,
+    filtro_usecols,
+)
+from services.dinheiro_service import analisar_lucro
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    from pyarrow import feather
+except ImportError:  # sem pyarrow os extratos continuam sendo lidos da planilha original
+    pa = None
+    feather = None
+
+logger = logging.getLogger(__name__)
+
+if feather is None:
+    logger.warning("pyarrow não instalado: snapshots colunares desativados, os extratos são lidos da planilha original.")
+
+LIMITE_CACHE_MB_PADRAO = 512
+LIMITE_STREAMING_MB_PADRAO = 50
+LINHAS_POR_LOTE = 100_000
+
+PASTA_SNAPSHOTS = '.snapshots'
+# Snapshots sem esta versão vieram de CSVs lidos com inferência de tipo (lucro via float)
+VERSAO_SNAPSHOT = b'2'
+LINHAS_POR_LOTE_SNAPSHOT = 64 * 1024
+
+LIMITE_UPLOAD_BYTES = 150 * 1024 * 1024
+TAMANHO_BLOCO_UPLOAD = 1024 * 1024
+
+_cache_extratos = OrderedDict()
+_cache_bytes = 0
+_hashes_por_stat = {}
+_lock = threading.Lock()
+# Conversões colunares disparadas pelo upload rodam fora da requisição, uma de cada vez
+_executor_snapshots = ThreadPoolExecutor(max_workers=1, thread_name_prefix='snapshot')
+
+
+# ------------------- LEITURA -------------------
+
+def _detectar_separador(caminho: str, encoding: str) -> str:
+    """Detecta o separador pelo cabeçalho, como o sep=None do pandas, mas sem o engine python."""
+    with open(caminho, 'r', encoding=encoding, newline='') as f:
+        primeira_linha = f.readline()
+    try:
+        return csv.Sniffer().sniff(primeira_linha, delimiters=';,\t|').delimiter
+    except csv.Error:
+        return ','
+
+
+def ler_planilha(caminho: str, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Lê um extrato CSV/XLS/XLSX como DataFrame bruto (só `colunas`, quando informadas).
+    CSV é lido como texto (dtype=str), igual à leitura em lotes de _lotes_csv: o lucro não
+    passa por float e o total não depende do tamanho do arquivo.
+    """
+    ext = os.path.splitext(caminho)[1].lower()
+    usecols = filtro_usecols(colunas)
+
+    if ext == '.csv':
+        try:
+            sep = _detectar_separador(caminho, 'utf-8')
+            return pd.read_csv(caminho, sep=sep, encoding='utf-8', on_bad_lines='skip', usecols=usecols, dtype=str)
+        except Exception:
+            # tenta com outro encoding
+            sep = _detectar_separador(caminho, 'latin1')
+            return pd.read_csv(caminho, sep=sep, encoding='latin1', on_bad_lines='skip', usecols=usecols, dtype=str)
+    elif ext in ['.xls', '.xlsx']:
+        return pd.read_excel(caminho, usecols=usecols)
+    else:
+        raise Exception("Formato de arquivo não suportado. Use XLSX, XLS ou CSV.")
+
+
+# ------------------- SNAPSHOT COLUNAR -------------------
+
+def caminho_snapshot(caminho: str) -> str:
+    """Snapshot fica ao lado do original, numa subpasta oculta: <pasta>/.snapshots/<arquivo>.feather"""
+    pasta, nome = os.path.split(caminho)
+    return os.path.join(pasta, PASTA_SNAPSHOTS, nome + '.feather')
+
+
+def snapshot_valido(caminho: str, snapshot: Optional[str]) -> bool:
+    """O snapshot só vale se existir, for mais novo que a planilha original e da versão atual."""
+    if feather is None or not snapshot or not os.path.exists(snapshot):
+        return False
+    if os.path.getmtime(snapshot) < os.path.getmtime(caminho):
+        return False
+    try:
+        with pa.memory_map(snapshot, 'r') as origem:
+            metadados = pa.ipc.open_file(origem).schema.metadata or {}
+    except Exception:
+        return False
+    return metadados.get(b'versao') == VERSAO_SNAPSHOT
+
+
+def _coluna_texto(serie: pd.Series):
+    """Coluna como texto (str() de cada célula, nulos preservados) codificada em dicionário."""
+    codigos, distintos = pd.factorize(serie)
+    # Valores distintos que viram o mesmo texto (ex.: 1 e '1') compartilham a entrada do dicionário
+    codigos_texto, dicionario = pd.factorize(np.array([str(v) for v in distintos], dtype=object))
+    indices = np.where(codigos >= 0, codigos_texto[np.maximum(codigos, 0)] if len(distintos) else 0, -1)
+    return pa.DictionaryArray.from_arrays(
+        pa.array(indices, type=pa.int32(), mask=indices < 0),
+        pa.array(list(dicionario), type=pa.string()),
+    )
+
+
+def salvar_snapshot(df: pd.DataFrame, destino: str) -> Optional[str]:
+    """
+    Grava o DataFrame bruto como Feather (Arrow IPC) sem compressão, para poder ser lido
+    por memory-map. Todas as colunas viram texto com dicionário, o que comprime bem
+    artistas e títulos repetidos.
+    """
+    if feather is None:
+        return None
+    colunas = [str(c).strip() for c in df.columns]
+    tabela = pa.table({nome: _coluna_texto(df.iloc[:, i]) for i, nome in enumerate(colunas)},
+                      metadata={b'versao': VERSAO_SNAPSHOT})
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    temporario = f"{destino}.{os.getpid()}.{threading.get_ident()}.tmp"
+    feather.write_feather(tabela, temporario, compression='uncompressed', chunksize=LINHAS_POR_LOTE_SNAPSHOT)
+    os.replace(temporario, destino)
+    return destino
+
+
+def ler_snapshot(snapshot: str, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+    """Lê o snapshot por memory-map; colunas de texto voltam como categóricas."""
+    tabela = feather.read_table(snapshot, columns=colunas, memory_map=True)
+    return tabela.to_pandas()
+
+
+def ler_planilha_com_snapshot(caminho: str, leitor: Callable[[str], pd.DataFrame] = ler_planilha,
+                              snapshot: Optional[str] = None, colunas: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Lê a planilha a partir do snapshot colunar quando ele existe e está atualizado;
+    caso contrário usa o leitor original e aproveita para gravar o snapshot.
+
+    Com `colunas` (mapeamento já conhecido), lê só essas colunas. Sem snapshot, a leitura
+    projetada não serve para gravá-lo; a cópia completa fica com agendar_snapshot.
+    """
+    snapshot = snapshot or caminho_snapshot(caminho)
+    if snapshot_valido(caminho, snapshot):
+        try:
+            return _projetar(ler_snapshot(snapshot), colunas)
+        except Exception as e:
+            logger.warning(f"Snapshot inválido para {caminho}, relendo a planilha: {e}")
+
+    if colunas and leitor is ler_planilha:
+        if feather is not None:
+            agendar_snapshot(caminho, leitor)
+        return ler_planilha(caminho, colunas)
+
+    df = leitor(caminho)
+    if feather is not None:
+        try:
+            salvar_snapshot(df, snapshot)
+        except Exception as e:
+            logger.warning(f"Não foi possível gravar o snapshot de {caminho}: {e}")
+    return df
+
+
+def _projetar(df: pd.DataFrame, colunas: Optional[List[str]]) -> pd.DataFrame:
+    if not colunas:
+        return df
+    return df[[c for c in df.columns if str(c).strip() in colunas]]
+
+
+def remover_snapshot(caminho: str, snapshot: Optional[str] = None):
+    snapshot = snapshot or caminho_snapshot(caminho)
+    if os.path.exists(snapshot):
+        os.remove(snapshot)
+
+
+def agendar_snapshot(caminho: str, leitor: Callable[[str], pd.DataFrame] = ler_planilha,
+                     ao_concluir: Optional[Callable[[Dict], None]] = None) -> Optional[str]:
+    """
+    Lê a planilha em segundo plano, grava o snapshot e devolve o caminho onde ele ficará.
+    Até a conversão terminar, snapshot_valido() é falso e as leituras usam o original.
+
+    `ao_concluir` recebe os metadados da leitura (total_linhas, colunas_detectadas,
+    tempo_leitura) para que o chamador os registre no banco.
+    """
+    def converter():
+        try:
+            inicio = time.perf_counter()
+            df = leitor(caminho)
+            if feather is not None:
+                salvar_snapshot(df, caminho_snapshot(caminho))
+            metadados = {
+                'total_linhas': len(df),
+                'colunas_detectadas': detectar_colunas_extrato(df),
+                'tempo_leitura': time.perf_counter() - inicio,
+            }
+            if ao_concluir is not None:
+                ao_concluir(metadados)
+        except Exception as e:
+            logger.warning(f"Conversão do upload {caminho} falhou: {e}")
+
+    _executor_snapshots.submit(converter)
+    return caminho_snapshot(caminho) if feather is not None else None
+
+
+def salvar_extrato_compartilhado(extrato: pd.DataFrame) -> Optional[str]:
+    """
+    Grava um extrato normalizado (ver montar_extrato) num Feather temporário, para que
+    outros processos o leiam por memory-map em vez de receberem o DataFrame serializado.
+    O lucro vai como texto, preservando o Decimal exato. O chamador remove o arquivo.
+    """
+    if feather is None:
+        return None
+    descritor, destino = tempfile.mkstemp(prefix='extrato_', suffix='.feather')
+    os.close(descritor)
+    try:
+        salvar_snapshot(extrato, destino)
+    except Exception:
+        os.remove(destino)
+        raise
+    return destino
+
+
+def ler_extrato_compartilhado(caminho: str) -> pd.DataFrame:
+    """Inverso de salvar_extrato_compartilhado: artista/título categóricos e lucro em Decimal."""
+    extrato = ler_snapshot(caminho)
+    lucro = extrato['lucro'].astype('category')
+    # código -1 (nulo) cai na primeira posição
+    valores = np.array([None] + [Decimal(v) for v in lucro.cat.categories], dtype=object)
+    extrato['lucro'] = pd.Series(valores[lucro.cat.codes.to_numpy() + 1], index=extrato.index, dtype=object)
+    return extrato
+
+
+# ------------------- UPLOAD -------------------
+
+def receber_upload(arquivo, pasta: str, limite_bytes: int = LIMITE_UPLOAD_BYTES) -> Tuple[str, int, str]:
+    """
+    Grava o upload (FileStorage) num arquivo temporário da pasta, bloco a bloco, contando
+    bytes e calculando o SHA-256 no caminho. Passou do limite: apaga o parcial e levanta
+    ValueError. Retorna (temporario, tamanho, sha256); o chamador decide entre
+    publicar_upload e descartar (conteúdo já importado).
+    """
+    temporario = os.path.join(pasta, f".upload.{os.getpid()}.{threading.get_ident()}.parcial")
+    sha = hashlib.sha256()
+    tamanho = 0
+    try:
+        with open(temporario, 'wb') as saida:
+            for bloco in iter(lambda: arquivo.stream.read(TAMANHO_BLOCO_UPLOAD), b''):
+                tamanho += len(bloco)
+                if tamanho > limite_bytes:
+                    raise ValueError(f"Arquivo excede o limite de {limite_bytes // (1024 * 1024)}MB.")
+                sha.update(bloco)
+                saida.write(bloco)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return temporario, tamanho, sha.hexdigest()
+
+
+def nome_para_upload(pasta: str, nome: str, digest: str, nome_em_uso=lambda nome: False) -> str:
+    """
+    Nome em disco para um upload novo: o próprio `nome` se estiver livre (nem arquivo na
+    pasta nem `nome_em_uso`), senão com o início do hash ("extrato_3fa2c1d9e0b4.csv"). Um
+    upload nunca sobrescreve o arquivo de outro ArquivoImportado, cujo hash ficaria errado.
+    """
+    base, ext = os.path.splitext(nome)
+    for candidato in (nome, f"{base}_{digest[:12]}{ext}"):
+        if not os.path.exists(os.path.join(pasta, candidato)) and not nome_em_uso(candidato):
+            return candidato
+    # Com o hash inteiro o nome só colide com o mesmo conteúdo
+    return f"{base}_{digest}{ext}"
+
+
+def publicar_upload(temporario: str, destino: str, digest: str):
+    """Move o upload completo para o destino final e registra o hash já conhecido."""
+    os.replace(temporario, destino)
+    # Evita reler o arquivo no primeiro cálculo
+    stat = os.stat(destino)
+    with _lock:
+        _hashes_por_stat[(os.path.abspath(destino), stat.st_size, stat.st_mtime_ns)] = digest
+
+
+# ------------------- LEITURA EM LOTES -------------------
+
+def _detectar_encoding(caminho: str) -> str:
+    """utf-8 se o arquivo inteiro decodificar, senão latin1 (mesmo fallback de ler_planilha)."""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    with open(caminho, 'rb') as f:
+        try:
+            for bloco in iter(lambda: f.read(1024 * 1024), b''):
+                decoder.decode(bloco)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            return 'latin1'
+    return 'utf-8'
+
+
+def _valor_celula_excel(valor):
+    """Converte a célula do openpyxl como o read_excel faria (inteiros sem '.0') e vira texto."""
+    if valor is None:
+        return np.nan
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor)
+
+
+def _lotes_snapshot(snapshot: str, selecionar_colunas) -> Iterator[pd.DataFrame]:
+    with pa.memory_map(snapshot, 'r') as origem:
+        leitor = pa.ipc.open_file(origem)
+        originais = {str(c).strip(): c for c in leitor.schema.names}
+        colunas = selecionar_colunas(list(originais))
+        for i in range(leitor.num_record_batches):
+            lote = pa.Table.from_batches([leitor.get_batch(i)]).select([originais[c] for c in colunas]).to_pandas()
+            lote.columns = colunas
+            yield lote.astype(object)
+
+
+def _lotes_csv(caminho: str, selecionar_colunas, tamanho_lote: int, sep: Optional[str]) -> Iterator[pd.DataFrame]:
+    encoding = _detectar_encoding(caminho)
+    sep = sep or _detectar_separador(caminho, encoding)
+    cabecalho = pd.read_csv(caminho, sep=sep, encoding=encoding, nrows=0).columns
+    originais = {str(c).strip(): c for c in cabecalho}
+    colunas = selecionar_colunas(list(originais))
+    usecols = [originais[c] for c in colunas]
+
+    for lote in pd.read_csv(caminho, sep=sep, encoding=encoding, usecols=usecols, dtype=str,
+                            on_bad_lines='skip', chunksize=tamanho_lote):
+        lote.columns = [str(c).strip() for c in lote.columns]
+        yield lote
+
+
+def _lotes_xlsx(caminho: str, selecionar_colunas, tamanho_lote: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(caminho, read_only=True, data_only=True)
+    try:
+        linhas = wb.worksheets[0].iter_rows(values_only=True)
+        cabecalho = [str(c).strip() if c is not None else '' for c in next(linhas, ())]
+        colunas = selecionar_colunas(cabecalho)
+        indices = [cabecalho.index(c) for c in colunas]
+
+        buffer = []
+        for linha in linhas:
+            buffer.append([_valor_celula_excel(linha[i]) if i < len(linha) else np.nan for i in indices])
+            if len(buffer) >= tamanho_lote:
+                yield pd.DataFrame(buffer, columns=colunas, dtype=object)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=colunas, dtype=object)
+    finally:
+        wb.close()
+
+
+def ler_planilha_em_lotes(caminho: str, selecionar_colunas: Callable[[List[str]], List[str]],
+                          tamanho_lote: int = LINHAS_POR_LOTE, snapshot: Optional[str] = None,
+                          sep: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    Gera a planilha em lotes de até `tamanho_lote` linhas, só com as colunas escolhidas por
+    `selecionar_colunas(cabecalho)` e sempre com dtype object (texto ou NaN), para que o
+    consumo de memória não dependa do tamanho do arquivo.
+
+    Ordem de preferência: snapshot colunar atualizado, CSV em chunks, XLSX em modo read-only.
+    Arquivos .xls (sem leitura incremental) são lidos inteiros e fatiados.
+    """
+    snapshot = snapshot or caminho_snapshot(caminho)
+    if snapshot_valido(caminho, snapshot):
+        yield from _lotes_snapshot(snapshot, selecionar_colunas)
+        return
+
+    ext = os.path.splitext(caminho)[1].lower()
+    if ext == '.csv':
+        yield from _lotes_csv(caminho, selecionar_colunas, tamanho_lote, sep)
+    elif ext == '.xlsx':
+        yield from _lotes_xlsx(caminho, selecionar_colunas, tamanho_lote)
+    elif ext == '.xls':
+        df = pd.read_excel(caminho, dtype=str)
+        df.columns = [str(c).strip() for c in df.columns]
+        df = df[selecionar_colunas(list(df.columns))]
+        for inicio in range(0, len(df), tamanho_lote):
+            yield df.iloc[inicio:inicio + tamanho_lote]
+    else:
+        raise Exception("Formato de arquivo não suportado. Use XLSX, XLS ou CSV.")
+
+
+def detectar_colunas_extrato(df: pd.DataFrame) -> Dict[str, str]:
+    """Cabeçalho da planilha correspondente a cada coluna do extrato (só as encontradas)."""
+    df.columns = [str(c).strip() for c in df.columns]
+    colunas = detectar_colunas(df.columns)
+    return {chave: colunas[chave] for chave in COLUNAS_EXTRATO if chave in colunas}
+
+
+def montar_extrato(df: pd.DataFrame):
+    """
+    Normaliza um DataFrame bruto para o formato usado pelos cálculos:
+    artista e título categóricos (texto) e lucro como Decimal exato (None quando inválido).
+    Retorna (extrato, colunas_detectadas).
+    """
+    colunas = detectar_colunas_extrato(df)
+
+    if not colunas.get('artista') or not colunas.get('lucro'):
+        raise ValueError("A planilha está sem as colunas obrigatórias (Nome do artista / Lucro Líquido).")
+
+    if colunas.get('titulo'):
+        titulos = df[colunas['titulo']].astype(object).fillna('').astype(str)
+    else:
+        titulos = pd.Series('', index=df.index)
+
+    lucros, invalidos = analisar_lucro(df[colunas['lucro']])
+    if invalidos.any():
+        logger.warning(f"{int(invalidos.sum())} célula(s) de lucro inválida(s) ignorada(s) "
+                       f"(coluna '{colunas['lucro']}').")
+
+    extrato = pd.DataFrame({
+        'artista': df[colunas['artista']].astype(str).astype('category'),
+        'titulo': titulos.astype('category'),
+        'lucro': lucros,
+    }).reset_index(drop=True)
+
+    return extrato, colunas
+
+
+# ------------------- CACHE DE EXTRATOS -------------------
+
+def caminho_do_arquivo(arquivo) -> str:
+    """Caminho em disco de um ArquivoImportado (pasta de upload, com fallback para o caminho salvo)."""
+    caminho = os.path.join(current_app.config['UPLOAD_FOLDER'], arquivo.nome_arquivo)
+    if not os.path.exists(caminho) and arquivo.caminho and os.path.exists(arquivo.caminho):
+        return arquivo.caminho
+    return caminho
+
+
+def calcular_hash_arquivo(caminho: str) -> str:
+    """SHA-256 do conteúdo, recalculado apenas quando tamanho ou mtime mudam."""
+    stat = os.stat(caminho)
+    chave_stat = (os.path.abspath(caminho), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        if chave_stat in _hashes_por_stat:
+            return _hashes_por_stat[chave_stat]
+
+    sha = hashlib.sha256()
+    with open(caminho, 'rb') as f:
+        for bloco in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(bloco)
+    digest = sha.hexdigest()
+
+    with _lock:
+        _hashes_por_stat[chave_stat] = digest
+    return digest
+
+
+def _limite_cache_bytes() -> int:
+    return int(current_app.config.get('CACHE_EXTRATOS_MB', LIMITE_CACHE_MB_PADRAO)) * 1024 * 1024
+
+
+def _remover_entrada(chave):
+    global _cache_bytes
+    entrada = _cache_extratos.pop(chave)
+    _cache_bytes -= entrada['bytes']
+
+
+def _guardar_entrada(chave, entrada: Dict):
+    global _cache_bytes
+    limite = _limite_cache_bytes()
+    with _lock:
+        # Versões antigas do mesmo arquivo não serão mais usadas
+        for antiga in [k for k in _cache_extratos if k[0] == chave[0] and k != chave]:
+            _remover_entrada(antiga)
+
+        if entrada['bytes'] > limite:
+            return
+
+        if chave in _cache_extratos:
+            _remover_entrada(chave)
+        _cache_extratos[chave] = entrada
+        _cache_bytes += entrada['bytes']
+
+        # LRU: descarta os menos usados até caber no orçamento
+        while _cache_bytes > limite and _cache_extratos:
+            _remover_entrada(next(iter(_cache_extratos)))
+
+
+def obter_extrato(arquivo, exigir_titulo: bool = False) -> pd.DataFrame:
+    """
+    Retorna o extrato normalizado de um ArquivoImportado.
+
+    O resultado fica em cache por (id, hash do conteúdo, mtime), então cálculos repetidos
+    sobre a mesma planilha não a reprocessam. O DataFrame é compartilhado: não o altere
+    no lugar (use assign/copy).
+    """
+    caminho = caminho_do_arquivo(arquivo)
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(f"Arquivo {arquivo.nome_arquivo} não encontrado na pasta uploads. Favor importar novamente.")
+
+    chave = (arquivo.id, calcular_hash_arquivo(caminho), os.stat(caminho).st_mtime_ns)
+
+    with _lock:
+        entrada = _cache_extratos.get(chave)
+        if entrada is not None:
+            _cache_extratos.move_to_end(chave)
+
+    if entrada is None:
+        snapshot = getattr(arquivo, 'snapshot_caminho', None)
+        # Mapeamento gravado no upload: lê só as colunas do extrato desde o início
+        projetadas = colunas_projetadas(getattr(arquivo, 'colunas', None) or {})
+        try:
+            extrato, colunas = montar_extrato(ler_planilha_com_snapshot(caminho, snapshot=snapshot,
+                                                                       colunas=projetadas))
+        except ValueError:
+            if not projetadas:
+                raise
+            extrato, colunas = montar_extrato(ler_planilha_com_snapshot(caminho, snapshot=snapshot))
+        entrada = {
+            'df': extrato,
+            'colunas': colunas,
+            'bytes': int(extrato.memory_usage(deep=True).sum()),
+        }
+        _guardar_entrada(chave, entrada)
+
+    if exigir_titulo and not entrada['colunas'].get('titulo'):
+        raise ValueError("A planilha está sem a coluna obrigatória 'Título do lançamento'.")
+
+    return entrada['df']
+
+
+def _limite_streaming_bytes() -> int:
+    return int(current_app.config.get('STREAMING_EXTRATO_MB', LIMITE_STREAMING_MB_PADRAO)) * 1024 * 1024
+
+
+def _selecionar_colunas_extrato(cabecalho: List[str]) -> List[str]:
+    return colunas_projetadas(detectar_colunas(cabecalho))
+
+
+def iterar_extrato(arquivo, tamanho_lote: int = LINHAS_POR_LOTE) -> Iterator[pd.DataFrame]:
+    """
+    Extrato de um ArquivoImportado em lotes, para agregação incremental.
+
+    Se o extrato já está em cache (ou o arquivo é pequeno), há um único lote vindo de
+    obter_extrato. Arquivos acima de STREAMING_EXTRATO_MB são lidos em lotes de tamanho
+    fixo, sem carregar a planilha inteira nem ocupar o cache.
+    """
+    caminho = caminho_do_arquivo(arquivo)
+    if not os.path.exists(caminho):
+        raise FileNotFoundError(f"Arquivo {arquivo.nome_arquivo} não encontrado na pasta uploads. Favor importar novamente.")
+
+    chave = (arquivo.id, calcular_hash_arquivo(caminho), os.stat(caminho).st_mtime_ns)
+    with _lock:
+        em_cache = chave in _cache_extratos
+
+    if em_cache or os.path.getsize(caminho) <= _limite_streaming_bytes():
+        return iter([obter_extrato(arquivo)])
+
+    def lotes():
+        snapshot = getattr(arquivo, 'snapshot_caminho', None)
+        for lote in ler_planilha_em_lotes(caminho, _selecionar_colunas_extrato, tamanho_lote, snapshot=snapshot):
+            extrato, _ = montar_extrato(lote)
+            yield extrato
+
+    return lotes()
+
+
+def limpar_cache_extratos(arquivo_id: Optional[int] = None):
+    """Remove do cache um arquivo específico (ou tudo, sem argumento)."""
+    with _lock:
+        for chave in [k for k in _cache_extratos if arquivo_id is None or k[0] == arquivo_id]:
+            _remover_entrada(chave)
@@ -0,0 +1,94 @@
+# services/pool_calculos_service.py
+"""
+Processos do fechamento em lote (calcular_fechamento com workers > 1).
+
+O pool é criado uma vez e reaproveitado entre as requisições; só é recriado quando o número
+de processos muda ou quando um deles morre. Este módulo é o alvo das tarefas do pool e não
+importa app.py (nem o que ele importa só para subir o Flask): cada processo carrega apenas
+o cálculo dos ArtistaEspecial e a leitura do extrato compartilhado.
+"""
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import ROUND_HALF_UP, getcontext
+from typing import Optional
+
+from services.calculos_service import ArtistaLote, calcular_artista_especial, preparar_extratos_especiais
+from services.planilhas_service import ler_extrato_compartilhado, salvar_extrato_compartilhado
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_workers_pool = 0
+_trava_pool = threading.Lock()
+
+
+def _iniciar_processo():
+    getcontext().prec = 20
+    getcontext().rounding = ROUND_HALF_UP
+
+
+def _calcular_fatia(caminho_extrato: str, fatia, cotacao_valor):
+    # Os extratos preparados vivem só durante a tarefa: o pool fica ocioso sem segurar memória
+    df_especial, df_assisao = preparar_extratos_especiais(ler_extrato_compartilhado(caminho_extrato))
+    return [
+        (indice, calcular_artista_especial(artista, df_especial, df_assisao, cotacao_valor, nomes))
+        for indice, artista, nomes in fatia
+    ]
+
+
+def obter_pool(workers: int) -> ProcessPoolExecutor:
+    """O pool de `workers` processos, criado na primeira chamada e reaproveitado nas seguintes."""
+    global _pool, _workers_pool
+    with _trava_pool:
+        if _pool is not None and _workers_pool != workers:
+            _pool.shutdown(wait=False)
+            _pool = None
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_processo)
+            _workers_pool = workers
+        return _pool
+
+
+def descartar_pool():
+    """Encerra o pool; a próxima chamada a obter_pool cria outro."""
+    global _pool
+    with _trava_pool:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+atexit.register(descartar_pool)
+
+
+def calcular_especiais_em_pool(extrato, artistas, cotacao_valor, workers: int, nomes_por_artista):
+    """
+    Distribui os ArtistaEspecial entre os `workers` processos do pool. O extrato vai por um
+    Feather temporário lido por memory-map; cada fatia prepara os DataFrames uma única vez.
+    Retorna os resultados na ordem de `artistas`, ou None se não houver como compartilhar.
+    """
+    caminho = salvar_extrato_compartilhado(extrato)
+    if caminho is None:
+        return None
+
+    try:
+        indexados = [(i, ArtistaLote(a), nomes_por_artista[a.id]) for i, a in enumerate(artistas)]
+        # Intercalado, para que artistas com muitos títulos não caiam todos na mesma fatia
+        fatias = [indexados[i::workers] for i in range(workers) if indexados[i::workers]]
+        executor = obter_pool(workers)
+        try:
+            calculados = [par for parcial in executor.map(_calcular_fatia, [caminho] * len(fatias), fatias,
+                                                          [cotacao_valor] * len(fatias))
+                          for par in parcial]
+        except BrokenProcessPool:
+            logger.warning("Um processo do pool de cálculo morreu; o pool será recriado no próximo fechamento.")
+            descartar_pool()
+            raise
+    finally:
+        os.remove(caminho)
+
+    return [resultado for _, resultado in sorted(calculados, key=lambda par: par[0])]
@@ -0,0 +1,272 @@
+# services/retroativos_service.py
+"""
+Gravação em massa no banco de retroativos (bind 'retroativos').
+
+Numa importação de um ano são centenas de milhares de linhas, e montar um objeto ORM por
+linha (bulk_save_objects) passa a ser o custo dominante depois que a leitura é vetorizada.
+CarregadorRetroativos grava com insert() do SQLAlchemy Core em lotes de parâmetros (executemany
+do sqlite3), numa conexão própria ajustada para carga: WAL, synchronous=NORMAL e cache maior.
+Os ajustes por conexão voltam ao valor anterior quando a carga termina.
+
+Na mesma transação de cada arquivo, o resumo mensal (RetroativoMensal) dos artistas tocados
+é recalculado a partir das linhas; assim os relatórios somam poucas linhas por artista e
+mês, qualquer que seja o tamanho de retroativos_calculados.
+
+Artista e título também são gravados normalizados (artista_norm/titulo_norm, ver
+normalizar_chave), com índices compostos, para que os filtros dos relatórios não precisem
+aplicar lower() linha a linha.
+"""
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, bindparam, case, cast, delete, func, insert, select, update
+
+from extensions import db
+from retroativos_models import RetroativoArquivo, RetroativoCalculado, RetroativoMensal
+
+LINHAS_POR_INSERT = 5000
+LOTE_ARTISTAS = 500  # nomes por IN (...) no recálculo do resumo
+CACHE_CARGA_KB = 64 * 1024
+# Ajustes da conexão de carga; journal_mode=WAL é gravado no arquivo e vale para as próximas conexões
+PRAGMAS_CARGA = {
+    'synchronous': 'NORMAL',
+    'cache_size': str(-CACHE_CARGA_KB),  # negativo = KiB
+    'temp_store': 'MEMORY',
+}
+
+
+# Planilhas antigas gravaram o nome do mês em vez do número
+MESES_POR_NOME = {
+    'janeiro': 1, 'fevereiro': 2, 'março': 3, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+}
+COLUNAS_RESUMO = ['artista', 'titulo', 'ano', 'mes', 'lucro_liquido', 'linhas', 'artista_norm', 'titulo_norm']
+
+
+def engine_retroativos():
+    return db.engines['retroativos']
+
+
+def normalizar_chave(texto) -> Optional[str]:
+    """Chave de busca de artista/título: minúsculas e sem espaços nas pontas (None fica None)."""
+    if texto is None:
+        return None
+    return str(texto).strip().lower()
+
+
+def mes_numerico(coluna):
+    """Expressão SQL do mês como inteiro, aceitando também o nome do mês por extenso."""
+    return case(
+        *[(func.lower(coluna) == nome, numero) for nome, numero in MESES_POR_NOME.items()],
+        else_=cast(coluna, Integer)
+    )
+
+
+def _consulta_resumo(*condicoes):
+    calculados = RetroativoCalculado.__table__
+    return (
+        select(calculados.c.artista, calculados.c.titulo, calculados.c.ano, calculados.c.mes,
+               func.sum(calculados.c.lucro_liquido), func.count(),
+               func.max(calculados.c.artista_norm), func.max(calculados.c.titulo_norm))
+        .where(*condicoes)
+        .group_by(calculados.c.artista, calculados.c.titulo, calculados.c.ano, calculados.c.mes)
+    )
+
+
+def recalcular_resumo(conexao, ano: int, artistas: Iterable[str]):
+    """Refaz, na transação de `conexao`, as linhas de RetroativoMensal dos artistas no ano."""
+    resumo = RetroativoMensal.__table__
+    calculados = RetroativoCalculado.__table__
+    artistas = sorted({artista for artista in artistas if artista is not None})
+    for inicio in range(0, len(artistas), LOTE_ARTISTAS):
+        lote = artistas[inicio:inicio + LOTE_ARTISTAS]
+        conexao.execute(delete(resumo).where(resumo.c.ano == ano, resumo.c.artista.in_(lote)))
+        conexao.execute(insert(resumo).from_select(
+            COLUNAS_RESUMO, _consulta_resumo(calculados.c.ano == ano, calculados.c.artista.in_(lote))))
+
+
+def reconstruir_resumo_mensal(engine=None, ano: Optional[int] = None):
+    """Refaz o resumo mensal inteiro (ou só de um ano) a partir de retroativos_calculados."""
+    resumo = RetroativoMensal.__table__
+    calculados = RetroativoCalculado.__table__
+    filtro_resumo = [resumo.c.ano == ano] if ano is not None else []
+    filtro_calculados = [calculados.c.ano == ano] if ano is not None else []
+    with (engine or engine_retroativos()).begin() as conexao:
+        conexao.execute(delete(resumo).where(*filtro_resumo))
+        conexao.execute(insert(resumo).from_select(COLUNAS_RESUMO, _consulta_resumo(*filtro_calculados)))
+
+
+# Colunas cuja criação (atualizar_esquema_retroativos) indica um banco com linhas antigas
+COLUNAS_NORMALIZADAS = {('retroativos_calculados', 'artista_norm'), ('retroativos_calculados', 'titulo_norm')}
+
+
+def precisa_normalizar(adicionadas) -> bool:
+    """Se as colunas adicionadas agora pedem normalizar_retroativos_existentes (só bancos antigos)."""
+    return bool(COLUNAS_NORMALIZADAS & set(adicionadas))
+
+
+def normalizar_retroativos_existentes(engine=None) -> int:
+    """
+    Acerta as linhas gravadas antes das colunas normalizadas: mês por extenso vira número e
+    artista_norm/titulo_norm são preenchidos (um UPDATE por valor distinto). Se algo mudou,
+    ou se o resumo mensal ainda não tem as chaves, o resumo é reconstruído.
+    Varre a tabela inteira: roda uma vez, quando as colunas acabam de ser criadas
+    (ver precisa_normalizar). Retorna o número de linhas ajustadas.
+    """
+    engine = engine or engine_retroativos()
+    calculados = RetroativoCalculado.__table__
+    resumo = RetroativoMensal.__table__
+    ajustadas = 0
+
+    with engine.begin() as conexao:
+        ajustadas += conexao.execute(
+            update(calculados)
+            .where(func.typeof(calculados.c.mes) != 'integer')
+            .values(mes=mes_numerico(calculados.c.mes))
+        ).rowcount
+
+        for coluna, coluna_norm in (('artista', 'artista_norm'), ('titulo', 'titulo_norm')):
+            pendentes = conexao.execute(
+                select(calculados.c[coluna]).distinct()
+                .where(calculados.c[coluna_norm].is_(None), calculados.c[coluna].is_not(None))
+            ).scalars().all()
+            if not pendentes:
+                continue
+            conexao.execute(
+                update(calculados)
+                .where(calculados.c[coluna] == bindparam('original'), calculados.c[coluna_norm].is_(None))
+                .values({coluna_norm: bindparam('normalizado')}),
+                [{'original': valor, 'normalizado': normalizar_chave(valor)} for valor in pendentes]
+            )
+            ajustadas += len(pendentes)
+
+        resumo_sem_chave = conexao.execute(
+            select(resumo.c.id).where(resumo.c.artista_norm.is_(None)).limit(1)
+        ).first() is not None
+
+    if ajustadas or resumo_sem_chave:
+        reconstruir_resumo_mensal(engine)
+    return ajustadas
+
+
+def garantir_resumo_mensal(engine=None) -> bool:
+    """
+    Preenche o resumo mensal de bancos que já tinham linhas antes dele existir.
+    Retorna True se precisou reconstruir.
+    """
+    engine = engine or engine_retroativos()
+    with engine.connect() as conexao:
+        tem_resumo = conexao.execute(select(RetroativoMensal.id).limit(1)).first() is not None
+        tem_linhas = conexao.execute(select(RetroativoCalculado.id).limit(1)).first() is not None
+    if tem_resumo or not tem_linhas:
+        return False
+    reconstruir_resumo_mensal(engine)
+    return True
+
+
+class CarregadorRetroativos:
+    """
+    Escritor único da importação de retroativos. Uso:
+
+        with CarregadorRetroativos() as carregador:
+            carregador.substituir_arquivo(ano, nome, linhas, arquivo)
+        carregador.linhas_por_segundo
+
+    `linhas` são tuplas (artista, titulo, lucro_liquido, mes); cada arquivo é trocado numa
+    transação própria (apaga as linhas antigas da origem, insere as novas e recalcula o
+    resumo mensal dos artistas envolvidos).
+    """
+
+    def __init__(self, engine=None, linhas_por_insert: int = LINHAS_POR_INSERT):
+        self.engine = engine or engine_retroativos()
+        self.linhas_por_insert = linhas_por_insert
+        self.conexao = None
+        self.linhas_gravadas = 0
+        self.segundos_gravando = 0.0
+        self._pragmas_anteriores: Dict[str, str] = {}
+
+    def __enter__(self):
+        self.conexao = self.engine.connect()
+        if self.engine.dialect.name == 'sqlite':
+            self._aplicar_pragmas()
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if self._pragmas_anteriores:
+                self.conexao.rollback()
+                for nome, valor in self._pragmas_anteriores.items():
+                    self.conexao.exec_driver_sql(f'PRAGMA {nome}={valor}')
+                self.conexao.commit()
+        finally:
+            self.conexao.close()
+            self.conexao = None
+        return False
+
+    def _aplicar_pragmas(self):
+        # Fora de transação: o sqlite3 não troca o journal_mode com uma transação aberta
+        self.conexao.exec_driver_sql('PRAGMA journal_mode=WAL').fetchall()
+        for nome, valor in PRAGMAS_CARGA.items():
+            self._pragmas_anteriores[nome] = str(self.conexao.exec_driver_sql(f'PRAGMA {nome}').scalar())
+            self.conexao.exec_driver_sql(f'PRAGMA {nome}={valor}')
+        self.conexao.commit()
+
+    def _apagar_arquivo(self, ano: int, nome_arquivo: str) -> set:
+        """Apaga as linhas e o registro do arquivo; retorna os artistas que ele tinha."""
+        artistas = set(self.conexao.execute(
+            select(RetroativoCalculado.artista).distinct().where(
+                RetroativoCalculado.ano == ano, RetroativoCalculado.origem_planilha == nome_arquivo)
+        ).scalars())
+        self.conexao.execute(delete(RetroativoCalculado.__table__).where(
+            RetroativoCalculado.ano == ano, RetroativoCalculado.origem_planilha == nome_arquivo))
+        self.conexao.execute(delete(RetroativoArquivo.__table__).where(
+            RetroativoArquivo.ano == ano, RetroativoArquivo.nome_arquivo == nome_arquivo))
+        return artistas
+
+    def substituir_arquivo(self, ano: int, nome_arquivo: str,
+                           linhas: Iterable[Tuple], arquivo: Dict) -> Tuple[int, float]:
+        """
+        Troca, numa transação, as linhas de `nome_arquivo` no ano pelas novas e grava o
+        RetroativoArquivo (`arquivo`: valores das colunas). Retorna (linhas gravadas, segundos).
+        """
+        inicio = time.perf_counter()
+        tabela = RetroativoCalculado.__table__
+        chaves = {}
+
+        def chave(texto):
+            if texto not in chaves:
+                chaves[texto] = normalizar_chave(texto)
+            return chaves[texto]
+
+        parametros = [
+            {'artista': artista, 'titulo': titulo, 'lucro_liquido': lucro, 'ano': int(ano),
+             'mes': int(mes), 'origem_planilha': nome_arquivo,
+             'artista_norm': chave(artista), 'titulo_norm': chave(titulo)}
+            for artista, titulo, lucro, mes in linhas
+        ]
+
+        with self.conexao.begin():
+            artistas = self._apagar_arquivo(ano, nome_arquivo)
+            for posicao in range(0, len(parametros), self.linhas_por_insert):
+                self.conexao.execute(insert(tabela), parametros[posicao:posicao + self.linhas_por_insert])
+            self.conexao.execute(insert(RetroativoArquivo.__table__), [arquivo])
+            recalcular_resumo(self.conexao, ano, artistas | {p['artista'] for p in parametros})
+
+        segundos = time.perf_counter() - inicio
+        self.linhas_gravadas += len(parametros)
+        self.segundos_gravando += segundos
+        return len(parametros), segundos
+
+    def remover_arquivos(self, ano: int, nomes_arquivos: List[str]):
+        """Apaga, numa transação, as linhas e os registros dos arquivos informados."""
+        with self.conexao.begin():
+            artistas = set()
+            for nome_arquivo in nomes_arquivos:
+                artistas |= self._apagar_arquivo(ano, nome_arquivo)
+            recalcular_resumo(self.conexao, ano, artistas)
+
+    @property
+    def linhas_por_segundo(self) -> Optional[float]:
+        if not self.segundos_gravando:
+            return None
+        return self.linhas_gravadas / self.segundos_gravando
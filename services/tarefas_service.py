@@ -0,0 +1,222 @@
+# services/tarefas_service.py
+"""
+Fila local de tarefas para as rotas pesadas (cálculos, geração de SP, exportações).
+
+A rota recebe o POST com o cabeçalho X-Enfileirar, grava a requisição na tabela `tarefa`
+(SQLite) e responde na hora com o id. O worker (worker_tarefas.py) reserva a tarefa e
+reexecuta a mesma rota, sem o cabeçalho, por um cliente de teste do Flask: a regra de
+negócio continua num lugar só. A resposta (página, arquivo ou redirecionamento) fica
+guardada para a tela buscar quando o progresso chegar a 100%.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask import current_app, jsonify, request, session, url_for
+from werkzeug.datastructures import MultiDict
+from werkzeug.http import parse_options_header
+
+from extensions import db
+from models import Tarefa
+
+logger = logging.getLogger(__name__)
+
+CABECALHO_ENFILEIRAR = 'X-Enfileirar'
+# Ids das tarefas enfileiradas pela sessão (cookie assinado): dão acesso às tarefas sem usuário
+CHAVE_SESSAO_TAREFAS = 'tarefas_enfileiradas'
+TAREFAS_NA_SESSAO = 50
+DIAS_RETENCAO_PADRAO = 7
+
+# Tarefa em execução neste processo (o worker executa uma por vez)
+_tarefa_atual: Optional[int] = None
+
+
+def pasta_resultados() -> str:
+    pasta = current_app.config.get('TAREFAS_FOLDER') or os.path.join(current_app.instance_path, 'tarefas')
+    os.makedirs(pasta, exist_ok=True)
+    return pasta
+
+
+# ------------------- LADO DA ROTA -------------------
+
+def deve_enfileirar() -> bool:
+    """POST vindo da tela com o cabeçalho de fila. Uploads de arquivo seguem síncronos."""
+    return (
+        request.method == 'POST'
+        and request.headers.get(CABECALHO_ENFILEIRAR) == '1'
+        and not request.files
+    )
+
+
+def enfileirar_requisicao(tipo: str):
+    """Grava a requisição atual como tarefa pendente e responde 202 com o endereço de status."""
+    corpo_json = request.get_json(silent=True) if request.is_json else None
+    parametros = {
+        'json': corpo_json,
+        'form': None if corpo_json is not None else list(request.form.items(multi=True)),
+    }
+    tarefa = Tarefa(
+        tipo=tipo,
+        caminho=request.full_path.rstrip('?'),
+        parametros=json.dumps(parametros, ensure_ascii=False),
+        usuario_id=session.get('usuario_id'),
+        status='pendente',
+        progresso=0,
+    )
+    db.session.add(tarefa)
+    db.session.commit()
+    session[CHAVE_SESSAO_TAREFAS] = (session.get(CHAVE_SESSAO_TAREFAS, []) + [tarefa.id])[-TAREFAS_NA_SESSAO:]
+
+    return jsonify({
+        'success': True,
+        'tarefa_id': tarefa.id,
+        'status_url': url_for('status_tarefa', tarefa_id=tarefa.id),
+    }), 202
+
+
+def pode_acessar_tarefa(tarefa: Tarefa) -> bool:
+    """
+    Só quem enfileirou vê o status e o resultado: o mesmo usuário logado ou, nas rotas que
+    não exigem login, a sessão que criou a tarefa (os ids são sequenciais e adivinháveis).
+    """
+    if tarefa.usuario_id is not None and tarefa.usuario_id == session.get('usuario_id'):
+        return True
+    return tarefa.id in session.get(CHAVE_SESSAO_TAREFAS, [])
+
+
+def informar_progresso(progresso: int, mensagem: Optional[str] = None):
+    """
+    Atualiza o progresso da tarefa em execução. Fora do worker não faz nada, então as
+    rotas podem chamar sempre. Usa uma conexão própria para não confirmar (commit) o
+    que a rota ainda está montando na sessão.
+    """
+    if _tarefa_atual is None:
+        return
+    valores = {'progresso': max(0, min(int(progresso), 99))}
+    if mensagem is not None:
+        valores['mensagem'] = mensagem[:500]
+    tabela = Tarefa.__table__
+    try:
+        with db.engine.begin() as conexao:
+            conexao.execute(tabela.update().where(tabela.c.id == _tarefa_atual).values(**valores))
+    except Exception as e:  # progresso é informativo: banco ocupado não pode derrubar a tarefa
+        logger.warning(f"Progresso da tarefa {_tarefa_atual} não registrado: {e}")
+
+
+# ------------------- LADO DO WORKER -------------------
+
+def reservar_proxima_tarefa() -> Optional[Tarefa]:
+    """
+    Pega a tarefa pendente mais antiga. A troca de status é um UPDATE condicionado a
+    status='pendente', então dois workers nunca executam a mesma tarefa.
+    """
+    for _ in range(5):
+        candidata = (
+            db.session.query(Tarefa.id)
+            .filter(Tarefa.status == 'pendente')
+            .order_by(Tarefa.id)
+            .first()
+        )
+        if candidata is None:
+            return None
+
+        reservadas = (
+            Tarefa.query
+            .filter(Tarefa.id == candidata.id, Tarefa.status == 'pendente')
+            .update({'status': 'executando', 'iniciado_em': datetime.utcnow(), 'progresso': 0},
+                    synchronize_session=False)
+        )
+        db.session.commit()
+        if reservadas == 1:
+            return db.session.get(Tarefa, candidata.id)
+    return None
+
+
+def _finalizar(tarefa_id: int, **valores):
+    valores.setdefault('concluido_em', datetime.utcnow())
+    Tarefa.query.filter(Tarefa.id == tarefa_id).update(valores, synchronize_session=False)
+    db.session.commit()
+
+
+def executar_tarefa(app, tarefa: Tarefa):
+    """Reexecuta a rota da tarefa e guarda a resposta em disco."""
+    global _tarefa_atual
+    tarefa_id = tarefa.id
+    parametros = json.loads(tarefa.parametros or '{}')
+    _tarefa_atual = tarefa_id
+
+    try:
+        cliente = app.test_client()
+        with cliente.session_transaction() as sessao:
+            sessao['usuario_id'] = tarefa.usuario_id
+
+        if parametros.get('json') is not None:
+            resposta = cliente.post(tarefa.caminho, json=parametros['json'], buffered=True)
+        else:
+            resposta = cliente.post(tarefa.caminho, data=MultiDict(parametros.get('form') or []), buffered=True)
+
+        with cliente.session_transaction() as sessao:
+            avisos = [mensagem for _, mensagem in sessao.get('_flashes', [])]
+
+        if 300 <= resposta.status_code < 400:
+            _finalizar(tarefa_id, status='concluida', progresso=100,
+                       resultado_tipo='redirecionamento',
+                       resultado_caminho=resposta.headers.get('Location'),
+                       mensagem=' | '.join(avisos)[:500] or None)
+            return
+
+        if resposta.status_code >= 400:
+            _finalizar(tarefa_id, status='erro',
+                       mensagem=resposta.get_data(as_text=True)[:500] or f"HTTP {resposta.status_code}")
+            return
+
+        disposicao, opcoes = parse_options_header(resposta.headers.get('Content-Disposition', ''))
+        html = disposicao != 'attachment' and resposta.mimetype == 'text/html'
+        destino = os.path.join(pasta_resultados(), f"tarefa_{tarefa_id}" + ('.html' if html else ''))
+        with open(destino, 'wb') as saida:
+            saida.write(resposta.get_data())
+
+        _finalizar(tarefa_id, status='concluida', progresso=100,
+                   resultado_tipo='html' if html else 'arquivo',
+                   resultado_caminho=destino,
+                   resultado_nome=opcoes.get('filename'),
+                   resultado_mimetype=resposta.mimetype,
+                   mensagem=' | '.join(avisos)[:500] or None)
+    except Exception as e:
+        logger.error(f"Tarefa {tarefa_id} falhou: {e}", exc_info=True)
+        db.session.rollback()
+        _finalizar(tarefa_id, status='erro', mensagem=str(e)[:500])
+    finally:
+        _tarefa_atual = None
+
+
+def encerrar_tarefas_interrompidas() -> int:
+    """
+    Marca como erro as tarefas que estavam em execução quando o worker parou. Não voltam
+    à fila: rotas como gerar_sp_pagamento gravam (SP, pagamentos) antes de a resposta ser
+    guardada, e reexecutá-las duplicaria o que já foi gravado. O usuário reenvia, se for o caso.
+    """
+    quantidade = (
+        Tarefa.query.filter(Tarefa.status == 'executando')
+        .update({'status': 'erro',
+                 'mensagem': 'Interrompida: o worker parou durante a execução. Confira o que foi gravado antes de enviar de novo.',
+                 'concluido_em': datetime.utcnow()},
+                synchronize_session=False)
+    )
+    db.session.commit()
+    return quantidade
+
+
+def limpar_tarefas_antigas(dias: int = DIAS_RETENCAO_PADRAO) -> int:
+    """Remove tarefas finalizadas há mais de `dias` e os arquivos de resultado."""
+    limite = datetime.utcnow() - timedelta(days=dias)
+    antigas = Tarefa.query.filter(Tarefa.status.in_(['concluida', 'erro']), Tarefa.concluido_em < limite).all()
+    for tarefa in antigas:
+        if tarefa.resultado_tipo in ('html', 'arquivo') and tarefa.resultado_caminho \
+                and os.path.exists(tarefa.resultado_caminho):
+            os.remove(tarefa.resultado_caminho)
+        db.session.delete(tarefa)
+    db.session.commit()
+    return len(antigas)
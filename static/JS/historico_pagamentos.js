@@ -9,8 +9,12 @@ document.addEventListener('DOMContentLoaded', function() {
     const totalPagoElement = document.getElementById('totalPagoHistorico');
     const mensagensDiv = document.getElementById('mensagensHistorico');
     
-    // Armazenar todos os pagamentos originalmente carregados
-    let todosPagamentos = [];
+    const btnCarregarMais = document.getElementById('btnCarregarMaisHistorico');
+    
+    // Cursor da próxima página (null quando não há mais)
+    let proximoCursor = btnCarregarMais ? (btnCarregarMais.dataset.proximoCursor || null) : null;
+    // Filtros da listagem atual: o cursor só vale junto com os mesmos parâmetros
+    let parametrosListagem = new URLSearchParams();
     
     // Função para atualizar status dos pagamentos agendados
     async function atualizarStatusAgendados() {
@@ -61,15 +65,29 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
-    // Função para carregar histórico
-    async function carregarHistorico() {
+    // Parâmetros dos filtros: a filtragem e a paginação são feitas no servidor
+    function parametrosFiltros() {
+        const params = new URLSearchParams();
+        if (filtroArtista.value) params.set('artista', filtroArtista.value);
+        if (filtroMes.value) params.set('mes', filtroMes.value);
+        return params;
+    }
+
+    // Função para carregar histórico (continuar = acrescenta a próxima página)
+    async function carregarHistorico(continuar = false) {
+        if (!continuar) parametrosListagem = parametrosFiltros();
+        const params = new URLSearchParams(parametrosListagem);
+        if (continuar && proximoCursor) params.set('cursor', proximoCursor);
+        
         try {
-            const response = await fetch('/api/historico_pagamentos');
+            const response = await fetch(`/api/historico_pagamentos?${params.toString()}`);
             const data = await response.json();
             
             if(data.success) {
-                todosPagamentos = data.pagamentos;
-                aplicarFiltros();
+                montarTabelaHistorico(data.pagamentos, continuar);
+                atualizarTotalPago(data.total_pago);
+                proximoCursor = data.proximo_cursor;
+                if (btnCarregarMais) btnCarregarMais.hidden = !proximoCursor;
             } else {
                 mensagensDiv.innerHTML = `<div class="alert alert-danger">${data.error}</div>`;
             }
@@ -81,37 +99,20 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Função para aplicar filtros na tabela
     function aplicarFiltros() {
-        const artista = filtroArtista.value.toLowerCase();
-        const mes = filtroMes.value;
-        
-        const pagamentosFiltrados = todosPagamentos.filter(pagamento => {
-            const matchArtista = artista ? 
-                (pagamento.artista_nome || '').toLowerCase().includes(artista) : true;
-                
-            const matchMes = mes ? 
-                pagamento.mes_abreviado === mes : true;
-                
-            return matchArtista && matchMes;
-        });
-        
-        montarTabelaHistorico(pagamentosFiltrados);
-        atualizarTotalPago(pagamentosFiltrados);
+        proximoCursor = null;
+        carregarHistorico();
     }
 
-    // Função para atualizar o total pago
-    function atualizarTotalPago(pagamentos) {
-        const total = pagamentos.reduce((sum, pag) => {
-            return pag.status.toLowerCase() === 'pago' ? sum + pag.valor_brl : sum;
-        }, 0);
-        
-        totalPagoElement.textContent = `R$ ${total.toFixed(2).replace('.', ',')}`;
+    // Função para atualizar o total pago (calculado no servidor para todos os filtrados)
+    function atualizarTotalPago(total) {
+        totalPagoElement.textContent = `R$ ${(total || 0).toFixed(2).replace('.', ',')}`;
     }
 
     // Função para montar tabela de histórico
-    function montarTabelaHistorico(pagamentos) {
-        listaPagamentos.innerHTML = '';
+    function montarTabelaHistorico(pagamentos, continuar = false) {
+        if (!continuar) listaPagamentos.innerHTML = '';
         
-        if (pagamentos.length === 0) {
+        if (pagamentos.length === 0 && !continuar) {
             listaPagamentos.innerHTML = `
                 <tr>
                     <td colspan="5" class="text-center text-muted py-3">
@@ -137,8 +138,7 @@ document.addEventListener('DOMContentLoaded', function() {
             }
             
             // Formatar data de vencimento
-            const dataFormatada = pag.vencimento ? 
-                new Date(pag.vencimento).toLocaleDateString('pt-BR') : '-';
+            const dataFormatada = pag.data_vencimento || '-';
             
             tr.innerHTML = `
                 <td>${dataFormatada}</td>
@@ -161,6 +161,9 @@ document.addEventListener('DOMContentLoaded', function() {
     // Event Listeners
     btnFiltrar.addEventListener('click', aplicarFiltros);
     btnAtualizarStatus.addEventListener('click', atualizarStatusAgendados);
+    if (btnCarregarMais) {
+        btnCarregarMais.addEventListener('click', () => carregarHistorico(true));
+    }
     
     // Adicionar evento para limpar filtros ao clicar no título
     const cardHeader = document.querySelector('.card-header');
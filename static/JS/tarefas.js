@@ -0,0 +1,119 @@
+// tarefas.js
+// Formulários marcados com data-tarefa vão para a fila de tarefas em vez de prender a
+// requisição: o servidor responde com o id, a tela acompanha o progresso e, ao final,
+// mostra a página resultante ou baixa o arquivo gerado.
+document.addEventListener('DOMContentLoaded', function() {
+    const INTERVALO_CONSULTA = 1500;
+
+    function criarPainel() {
+        const painel = document.createElement('div');
+        painel.className = 'position-fixed bottom-0 end-0 m-3 p-3 bg-white border rounded shadow';
+        painel.style.zIndex = 2000;
+        painel.style.minWidth = '320px';
+        painel.innerHTML = `
+            <div class="fw-semibold mb-2">Processando em segundo plano...</div>
+            <div class="progress mb-2" style="height: 18px;">
+                <div class="progress-bar progress-bar-striped progress-bar-animated" style="width: 0%">0%</div>
+            </div>
+            <div class="small text-muted mensagem-tarefa">Aguardando na fila</div>`;
+        document.body.appendChild(painel);
+        return painel;
+    }
+
+    function atualizarPainel(painel, tarefa) {
+        const barra = painel.querySelector('.progress-bar');
+        barra.style.width = `${tarefa.progresso}%`;
+        barra.textContent = `${tarefa.progresso}%`;
+        const textos = {pendente: 'Aguardando na fila', executando: 'Executando'};
+        painel.querySelector('.mensagem-tarefa').textContent = tarefa.mensagem || textos[tarefa.status] || '';
+    }
+
+    async function exibirResultado(tarefa, painel) {
+        if (tarefa.resultado_tipo === 'arquivo') {
+            window.location = tarefa.resultado_url;
+            setTimeout(() => painel.remove(), 3000);
+        } else if (tarefa.resultado_tipo === 'html') {
+            const resposta = await fetch(tarefa.resultado_url);
+            const html = await resposta.text();
+            document.open();
+            document.write(html);
+            document.close();
+        } else {
+            window.location = tarefa.resultado_url;
+        }
+    }
+
+    async function exibirRespostaDireta(resposta) {
+        const disposicao = resposta.headers.get('Content-Disposition') || '';
+        if (disposicao.includes('attachment')) {
+            const nome = (disposicao.match(/filename\*?=(?:UTF-8'')?"?([^";]+)"?/i) || [])[1];
+            const link = document.createElement('a');
+            link.href = URL.createObjectURL(await resposta.blob());
+            link.download = nome ? decodeURIComponent(nome) : '';
+            document.body.appendChild(link);
+            link.click();
+            link.remove();
+            return;
+        }
+        const html = await resposta.text();
+        if (resposta.redirected) {
+            history.replaceState(null, '', resposta.url);
+        }
+        document.open();
+        document.write(html);
+        document.close();
+    }
+
+    async function acompanhar(statusUrl, painel) {
+        try {
+            const resposta = await fetch(statusUrl, {headers: {'Accept': 'application/json'}});
+            const tarefa = await resposta.json();
+            atualizarPainel(painel, tarefa);
+
+            if (tarefa.status === 'concluida') {
+                await exibirResultado(tarefa, painel);
+                return;
+            }
+            if (tarefa.status === 'erro') {
+                painel.remove();
+                alert(`Erro ao processar: ${tarefa.mensagem || 'falha desconhecida'}`);
+                return;
+            }
+        } catch (erro) {
+            console.error('Falha ao consultar a tarefa', erro);
+        }
+        setTimeout(() => acompanhar(statusUrl, painel), INTERVALO_CONSULTA);
+    }
+
+    // Escuta no document: o onsubmit do próprio formulário (validações, campos ocultos) roda antes
+    document.addEventListener('submit', async function(event) {
+        const form = event.target;
+        if (!form.matches('form[data-tarefa]') || event.defaultPrevented) {
+            return;
+        }
+        event.preventDefault();
+
+        const botao = form.querySelector('[type="submit"]');
+        if (botao) botao.disabled = true;
+
+        try {
+            const resposta = await fetch(form.action, {
+                method: 'POST',
+                body: new FormData(form),
+                headers: {'X-Enfileirar': '1'}
+            });
+            if (resposta.status !== 202) {
+                // Rota respondeu direto (ex.: envio com anexos): a ação já rodou, então só
+                // mostra a resposta recebida; reenviar o formulário a executaria duas vezes
+                await exibirRespostaDireta(resposta);
+                return;
+            }
+            const dados = await resposta.json();
+            acompanhar(dados.status_url, criarPainel());
+        } catch (erro) {
+            alert(`Não foi possível enfileirar: ${erro}`);
+        } finally {
+            if (botao) botao.disabled = false;
+        }
+    });
+});
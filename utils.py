@@ -1,6 +1,8 @@
 # utils.py
 
 import unicodedata
+from typing import Dict, Iterable, Tuple
+
 from flask import current_app
 from sqlalchemy.orm import Session
 
@@ -36,64 +38,60 @@ def remover_acentos(texto):
         if not unicodedata.combining(c)
     )
 
-def buscar_nome_artista(artista_id, tabela):
-    if not artista_id:
-        return None
+# tabela_artista dos pagamentos → modelo do artista (os códigos curtos vêm de registros antigos)
+MODELOS_POR_TABELA = {
+    'norm': Artista,
+    'normal': Artista,
+    'esp': ArtistaEspecial,
+    'especial': ArtistaEspecial,
+    'ass': ArtistaEspecial,
+    'assisao': ArtistaEspecial,
+}
+LOTE_IDS = 500
+
+
+def _id_inteiro(artista_id):
     try:
-        artista_id_int = int(artista_id)
+        return int(artista_id) if artista_id else None
     except (ValueError, TypeError):
         return None
 
+
+def buscar_nomes_artistas(pares: Iterable[Tuple]) -> Dict[Tuple, str]:
+    """
+    Nomes de vários artistas de uma vez: uma consulta por modelo (Artista, ArtistaEspecial)
+    em vez de uma por pagamento. Recebe pares (artista_id, tabela) e devolve
+    {(artista_id, tabela): nome} só para os encontrados, com as chaves como recebidas.
+    """
+    ids_por_modelo = {}
+    for artista_id, tabela in pares:
+        modelo = MODELOS_POR_TABELA.get(tabela)
+        id_int = _id_inteiro(artista_id)
+        if modelo is not None and id_int is not None:
+            ids_por_modelo.setdefault(modelo, {}).setdefault(id_int, []).append((artista_id, tabela))
+
+    nomes = {}
+    for modelo, chaves_por_id in ids_por_modelo.items():
+        ids = sorted(chaves_por_id)
+        for inicio in range(0, len(ids), LOTE_IDS):
+            lote = ids[inicio:inicio + LOTE_IDS]
+            for id_artista, nome in db.session.query(modelo.id, modelo.nome).filter(modelo.id.in_(lote)):
+                for chave in chaves_por_id[id_artista]:
+                    nomes[chave] = nome
+    return nomes
+
+
+def buscar_nome_artista(artista_id, tabela):
     try:
-        if tabela in ['norm', 'normal']:
-            artista = Artista.query.get(artista_id_int)
-        elif tabela in ['esp', 'especial']:
-            artista = ArtistaEspecial.query.get(artista_id_int)
-        elif tabela in ['ass', 'assisao']:
-            artista = ArtistaEspecial.query.get(artista_id_int)
-        else:
-            return None
-        return artista.nome if artista else None
+        return buscar_nomes_artistas([(artista_id, tabela)]).get((artista_id, tabela))
     except Exception as e:
         print(f"[ERRO buscar_nome_artista] ID: {artista_id}, tabela: {tabela} → {e}")
         return None
 
 def atualizar_historico_pagamentos():
-    from datetime import datetime
-    import pytz
-    from app import db
-    from models import PagamentoRealizado
-    from utils import buscar_nome_artista
-
-    tz_brasil = pytz.timezone('America/Sao_Paulo')
-    hoje = datetime.now(tz_brasil).date()
-
-    pagamentos = PagamentoRealizado.query.all()
-    atualizados_nome = 0
-    atualizados_status = 0
-
-    print(f"[DEBUG] Pagamentos encontrados: {len(pagamentos)}")
-
-    for p in pagamentos:
-        nome_correto = buscar_nome_artista(p.artista_id, p.tabela_artista)
-        if nome_correto and p.artista_nome != nome_correto:
-            print(f"[DEBUG] Atualizando nome ID {p.id}: '{p.artista_nome}' → '{nome_correto}'")
-            p.artista_nome = nome_correto
-            atualizados_nome += 1
-
-        if p.status.strip().lower() == 'agendado' and p.vencimento and p.vencimento <= hoje:
-            print(f"[DEBUG] Atualizando status para PAGO ID {p.id} (venc: {p.vencimento})")
-            p.status = 'pago'
-            p.data_pagamento = datetime.now(tz_brasil)
-            atualizados_status += 1
-
-    try:
-        db.session.commit()
-        print(f"[DEBUG] Commit realizado com {atualizados_nome} nomes e {atualizados_status} status atualizados")
-    except Exception as e:
-        db.session.rollback()
-        print(f"[ERRO] Commit falhou: {e}")
-        raise e
+    """Nomes e status do histórico de pagamentos, por UPDATEs (services/pagamentos_service.py)."""
+    from services.pagamentos_service import sincronizar_nomes_pagamentos, varrer_pagamentos
 
-    return atualizados_nome, atualizados_status
+    nomes = sincronizar_nomes_pagamentos()
+    return nomes, varrer_pagamentos()['vencidos_pagos']
 
@@ -5,6 +5,9 @@ from decimal import Decimal
 from fuzzywuzzy import fuzz
 from decimal import Decimal, ROUND_HALF_UP
 
+from services.colunas_service import colunas_projetadas, detectar_colunas, filtro_usecols
+from services.dinheiro_service import analisar_lucro
+
 
 def normalizar(texto):
     """Remove acentos e pontuação e transforma em minúsculas"""
@@ -164,22 +167,28 @@ def calcular_retroativo_por_artista(
 
     for caminho in arquivos:
         try:
-            df = pd.read_excel(caminho) if caminho.endswith((".xls", ".xlsx")) else pd.read_csv(caminho, sep=None, engine="python")
+            if caminho.endswith((".xls", ".xlsx")):
+                ler = lambda **opcoes: pd.read_excel(caminho, **opcoes)
+            else:
+                ler = lambda **opcoes: pd.read_csv(caminho, sep=None, engine="python", **opcoes)
 
-            col_artista = next((col for col in df.columns if "artista" in col.lower()), None)
-            col_titulo = next((col for col in df.columns if "título" in col.lower() or "titulo" in col.lower() or "album" in col.lower()), None)
-            col_lucro = next((col for col in df.columns if "lucro" in col.lower()), None)
+            # Só o cabeçalho para detectar as colunas; depois lê apenas as três usadas
+            colunas = detectar_colunas(ler(nrows=0).columns)
+            col_artista, col_titulo, col_lucro = (colunas.get(c) for c in ("artista", "titulo", "lucro"))
 
             if not all([col_artista, col_titulo, col_lucro]):
                 print(f"[AVISO] Colunas não encontradas na planilha: {caminho}")
                 continue
 
+            df = ler(usecols=filtro_usecols(colunas_projetadas(colunas)))
+            df.columns = [str(c).strip() for c in df.columns]
             df = df[[col_artista, col_titulo, col_lucro]].dropna()
             df.columns = ["artista", "titulo", "lucro"]
 
             df["artista"] = df["artista"].astype(str).str.strip().str.lower()
             df["titulo"] = df["titulo"].astype(str).str.strip().str.lower()
-            df["lucro"] = df["lucro"].astype(str).str.replace(",", ".").str.extract(r"([\d\.]+)")[0].astype(float)
+            df["lucro"], _ = analisar_lucro(df["lucro"])
+            df = df[df["lucro"].notna()]
 
             nomes_planilha = df["artista"].unique()
             print(f"\n[Planilha: {caminho}] Artistas encontrados:")
@@ -0,0 +1,173 @@
+# verificar_dinheiro.py
+# Confere, com valores aleatórios, que as somas em unidades de 10^-14 (services/dinheiro_service.py)
+# devolvem exatamente o mesmo Decimal (valor, sinal e expoente) que a soma sequencial em Decimal
+# dos cálculos, no contexto usado por /calcular (prec 20, ROUND_HALF_UP), e que
+# somar_lucro_por_artista dá os mesmos totais que o laço linha × artista original de /calcular
+# (converter + quantize + soma em Decimal), num banco SQLite em memória.
+# Sai com código 1 se houver divergência.
+import random
+import sys
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP, localcontext
+
+import numpy as np
+import pandas as pd
+from flask import Flask
+from rapidfuzz import fuzz
+
+from extensions import db
+from models import Artista
+from services.correspondencia_service import somar_lucro_por_artista
+from services.dinheiro_service import (
+    cabe_no_contexto,
+    decimal_para_unidades,
+    somar_unidades,
+    unidades_para_decimal,
+)
+from utils import remover_acentos
+
+PRECISAO_LUCRO = Decimal('0.00000000000001')
+RODADAS = 200
+RODADAS_ARTISTAS = 20
+
+# Nomes cadastrados (vírgula separa nomes equivalentes) e nomes como aparecem nas planilhas
+ARTISTAS_FIXTURE = ['Ana Souza', 'João Silva, Joao S.', 'Banda Mar', 'Zé', 'DJ Lúcio, Lucio Beats']
+NOMES_PLANILHA = [
+    'Ana Souza', 'ANA SOUZA ', 'Ána Souza feat. Banda Mar', 'joão silva', 'Joao S. & Zé', 'Banda do Mar',
+    'Lucio Beats', 'dj lucio', 'Zeca', 'Outro Artista', '', None, 123,
+]
+LUCROS_INVALIDOS = ['', 'abc', '€', '1,2,3', None]
+
+
+def valor_aleatorio(rng):
+    escala = rng.choice([Decimal('1E-9'), Decimal('1E-4'), Decimal('1'), Decimal('1E3'), Decimal('9E4')])
+    return (Decimal(rng.uniform(-1, 1)) * escala).quantize(PRECISAO_LUCRO)
+
+
+def soma_decimal(valores):
+    total = Decimal('0.0000')
+    for valor in valores:
+        total += valor
+    return total
+
+
+def mesma_representacao(a: Decimal, b: Decimal) -> bool:
+    return a.as_tuple() == b.as_tuple()
+
+
+def soma_laco_original(extratos, artista) -> Decimal:
+    """O laço de /calcular antes de somar_lucro_por_artista, linha a linha."""
+    total_lucro_eur = Decimal("0.0000")
+    nomes_equivalentes = [remover_acentos(n.strip().lower()) for n in artista.nome.split(',') if n.strip()]
+    for extrato in extratos:
+        for nome, lucro in zip(extrato['artista'], extrato['lucro']):
+            nome_artista_planilha = remover_acentos(str(nome).strip().lower())
+            lucro_raw = str(lucro).replace(",", ".").replace("€", "").strip()
+            try:
+                lucro_liquido = Decimal(lucro_raw).quantize(Decimal('0.00000000000001'))
+            except (InvalidOperation, ValueError):
+                continue
+            for nome_ref in nomes_equivalentes:
+                score = fuzz.partial_ratio(nome_artista_planilha, nome_ref)
+                if score >= 88 and nome_ref in nome_artista_planilha:
+                    total_lucro_eur += lucro_liquido
+                    break
+    return total_lucro_eur
+
+
+def lucro_de_planilha(rng):
+    """Lucro como chega da planilha: texto com vírgula ou €, número, valor enorme ou inválido."""
+    sorteio = rng.random()
+    if sorteio < 0.05:
+        return rng.choice(LUCROS_INVALIDOS)
+    valor = valor_aleatorio(rng)
+    if sorteio < 0.08:
+        # Acima de ~92233 as 14 casas não cabem em int64: o artista passa a somar em Decimal
+        return str((Decimal(rng.uniform(92234, 999999)) * rng.choice([1, -1])).quantize(PRECISAO_LUCRO))
+    if sorteio < 0.4:
+        return str(valor).replace('.', ',')
+    if sorteio < 0.6:
+        return f"€ {valor}"
+    if sorteio < 0.8:
+        return float(valor)
+    return valor
+
+
+def verificar_unidades(rng) -> int:
+    divergencias = usadas_inteiras = usadas_decimais = 0
+
+    with localcontext() as ctx:
+        ctx.prec = 20
+        ctx.rounding = ROUND_HALF_UP
+
+        for _ in range(RODADAS):
+            linhas = rng.randint(1, 2000)
+            grupos = [rng.randint(1, 15) for _ in range(linhas)]
+            valores = [valor_aleatorio(rng) for _ in range(linhas)]
+
+            for valor in valores:
+                if not mesma_representacao(unidades_para_decimal(decimal_para_unidades(valor)), valor):
+                    print(f"❌ Conversão não é exata: {valor}")
+                    divergencias += 1
+
+            somas, absolutos = somar_unidades(np.array(grupos), np.array([decimal_para_unidades(v) for v in valores]))
+            for grupo, soma in somas.items():
+                esperado = soma_decimal(v for g, v in zip(grupos, valores) if g == grupo)
+                if not cabe_no_contexto(absolutos[grupo]):
+                    usadas_decimais += 1  # nesse caso o cálculo soma em Decimal
+                    continue
+                usadas_inteiras += 1
+                obtido = unidades_para_decimal(soma)
+                if not mesma_representacao(obtido, esperado):
+                    print(f"❌ Grupo {grupo}: inteiro {obtido} ≠ decimal {esperado}")
+                    divergencias += 1
+
+    print(f"Somas inteiras conferidas: {usadas_inteiras} | desviadas para Decimal: {usadas_decimais}")
+    return divergencias
+
+
+def verificar_somar_lucro(rng) -> int:
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    divergencias = conferidos = 0
+
+    with app.app_context():
+        db.create_all(bind_key=None)  # só as tabelas do banco principal
+        artistas = [Artista(nome=nome, percentual=50) for nome in ARTISTAS_FIXTURE]
+        db.session.add_all(artistas)
+        db.session.commit()
+
+        for _ in range(RODADAS_ARTISTAS):
+            # Vários extratos seguidos, como os lotes de um arquivo grande
+            extratos = []
+            for _ in range(rng.randint(1, 4)):
+                linhas = rng.randint(0, 300)
+                extratos.append(pd.DataFrame({
+                    'artista': [rng.choice(NOMES_PLANILHA) for _ in range(linhas)],
+                    'lucro': [lucro_de_planilha(rng) for _ in range(linhas)],
+                }, dtype=object))
+
+            with localcontext() as ctx:
+                ctx.prec = 20
+                ctx.rounding = ROUND_HALF_UP
+                totais = somar_lucro_por_artista(extratos, artistas)
+                for artista in artistas:
+                    esperado = soma_laco_original(extratos, artista)
+                    conferidos += 1
+                    if not mesma_representacao(totais[artista.id], esperado):
+                        print(f"❌ {artista.nome}: somar_lucro_por_artista {totais[artista.id]} ≠ laço {esperado}")
+                        divergencias += 1
+
+    print(f"Totais por artista conferidos com o laço original: {conferidos}")
+    return divergencias
+
+
+def main():
+    rng = random.Random(2026)
+    divergencias = verificar_unidades(rng) + verificar_somar_lucro(rng)
+    print("\n✅ Paridade exata." if not divergencias else f"\n❌ {divergencias} divergência(s).")
+    return 1 if divergencias else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
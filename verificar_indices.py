@@ -0,0 +1,88 @@
+# verificar_indices.py
+# Confere com EXPLAIN QUERY PLAN, num SQLite em memória criado a partir dos modelos, que as
+# consultas mais frequentes de pagamentos e cálculos usam os índices (migrações e5b9a3c7d1f2 e
+# b7f3d1a9c2e5).
+# Sai com código 1 se alguma passar a varrer a tabela inteira ou usar outro índice.
+import sys
+from datetime import date
+
+from sqlalchemy import create_engine, select
+
+from extensions import db
+from models import CalculoAssisaoSalvo, CalculoEspecialSalvo, CalculoSalvo, PagamentoRealizado
+from services.pagamentos_service import _pagamentos_unicos, condicoes_historico
+
+HOJE = date(2026, 10, 18)
+
+
+def consultas_esperadas():
+    """[(descrição, consulta, índices aceitos)]"""
+    p = PagamentoRealizado
+    consultas = [
+        ('varredura de agendados vencidos',
+         select(p.id).where(p.status == 'agendado', p.vencimento.is_not(None), p.vencimento <= HOJE),
+         {'ix_pagamento_realizado_status_vencimento'}),
+        ('duplicidade por artista e período',
+         select(p.id).where(p.artista_id == 1, p.tabela_artista == 'normal', p.mes == 1, p.ano == 2025,
+                            p.status == 'pago'),
+         {'ix_pagamento_realizado_artista_periodo'}),
+        ('histórico por status',
+         _pagamentos_unicos(condicoes_historico()).element,
+         {'ix_pagamento_realizado_status_vencimento'}),
+        ('histórico por janela de vencimento',
+         _pagamentos_unicos(condicoes_historico(vencimento_de=date(2025, 1, 1), vencimento_ate=HOJE)).element,
+         {'ix_pagamento_realizado_status_vencimento'}),
+        ('histórico da aba de pagamentos',
+         _pagamentos_unicos(condicoes_historico(tabelas=['normal', 'especial', 'assisao'])).element,
+         {'ix_pagamento_realizado_status_vencimento', 'ix_pagamento_realizado_tabela_artista'}),
+        ('pagamentos por tabela',
+         select(p.id).where(p.tabela_artista.in_(['esp', 'especial', 'ass', 'assisao'])),
+         {'ix_pagamento_realizado_tabela_artista'}),
+    ]
+    for modelo in (CalculoSalvo, CalculoEspecialSalvo, CalculoAssisaoSalvo):
+        tabela = modelo.__tablename__
+        consultas += [
+            (f'{tabela} por artista',
+             select(modelo.id).where(modelo.artista_id == 1).order_by(modelo.ano.desc(), modelo.mes.desc()),
+             {f'ix_{tabela}_artista_id_ano_mes'}),
+            (f'{tabela} por mês e ano',
+             select(modelo.id).where(modelo.mes == 1, modelo.ano == 2025),
+             {f'ix_{tabela}_ano_mes'}),
+            (f'{tabela} mais recentes (painel)',
+             select(modelo.id).where(modelo.data_calculo.is_not(None))
+             .order_by(modelo.data_calculo.desc(), modelo.id.desc()).limit(5),
+             {f'ix_{tabela}_data_calculo'}),
+        ]
+    return consultas
+
+
+def plano(conexao, consulta):
+    """Linhas de detalhe do EXPLAIN QUERY PLAN da consulta."""
+    compilada = consulta.compile(dialect=conexao.dialect, compile_kwargs={'render_postcompile': True})
+    parametros = compilada.construct_params()
+    posicionais = tuple(parametros[nome] for nome in compilada.positiontup)
+    linhas = conexao.exec_driver_sql(f'EXPLAIN QUERY PLAN {compilada}', posicionais).fetchall()
+    return [linha[-1] for linha in linhas]
+
+
+def main():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    falhas = 0
+
+    with engine.connect() as conexao:
+        for descricao, consulta, indices in consultas_esperadas():
+            detalhes = plano(conexao, consulta)
+            usado = next((indice for indice in indices for detalhe in detalhes if indice in detalhe.split()), None)
+            if usado:
+                print(f"✅ {descricao}: {usado}")
+            else:
+                falhas += 1
+                print(f"❌ {descricao}: {' | '.join(detalhes)}")
+
+    print("\n✅ Todas as consultas usam índice." if not falhas else f"\n❌ {falhas} consulta(s) sem o índice esperado.")
+    return 1 if falhas else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# worker_tarefas.py
+"""
+Worker da fila de tarefas (ver services/tarefas_service.py).
+
+Uso: python worker_tarefas.py [--processos N] [--intervalo SEGUNDOS]
+
+Cada processo reserva uma tarefa pendente por vez e reexecuta a rota correspondente.
+Rode uma única instância deste script: ao iniciar, ele marca como erro as tarefas que
+ficaram "executando" numa execução anterior interrompida (não são reexecutadas).
+"""
+import argparse
+import logging
+import multiprocessing
+import sys
+import time
+
+from app import app
+from services.tarefas_service import (
+    encerrar_tarefas_interrompidas,
+    executar_tarefa,
+    limpar_tarefas_antigas,
+    reservar_proxima_tarefa,
+)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+try:
+    sys.stdout.reconfigure(encoding='utf-8')
+except AttributeError:
+    pass
+
+
+def executar_fila(intervalo: float):
+    # O worker é interno: as requisições reexecutadas já passaram pelo CSRF na rota original
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    while True:
+        with app.app_context():
+            tarefa = reservar_proxima_tarefa()
+            if tarefa is None:
+                time.sleep(intervalo)
+                continue
+            logger.info(f"Executando tarefa {tarefa.id} ({tarefa.tipo})")
+            inicio = time.perf_counter()
+            executar_tarefa(app, tarefa)
+            logger.info(f"Tarefa {tarefa.id} finalizada em {time.perf_counter() - inicio:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker da fila de tarefas")
+    parser.add_argument('--processos', type=int, default=1, help="Quantidade de processos executando tarefas")
+    parser.add_argument('--intervalo', type=float, default=1.0, help="Espera entre consultas à fila vazia (s)")
+    args = parser.parse_args()
+
+    with app.app_context():
+        interrompidas = encerrar_tarefas_interrompidas()
+        removidas = limpar_tarefas_antigas()
+    logger.info(f"Tarefas interrompidas marcadas como erro: {interrompidas} | antigas removidas: {removidas}")
+
+    if args.processos <= 1:
+        executar_fila(args.intervalo)
+        return
+
+    processos = [
+        multiprocessing.Process(target=executar_fila, args=(args.intervalo,), name=f"worker-{i + 1}")
+        for i in range(args.processos)
+    ]
+    for processo in processos:
+        processo.start()
+    for processo in processos:
+        processo.join()
+
+
+if __name__ == "__main__":
+    main()